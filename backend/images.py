@@ -0,0 +1,328 @@
+"""
+Event image pipeline: each event image is downloaded once, resized into
+AVIF/WebP variants on disk and served from there. The disk cache is an LRU
+kept under a byte budget.
+"""
+import asyncio
+import io
+import ipaddress
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.request import url2pathname
+
+logger = logging.getLogger("lenvers")
+
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+PILLOW_FORMATS = {"avif": "AVIF", "webp": "WEBP"}
+EVENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+MAX_REDIRECTS = 5
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class ImageSourceRefused(ValueError):
+    pass
+
+
+class PinnedTransport:
+    """httpx transport connecting to the address _check_remote approved
+
+    A second DNS lookup at connection time could answer with a private
+    address. The Host header and the TLS server name stay those of the URL.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.pins = {}
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        if host not in self.pins:
+            raise ImageSourceRefused(f"Image host was not checked: {host}")
+        request.url = request.url.copy_with(host=self.pins[host])
+        request.extensions = {**request.extensions, "sni_hostname": host}
+        return await self.transport.handle_async_request(request)
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.transport.__aexit__(*args)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ImageCache:
+    def __init__(self, directory: str, widths: List[int], formats: List[str], quality: int,
+                 max_bytes: int, max_source_bytes: int, fetch_timeout: float, workers: int,
+                 local_root: Optional[str] = None, allowed_hosts: Optional[List[str]] = None,
+                 retry_base: float = 60.0, retry_max: float = 3600.0, allow_remote: bool = True):
+        self.directory = Path(directory)
+        # Local sources are only read below this directory, disabled when unset
+        self.local_root = Path(local_root).resolve() if local_root else None
+        # Remote sources are only fetched from these hosts, any public host when empty
+        self.allowed_hosts = {host.strip().lower() for host in allowed_hosts or [] if host.strip()}
+        # Off for offline runs, only local sources are read
+        self.allow_remote = allow_remote
+        self.widths = sorted(widths)
+        self.formats = [fmt for fmt in formats if fmt in MEDIA_TYPES]
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.max_source_bytes = max_source_bytes
+        self.fetch_timeout = fetch_timeout
+        self.workers = workers
+        # Failed sources are retried after retry_base seconds, doubling up to retry_max
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._failures = {}
+        self._scheduled = set()
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._locks = {}
+        self._semaphore = None
+        self._tasks = set()
+        self._loading = None
+        # httpx transport override, for tests
+        self.transport = None
+
+    def load(self):
+        # Rebuild the LRU index from disk, least recently written first
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if path.is_file() and not path.name.endswith(".tmp"):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path, stat.st_size))
+        self._files.clear()
+        self._bytes = 0
+        for _, path, size in sorted(entries):
+            self._files[path] = size
+            self._bytes += size
+        self._evict()
+
+    async def ensure_loaded(self):
+        # The disk scan runs once, on first use rather than at startup
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self.load))
+        await self._loading
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files), "bytes": self._bytes, "max_bytes": self.max_bytes,
+            "failing": len(self._failures),
+        }
+
+    def valid_event_id(self, event_id: str) -> bool:
+        return bool(EVENT_ID_PATTERN.match(event_id))
+
+    def pick_width(self, requested: int) -> int:
+        # Snap to a configured width so arbitrary sizes can't fill the cache
+        for width in self.widths:
+            if width >= requested:
+                return width
+        return self.widths[-1]
+
+    def pick_format(self, accept: str) -> str:
+        for fmt in self.formats:
+            if MEDIA_TYPES[fmt] in accept:
+                return fmt
+        return "webp" if "webp" in self.formats else self.formats[0]
+
+    def variant_path(self, event_id: str, width: int, fmt: str) -> Path:
+        return self.directory / event_id / f"{width}.{fmt}"
+
+    def lookup(self, event_id: str, width: int, fmt: str) -> Optional[Path]:
+        path = self.variant_path(event_id, width, fmt)
+        if path not in self._files:
+            return None
+        self._files.move_to_end(path)
+        return path
+
+    def failed_source(self, event_id: str) -> Optional[str]:
+        """The source URL of an event whose last attempt failed and isn't due for a retry"""
+        failure = self._failures.get(event_id)
+        if failure is None or failure[0] <= time.monotonic():
+            return None
+        return failure[2]
+
+    def schedule(self, event_id: str, url: str):
+        """Process an event image in the background, e.g. right after creation"""
+        if event_id in self._scheduled or self.failed_source(event_id) is not None:
+            return
+        self._scheduled.add(event_id)
+        task = asyncio.create_task(self._process_logged(event_id, url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._scheduled.discard(event_id))
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _process_logged(self, event_id: str, url: str):
+        try:
+            await self.process(event_id, url)
+        except Exception as e:
+            logger.warning("Image for event %s could not be processed: %s", event_id, e)
+
+    async def process(self, event_id: str, url: str):
+        await self.ensure_loaded()
+        # One pipeline run per event at a time, bounded across events. The lock
+        # is dropped with its last user, a woken waiter doesn't hold it yet
+        entry = self._locks.setdefault(event_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._process_locked(event_id, url)
+        except Exception:
+            self._record_failure(event_id, url)
+            raise
+        else:
+            self._failures.pop(event_id, None)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[event_id]
+
+    async def _process_locked(self, event_id: str, url: str):
+        missing = [
+            (width, fmt) for width in self.widths for fmt in self.formats
+            if self.variant_path(event_id, width, fmt) not in self._files
+        ]
+        if not missing:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        async with self._semaphore:
+            source = await self._fetch(url)
+            variants = await asyncio.to_thread(self._render, source, missing)
+        written = await asyncio.to_thread(self._write_files, event_id, variants)
+        # The LRU index is only touched from the event loop
+        for path, size in written:
+            self._bytes += size - self._files.pop(path, 0)
+            self._files[path] = size
+        self._evict()
+
+    def _record_failure(self, event_id: str, url: str):
+        previous = self._failures.get(event_id)
+        delay = min(self.retry_max, previous[1] * 2) if previous else self.retry_base
+        self._failures[event_id] = (time.monotonic() + delay, delay, url)
+
+    async def _fetch(self, url: str) -> bytes:
+        parsed = urlparse(url)
+        if parsed.scheme in ("", "file"):
+            # Local files, used for fixtures and pre-downloaded images
+            path = Path(url2pathname(parsed.path)).resolve()
+            if self.local_root is None or not path.is_relative_to(self.local_root):
+                raise ValueError(f"Local image outside of the allowed directory: {url}")
+            if path.stat().st_size > self.max_source_bytes:
+                raise ImageTooLarge(url)
+            return await asyncio.to_thread(path.read_bytes)
+        # Imported here, like Pillow, so the API starts without loading them
+        import httpx
+
+        chunks = []
+        size = 0
+        # Redirects are followed by hand so every hop goes through _check_remote,
+        # and each hop connects to the address that was checked
+        transport = PinnedTransport(self.transport or httpx.AsyncHTTPTransport())
+        async with httpx.AsyncClient(timeout=self.fetch_timeout, transport=transport) as http:
+            for _ in range(MAX_REDIRECTS + 1):
+                addresses = await self._check_remote(url)
+                transport.pins = {urlparse(url).hostname: addresses[0]}
+                async with http.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_source_bytes:
+                            raise ImageTooLarge(url)
+                        chunks.append(chunk)
+                return b"".join(chunks)
+        raise ImageSourceRefused(f"Too many redirects: {url}")
+
+    async def redirect_allowed(self, url: str) -> bool:
+        """Whether browsers may be sent to the source while its variants aren't ready"""
+        try:
+            await self._check_remote(url)
+        except (ImageSourceRefused, OSError):
+            return False
+        return True
+
+    async def _check_remote(self, url: str) -> List[str]:
+        # Event images come from public POST /api/events, never let them reach
+        # loopback, private or metadata addresses
+        if not self.allow_remote:
+            raise ImageSourceRefused(f"Remote images are disabled: {url}")
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ImageSourceRefused(f"Unsupported image URL: {url}")
+        host = parsed.hostname.lower()
+        if self.allowed_hosts and host not in self.allowed_hosts:
+            raise ImageSourceRefused(f"Image host not allowed: {host}")
+        addresses = await self._resolve(host, parsed.port or (443 if parsed.scheme == "https" else 80))
+        if not addresses:
+            raise ImageSourceRefused(f"Image host does not resolve: {host}")
+        for address in addresses:
+            if not ipaddress.ip_address(address.split("%")[0]).is_global:
+                raise ImageSourceRefused(f"Image host resolves to a non-public address: {host}")
+        return addresses
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port)
+        return [info[4][0] for info in infos]
+
+    def _render(self, source: bytes, variants: List[Tuple[int, str]]) -> Dict[Tuple[int, str], bytes]:
+        from PIL import Image, ImageOps
+
+        with Image.open(io.BytesIO(source)) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            resized = {}
+            rendered = {}
+            for width, fmt in variants:
+                if width not in resized:
+                    # Never upscale, small sources are only re-encoded
+                    if image.width > width:
+                        height = max(1, round(image.height * width / image.width))
+                        resized[width] = image.resize((width, height), Image.LANCZOS)
+                    else:
+                        resized[width] = image
+                buffer = io.BytesIO()
+                resized[width].save(buffer, PILLOW_FORMATS[fmt], quality=self.quality)
+                rendered[(width, fmt)] = buffer.getvalue()
+        return rendered
+
+    def _write_files(self, event_id: str, variants: Dict[Tuple[int, str], bytes]) -> List[Tuple[Path, int]]:
+        (self.directory / event_id).mkdir(parents=True, exist_ok=True)
+        written = []
+        for (width, fmt), data in variants.items():
+            path = self.variant_path(event_id, width, fmt)
+            temporary = path.with_name(path.name + ".tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+            written.append((path, len(data)))
+        return written
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._files:
+            path, size = self._files.popitem(last=False)
+            self._bytes -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
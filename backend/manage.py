@@ -0,0 +1,80 @@
+"""
+Maintenance commands for the L'envers API, run from the backend directory:
+
+    python manage.py rebuild-availability
+    python manage.py backfill-title-search
+    python manage.py migrate-datetimes
+    python manage.py rebuild-rollups
+    python manage.py archive
+    python manage.py setup
+"""
+import argparse
+import asyncio
+import logging
+
+import server
+
+
+async def rebuild_availability():
+    days = await server.rebuild_availability()
+    print(f"Availability rebuilt for {days} days")
+
+
+async def backfill_title_search():
+    events = await server.backfill_title_search()
+    print(f"Search titles backfilled for {events} events")
+
+
+async def migrate_datetimes():
+    report = await server.migrate_datetimes()
+    for collection, counts in report.items():
+        print(f"{collection}: {counts['migrated']} migrated, {counts['skipped']} skipped")
+
+
+async def rebuild_rollups():
+    report = await server.rebuild_rollups()
+    print(f"{report['rollups']} rollups rebuilt, {report['removed']} stale ones removed")
+
+
+async def archive():
+    if server.ARCHIVE_TARGET == "collection":
+        await server.archiver.create_collections()
+    moved = await server.archiver.run()
+    for collection, count in moved.items():
+        print(f"{collection}: {count} archived")
+
+
+async def setup():
+    # Indexes and sample events, for deployments running with LEAN_RUNTIME=true
+    await server.setup_database()
+    print("Database ready")
+
+
+COMMANDS = {
+    "rebuild-availability": rebuild_availability,
+    "backfill-title-search": backfill_title_search,
+    "migrate-datetimes": migrate_datetimes,
+    "rebuild-rollups": rebuild_rollups,
+    "archive": archive,
+    "setup": setup,
+}
+
+
+async def run(command):
+    server.open_database()
+    try:
+        await COMMANDS[command]()
+    finally:
+        server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="L'envers API maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.command))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,768 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime, date, time
+from starlette.datastructures import MutableHeaders
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from pydantic import AfterValidator, BaseModel, Field, ValidationError
+from typing import Annotated, Optional, List
+from contextlib import asynccontextmanager
+from pathlib import Path
+from dotenv import load_dotenv
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, InsertOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+import logging
 import uuid
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
+from images import ImageCache, MEDIA_TYPES
+import socket
 import asyncio
+from collections import OrderedDict, deque
+import base64
+import bisect
+import codecs
+import csv
+import io
+import gzip
+import hashlib
+import hmac
+import json
+import orjson
+import re
+import unicodedata
+from time import monotonic
+
+try:
+    import brotli
+except ImportError:
+    # Optional, responses fall back to gzip
+    brotli = None
+
+logger = logging.getLogger("lenvers")
+
+load_dotenv(Path(__file__).parent / '.env')
+
+# Metrics, rendered in the Prometheus text format on /api/metrics
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def format_labels(labels: dict) -> str:
+    escaped = (
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Metrics:
+    def __init__(self):
+        self.requests = {}
+        self.request_latency = {}
+        self.in_flight = 0
+        self.mongo_latency = {}
+        self.mongo_failures = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.request_latency.setdefault((method, route), Histogram()).observe(seconds)
+
+    def observe_mongo(self, collection: str, command: str, seconds: float, failed: bool = False):
+        self.mongo_latency.setdefault((collection, command), Histogram()).observe(seconds)
+        if failed:
+            self.mongo_failures[(collection, command)] = self.mongo_failures.get((collection, command), 0) + 1
+
+    def render_histogram(self, lines: List[str], name: str, label_names, histograms: dict):
+        lines.append(f"# TYPE {name} histogram")
+        for label_values, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+    def render(self, extra_gauges: dict) -> str:
+        lines = ["# TYPE lenvers_http_requests_total counter"]
+        for (method, route, status), count in sorted(self.requests.items()):
+            labels = format_labels({"method": method, "route": route, "status": status})
+            lines.append(f"lenvers_http_requests_total{labels} {count}")
+        self.render_histogram(lines, "lenvers_http_request_duration_seconds", ("method", "route"), self.request_latency)
+        lines.append("# TYPE lenvers_http_requests_in_flight gauge")
+        lines.append(f"lenvers_http_requests_in_flight {self.in_flight}")
+        self.render_histogram(lines, "lenvers_mongo_command_duration_seconds", ("collection", "command"), self.mongo_latency)
+        lines.append("# TYPE lenvers_mongo_command_failures_total counter")
+        for (collection, command), count in sorted(self.mongo_failures.items()):
+            lines.append(f"lenvers_mongo_command_failures_total{format_labels({'collection': collection, 'command': command})} {count}")
+        for name, value in extra_gauges.items():
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    # Called from the driver's threads, started/succeeded are paired by request id
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore carries the cursor id first and the collection separately
+            target = event.command.get("collection", "-")
+        self._pending[(event.connection_id, event.request_id)] = target
+
+    def succeeded(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        metrics.observe_mongo(collection, event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        metrics.observe_mongo(collection, event.command_name, event.duration_micros / 1e6, failed=True)
+
+class MongoPoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.cleared = 0
+        self.options = {}
+
+    def pool_created(self, event):
+        # Non-default pool options such as maxPoolSize, as seen by the driver
+        self.options = dict(event.options)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def stats(self) -> dict:
+        return {
+            "open": self.open,
+            "in_use": self.checked_out,
+            "available": self.open - self.checked_out,
+            "checkout_failures": self.checkout_failures,
+            "cleared": self.cleared,
+            "options": self.options,
+        }
+
+mongo_pool_stats = MongoPoolStats()
 
 # Database setup
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.lenvers_db
+MONGO_DB_NAME = os.environ.get('DB_NAME', 'lenvers_db')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zlib')
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+# Without fail-fast the API starts while Mongo is down, skipping database
+# setup until the next start or `python manage.py setup`
+MONGO_FAIL_FAST = os.environ.get('MONGO_FAIL_FAST', 'true').lower() == 'true'
+
+# Created per process in the app lifespan, never at import time
+client = None
+db = None
+
+def open_database():
+    global client, db
+    client = create_mongo_client()
+    db = client[MONGO_DB_NAME]
+
+def create_mongo_client():
+    options = dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        readPreference=MONGO_READ_PREFERENCE,
+        appname="lenvers-api",
+        event_listeners=[MongoCommandMetrics(), mongo_pool_stats],
+    )
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return AsyncIOMotorClient(MONGO_URL, **options)
+
+async def warm_up_pool():
+    # Concurrent pings open min pool size connections before the first request
+    started = monotonic()
+    await asyncio.gather(*[client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))])
+    logger.info("Mongo pool warmed up in %.1f ms", (monotonic() - started) * 1000)
+
+@asynccontextmanager
+async def lifespan(app):
+    open_database()
+    database_ready = True
+    try:
+        await warm_up_pool()
+    except Exception as e:
+        logger.error("Mongo is unreachable at startup: %s", e)
+        if MONGO_FAIL_FAST:
+            client.close()
+            raise
+        database_ready = False
+    await startup_event(database_ready)
+    try:
+        yield
+    finally:
+        await shutdown_event()
+        try:
+            client.close()
+        except Exception as e:
+            logger.error("Mongo client could not be closed: %s", e)
+
+# Events cache settings
+EVENTS_CACHE_TTL = float(os.environ.get('EVENTS_CACHE_TTL', '60'))
+EVENTS_CACHE_CONTROL = os.environ.get('EVENTS_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+EVENTS_CACHE_MAX_ENTRIES = int(os.environ.get('EVENTS_CACHE_MAX_ENTRIES', '256'))
+HOMEPAGE_EVENTS_LIMIT = int(os.environ.get('HOMEPAGE_EVENTS_LIMIT', '6'))
+
+# Dates and times are entered in the venue's local time and stored in UTC
+VENUE_TIMEZONE = os.environ.get('VENUE_TIMEZONE', 'Europe/Paris')
+VENUE_ZONE = ZoneInfo(VENUE_TIMEZONE)
+
+# Reservation capacity settings
+SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', '60'))
+SLOT_MINUTES = int(os.environ.get('SLOT_MINUTES', '30'))
+SLOT_ALTERNATIVES = int(os.environ.get('SLOT_ALTERNATIVES', '3'))
+SLOT_OPENING = os.environ.get('SLOT_OPENING', '17:00')
+SLOT_CLOSING = os.environ.get('SLOT_CLOSING', '22:00')
+AVAILABILITY_MAX_DAYS = int(os.environ.get('AVAILABILITY_MAX_DAYS', '62'))
+
+# Reporting settings
+REPORT_MAX_DAYS = int(os.environ.get('REPORT_MAX_DAYS', '366'))
+REPORT_MAX_WEEKS = int(os.environ.get('REPORT_MAX_WEEKS', '104'))
+
+# Outbound mail settings, sending is disabled while SMTP_HOST is empty
+SMTP_HOST = os.environ.get('SMTP_HOST', '')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USER = os.environ.get('SMTP_USER', '')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '10'))
+MAIL_FROM = os.environ.get('MAIL_FROM', "L'envers <contact@lenvers.fr>")
+CONTACT_NOTIFY_EMAIL = os.environ.get('CONTACT_NOTIFY_EMAIL', '')
+MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', '2'))
+MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', '1000'))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', '5'))
+MAIL_RETRY_BASE = float(os.environ.get('MAIL_RETRY_BASE', '30'))
+MAIL_POLL_INTERVAL = float(os.environ.get('MAIL_POLL_INTERVAL', '15'))
+MAIL_SENDING_LEASE = float(os.environ.get('MAIL_SENDING_LEASE', '300'))
+MAIL_SMTP_IDLE = float(os.environ.get('MAIL_SMTP_IDLE', '60'))
+# Sent mails are dropped by a TTL index after this many days, 0 keeps them
+MAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('MAIL_OUTBOX_RETENTION_DAYS', '30'))
+
+# Archival settings, off by default. ARCHIVE_TARGET is "collection" (zstd
+# compressed *_archive collections) or "files" (NDJSON.gz under ARCHIVE_DIR).
+ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+ARCHIVE_TARGET = os.environ.get('ARCHIVE_TARGET', 'collection')
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', str(Path(__file__).parent / 'archive'))
+ARCHIVE_COMPRESSOR = os.environ.get('ARCHIVE_COMPRESSOR', 'zstd')
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_RESERVATIONS_AFTER_DAYS = int(os.environ.get('ARCHIVE_RESERVATIONS_AFTER_DAYS', '180'))
+ARCHIVE_CONTACT_AFTER_DAYS = int(os.environ.get('ARCHIVE_CONTACT_AFTER_DAYS', '30'))
+ARCHIVE_CONTACT_STATUSES = os.environ.get('ARCHIVE_CONTACT_STATUSES', 'read,answered').split(',')
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_MAX_BATCHES = int(os.environ.get('ARCHIVE_MAX_BATCHES', '100'))
+ARCHIVE_PAUSE = float(os.environ.get('ARCHIVE_PAUSE', '0.5'))
+# Archived documents expire after this many days, 0 keeps them forever
+ARCHIVE_TTL_DAYS = int(os.environ.get('ARCHIVE_TTL_DAYS', '0'))
+
+# Write-behind settings for newsletter and contact submissions, off by default.
+# With a spool path every accepted submission is appended to that file first,
+# so a crash before the flush doesn't lose it.
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500'))
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', '1'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '20000'))
+WRITE_BEHIND_SPOOL = os.environ.get('WRITE_BEHIND_SPOOL', '')
+WRITE_BEHIND_FSYNC = os.environ.get('WRITE_BEHIND_FSYNC', 'false').lower() == 'true'
+
+# Bulk import settings
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '1000'))
+BULK_MAX_ERRORS = int(os.environ.get('BULK_MAX_ERRORS', '1000'))
+# Upper bounds per import request, the routes are public
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '10000'))
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Export settings
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+# Staff access, a shared secret sent in X-Staff-Token. Routes over private
+# data (contact messages and their search, subscribers, live reservations)
+# stay closed while it is unset.
+STAFF_TOKEN = os.environ.get('STAFF_TOKEN', '')
+
+# Event image settings
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', str(Path(__file__).parent / 'image_cache'))
+IMAGE_WIDTHS = [int(width) for width in os.environ.get('IMAGE_WIDTHS', '480,960,1600').split(',')]
+IMAGE_FORMATS = os.environ.get('IMAGE_FORMATS', 'avif,webp').split(',')
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '70'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get('IMAGE_MAX_SOURCE_BYTES', str(25 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '15'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+IMAGE_LOCAL_ROOT = os.environ.get('IMAGE_LOCAL_ROOT', '')
+# Hosts remote event images may be fetched from, empty allows any public address
+IMAGE_ALLOWED_HOSTS = os.environ.get('IMAGE_ALLOWED_HOSTS', 'images.unsplash.com').split(',')
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Redirects to the original while variants are missing, short so clients come back for them
+IMAGE_FALLBACK_CACHE_CONTROL = f"public, max-age={int(os.environ.get('IMAGE_FALLBACK_MAX_AGE', '60'))}"
+# A source that failed is retried after IMAGE_RETRY_BASE seconds, doubling up to IMAGE_RETRY_MAX
+IMAGE_RETRY_BASE = float(os.environ.get('IMAGE_RETRY_BASE', '60'))
+IMAGE_RETRY_MAX = float(os.environ.get('IMAGE_RETRY_MAX', '3600'))
+
+# Live update settings, change streams need a replica set
+LIVE_UPDATES_ENABLED = os.environ.get('LIVE_UPDATES_ENABLED', 'true').lower() == 'true'
+LIVE_COLLECTIONS = ("reservations", "contact_messages", "events")
+# Streamed to anyone; the other feeds carry personal data and need staff access
+LIVE_PUBLIC_COLLECTIONS = {"events"}
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '100'))
+LIVE_REPLAY_SIZE = int(os.environ.get('LIVE_REPLAY_SIZE', '500'))
+LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', '15'))
+LIVE_RETRY_DELAY = float(os.environ.get('LIVE_RETRY_DELAY', '5'))
+
+# Search settings
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '500'))
+AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', '10'))
+
+# Idempotency settings
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+# In-flight claims expire quickly so a crashed worker doesn't block its key for a day
+IDEMPOTENCY_CLAIM_TTL = int(os.environ.get('IDEMPOTENCY_CLAIM_TTL', '60'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '1000'))
+IDEMPOTENT_ROUTES = {"/api/reservations", "/api/contact", "/api/events"}
+
+# Rate limiting settings
+# RATE_LIMITS is a comma separated list of path:key:burst/period, key being ip or email
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_SHARDS = int(os.environ.get('RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+# Client addresses come from uvicorn, which only honours X-Forwarded-For from
+# FORWARDED_ALLOW_IPS. Reading the raw header lets any client pick its bucket,
+# only enable it behind a proxy that overwrites the header.
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+RATE_LIMITS = os.environ.get('RATE_LIMITS', ",".join([
+    "/api/reservations:ip:10/60",
+    "/api/reservations:email:5/600",
+    "/api/contact:ip:5/60",
+    "/api/contact:email:3/600",
+    "/api/newsletter/subscribe:ip:10/60",
+    "/api/newsletter/subscribe:email:3/600",
+    "/api/events/bulk:ip:2/60",
+    "/api/newsletter/bulk:ip:2/60",
+]))
+
+# Server settings, WEB_CONCURRENCY worker processes share one database
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8001'))
+SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', '1'))
+SHUTDOWN_TIMEOUT = float(os.environ.get('SHUTDOWN_TIMEOUT', '30'))
+# Proxies whose X-Forwarded-For sets the client address, as uvicorn's --forwarded-allow-ips
+FORWARDED_ALLOW_IPS = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+STARTUP_LEASE_TTL = float(os.environ.get('STARTUP_LEASE_TTL', '300'))
+# Lean runtime: skip index setup and seeding at startup, run
+# `python manage.py setup` once per deployment instead
+LEAN_RUNTIME = os.environ.get('LEAN_RUNTIME', 'false').lower() == 'true'
+SEED_SAMPLE_EVENTS = os.environ.get('SEED_SAMPLE_EVENTS', 'true').lower() == 'true'
+
+# Compression settings, only buffered responses with a Content-Length are compressed
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_TYPES = set(os.environ.get('COMPRESSION_TYPES', 'application/json,text/plain,text/csv').split(','))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+COMPRESSION_CACHE_ENTRIES = int(os.environ.get('COMPRESSION_CACHE_ENTRIES', '128'))
+COMPRESSION_CACHE_BYTES = int(os.environ.get('COMPRESSION_CACHE_BYTES', str(16 * 1024 * 1024)))
+
+# orjson for every JSON response, handlers with a response_model skip jsonable_encoder
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Idempotency keys
+# Completed responses live in db.idempotency_keys (expired by a TTL index) with
+# an in-process LRU in front, so replays usually never reach Mongo.
+class IdempotencyStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._recent = OrderedDict()
+
+    def _remember(self, key: str, record: dict):
+        self._recent[key] = record
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        record = self._recent.get(key)
+        if record is not None:
+            if as_utc(record["expires_at"]) > utcnow():
+                self._recent.move_to_end(key)
+                return record
+            del self._recent[key]
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if record is None:
+            return None
+        if record["status"] == "completed":
+            self._remember(key, record)
+        elif as_utc(record["expires_at"]) <= utcnow():
+            # An abandoned claim the TTL monitor hasn't removed yet
+            return None
+        return record
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        now = utcnow()
+        claim = {
+            "status": "in_progress",
+            "fingerprint": fingerprint,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_CLAIM_TTL)
+        }
+        try:
+            await db.idempotency_keys.insert_one({"_id": key, **claim})
+            return True
+        except DuplicateKeyError:
+            # Take over a claim whose lease ran out, e.g. its worker crashed
+            result = await db.idempotency_keys.update_one(
+                {"_id": key, "status": "in_progress", "expires_at": {"$lte": now}},
+                {"$set": claim}
+            )
+            return result.modified_count == 1
+
+    async def complete(self, key: str, fingerprint: str, status_code: int, body: bytes, media_type: str):
+        record = {
+            "_id": key,
+            "status": "completed",
+            "fingerprint": fingerprint,
+            "status_code": status_code,
+            "body": body,
+            "media_type": media_type,
+            "expires_at": utcnow() + timedelta(seconds=IDEMPOTENCY_TTL)
+        }
+        await db.idempotency_keys.replace_one({"_id": key}, record, upsert=True)
+        self._remember(key, record)
+
+    async def release(self, key: str):
+        await db.idempotency_keys.delete_one({"_id": key, "status": "in_progress"})
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE)
+
+def replay_response(record: dict) -> Response:
+    return Response(
+        content=record["body"],
+        status_code=record["status_code"],
+        media_type=record["media_type"],
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+@app.middleware("http")
+async def handle_idempotency_key(request: Request, call_next):
+    idempotency_key = request.headers.get("idempotency-key")
+    if request.method != "POST" or not idempotency_key or request.url.path not in IDEMPOTENT_ROUTES:
+        return await call_next(request)
+    if len(idempotency_key) > 255:
+        return Response(status_code=400, content="Idempotency-Key trop long")
+    key = f"{request.url.path}:{idempotency_key}"
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+    record = await idempotency_store.get(key)
+    if record is None and not await idempotency_store.claim(key, fingerprint):
+        # Lost the race against a concurrent request with the same key
+        record = await idempotency_store.get(key)
+    if record is not None:
+        if record["fingerprint"] != fingerprint:
+            return Response(status_code=422, content="Idempotency-Key déjà utilisée pour une autre requête")
+        if record["status"] != "completed":
+            return Response(status_code=409, content="Requête déjà en cours de traitement", headers={"Retry-After": "1"})
+        return replay_response(record)
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        await idempotency_store.release(key)
+        raise
+    if response.status_code >= 500:
+        # Server errors are not final, let the client retry with the same key
+        await idempotency_store.release(key)
+    else:
+        await idempotency_store.complete(key, fingerprint, response.status_code, body, response.headers.get("content-type"))
+    return Response(content=body, status_code=response.status_code, headers=dict(response.headers))
+
+# Rate limiting
+# Token buckets per (route, client ip or submitted email). The default store
+# lives in process; the Mongo store shares buckets between workers.
+def parse_rate_limits(spec: str) -> dict:
+    rules = {}
+    for rule in filter(None, (part.strip() for part in spec.split(","))):
+        path, key_kind, limit = rule.rsplit(":", 2)
+        burst, period = limit.split("/")
+        rules.setdefault(path, []).append((key_kind, int(burst), float(period)))
+    return rules
+
+class MemoryBucketStore:
+    def __init__(self, shards: int, max_keys: int):
+        self.shards = [OrderedDict() for _ in range(shards)]
+        self.max_keys_per_shard = max(1, max_keys // shards)
+
+    async def take(self, key: str, burst: int, period: float):
+        # Runs without awaiting, so each take is atomic on the event loop
+        shard = self.shards[hash(key) % len(self.shards)]
+        rate = burst / period
+        now = monotonic()
+        tokens, updated_at = shard.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        shard[key] = (tokens, now)
+        if len(shard) > self.max_keys_per_shard:
+            # Least recently seen buckets are the most likely to be full again
+            shard.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+class MongoBucketStore:
+    async def take(self, key: str, burst: int, period: float):
+        # One atomic pipeline update, timed with the server clock shared by all workers
+        rate = burst / period
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        pipeline = [
+            {"$set": {
+                "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]},
+                "updated_at": "$$NOW"
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": {"$add": ["$$NOW", int(period * 1000)]}
+            }},
+        ]
+        for attempt in range(2):
+            try:
+                bucket = await db.rate_limits.find_one_and_update(
+                    {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # Two workers created the same bucket, the retry updates it
+                if attempt:
+                    raise
+        return bucket["allowed"], 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+class RateLimiter:
+    def __init__(self, rules: dict, store):
+        self.rules = rules
+        self.store = store
+        self.rejected = 0
+
+    def client_ip(self, request: Request) -> str:
+        if RATE_LIMIT_TRUST_PROXY:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    async def check(self, request: Request) -> float:
+        # Returns 0 when allowed, otherwise the seconds to wait
+        email = None
+        for key_kind, burst, period in self.rules[request.url.path]:
+            if key_kind == "email":
+                if email is None:
+                    try:
+                        email = str(json.loads(await request.body()).get("email", "")).strip().lower()
+                    except (ValueError, AttributeError):
+                        email = ""
+                if not email:
+                    continue
+                identity = email
+            else:
+                identity = self.client_ip(request)
+            allowed, retry_after = await self.store.take(f"{request.url.path}|{key_kind}|{identity}", burst, period)
+            if not allowed:
+                self.rejected += 1
+                return retry_after
+        return 0.0
+
+def create_rate_limit_store():
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoBucketStore()
+    return MemoryBucketStore(RATE_LIMIT_SHARDS, RATE_LIMIT_MAX_KEYS)
+
+rate_limiter = RateLimiter(parse_rate_limits(RATE_LIMITS), create_rate_limit_store())
+
+RATE_LIMITED_BODY = orjson.dumps({"detail": "Trop de requêtes, veuillez réessayer dans quelques instants."})
+
+@app.middleware("http")
+async def enforce_rate_limits(request: Request, call_next):
+    if not RATE_LIMIT_ENABLED or request.method != "POST" or request.url.path not in rate_limiter.rules:
+        return await call_next(request)
+    retry_after = await rate_limiter.check(request)
+    if retry_after:
+        return Response(
+            content=RATE_LIMITED_BODY,
+            status_code=429,
+            media_type="application/json",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+    return await call_next(request)
 
-app = FastAPI()
+# Response compression
+# gzip or brotli, negotiated from Accept-Encoding. Responses carrying an ETag
+# (the events list, the homepage snapshot) are hashes of their payload, so
+# their compressed bodies are cached under that tag and compressed once.
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class CompressionCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def compress(self, etag: str, encoding: str, body: bytes) -> bytes:
+        key = (etag, encoding)
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return compressed
+        self.misses += 1
+        compressed = compress(body, encoding)
+        if self.max_entries and len(compressed) <= self.max_bytes:
+            self._entries[key] = compressed
+            self._bytes += len(compressed)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= len(self._entries.popitem(last=False)[1])
+        return compressed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+compression_cache = CompressionCache(COMPRESSION_CACHE_ENTRIES, COMPRESSION_CACHE_BYTES)
+
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    response = await call_next(request)
+    if not COMPRESSION_ENABLED:
+        return response
+    etag = response.headers.get("etag")
+    if response.status_code == 304:
+        # Keep the tag clients got with the compressed body
+        if etag and not etag.startswith("W/") and negotiate_encoding(request.headers.get("accept-encoding", "")):
+            response.headers["ETag"] = f"W/{etag}"
+        return response
+    # Streams (exports, live updates, images) carry no Content-Length and pass through
+    length = response.headers.get("content-length")
+    media_type = response.headers.get("content-type", "").split(";")[0].strip()
+    if length is None or media_type not in COMPRESSION_TYPES or "content-encoding" in response.headers:
+        return response
+    response.headers.add_vary_header("Accept-Encoding")
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None or int(length) < COMPRESSION_MIN_SIZE:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    compressed = compression_cache.compress(etag, encoding, body) if etag else compress(body, encoding)
+    headers = MutableHeaders(raw=[(key, value) for key, value in response.raw_headers if key != b"content-length"])
+    headers["Content-Encoding"] = encoding
+    if etag and not etag.startswith("W/"):
+        # The bytes differ per encoding, a weak tag still validates If-None-Match
+        headers["ETag"] = f"W/{etag}"
+    return Response(content=compressed, status_code=response.status_code, headers=headers)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.in_flight += 1
+    started = monotonic()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.in_flight -= 1
+        # Label by route template so path parameters don't explode cardinality
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
+        elif request.url.path in rate_limiter.rules or request.url.path in IDEMPOTENT_ROUTES:
+            # 429s and idempotent replays are answered before routing, these paths are fixed
+            path = request.url.path
+        else:
+            path = "unmatched"
+        metrics.observe_request(request.method, path, status, monotonic() - started)
 
 # CORS configuration
+# Added last so it wraps every middleware above: the 429s, idempotent
+# replays and 409/422 key conflicts they answer with carry CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,22 +771,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Dates and times
+# Mongo stores datetimes as UTC and hands them back naive, they are
+# serialized with an explicit Z so clients never guess the zone.
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def venue_today() -> date:
+    # "Today" is the venue's calendar day, whatever the server's zone
+    return datetime.now(VENUE_ZONE).date()
+
+def local_datetime(day: str, at: str) -> datetime:
+    # Wall-clock date and time at the venue, as UTC
+    naive = datetime.strptime(f"{day} {at}", "%Y-%m-%d %H:%M")
+    return naive.replace(tzinfo=VENUE_ZONE).astimezone(timezone.utc)
+
+def check_date(value: str) -> str:
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+def check_time(value: str) -> str:
+    datetime.strptime(value, "%H:%M")
+    return value
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+LocalDate = Annotated[str, Field(pattern=r"^\d{4}-\d{2}-\d{2}$"), AfterValidator(check_date)]
+LocalTime = Annotated[str, Field(pattern=r"^\d{2}:\d{2}$"), AfterValidator(check_time)]
+UTCDateTime = Annotated[datetime, AfterValidator(as_utc)]
+
 # Pydantic models
 class ReservationRequest(BaseModel):
     name: str
     email: str
     phone: str
-    date: str
-    time: str
-    party_size: int
+    date: LocalDate
+    time: LocalTime
+    party_size: int = Field(..., ge=1)
     special_requests: Optional[str] = None
 
 class EventModel(BaseModel):
     id: Optional[str] = None
     title: str
     description: str
-    date: str
-    time: str
+    date: LocalDate
+    time: LocalTime
     image_url: Optional[str] = None
     price: Optional[str] = "Entrée libre"
     category: str
@@ -57,32 +833,1548 @@ class ContactMessage(BaseModel):
     subject: str
     message: str
 
+# Response models, list items are partial when a fields= projection is used
+class ReservationOut(BaseModel):
+    id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    party_size: Optional[int] = None
+    special_requests: Optional[str] = None
+    status: Optional[str] = None
+    start_at: Optional[UTCDateTime] = None
+    created_at: Optional[UTCDateTime] = None
+
+class EventOut(BaseModel):
+    id: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    image_url: Optional[str] = None
+    price: Optional[str] = None
+    category: Optional[str] = None
+    start_at: Optional[UTCDateTime] = None
+    created_at: Optional[UTCDateTime] = None
+
+class ContactMessageOut(BaseModel):
+    id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    subject: Optional[str] = None
+    message: Optional[str] = None
+    status: Optional[str] = None
+    sent_at: Optional[UTCDateTime] = None
+    score: Optional[float] = None
+
+class EventSearchHit(EventOut):
+    score: Optional[float] = None
+
+class EventSearchResults(BaseModel):
+    events: List[EventSearchHit]
+    next_offset: Optional[int] = None
+
+class ContactSearchResults(BaseModel):
+    messages: List[ContactMessageOut]
+    next_offset: Optional[int] = None
+
+class TitleSuggestion(BaseModel):
+    id: str
+    title: str
+
+class HomepageEvents(BaseModel):
+    events: List[EventOut]
+    generated_at: UTCDateTime
+
+class ReservationList(BaseModel):
+    reservations: List[ReservationOut]
+    next_cursor: Optional[str] = None
+
+class EventList(BaseModel):
+    events: List[EventOut]
+    next_cursor: Optional[str] = None
+
+class MessageResponse(BaseModel):
+    success: bool
+    message: str
+
+class ReservationCreated(MessageResponse):
+    reservation_id: str
+
+class EventCreated(BaseModel):
+    success: bool
+    event: EventOut
+
+# In-memory cache
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            # Drop the oldest entry, dicts keep insertion order
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (monotonic() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "ttl": self.ttl}
+
+events_cache = TTLCache(EVENTS_CACHE_TTL, EVENTS_CACHE_MAX_ENTRIES)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def cached_json_response(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Homepage snapshot
+# The landing page payload, upcoming events in start order, is serialized once
+# and served from memory. It is rebuilt on the first read after an events
+# change or once its first event has started, and at least every
+# EVENTS_CACHE_TTL seconds to pick up writes this worker didn't see.
+HOMEPAGE_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "description": 1, "date": 1, "time": 1,
+    "start_at": 1, "image_url": 1, "price": 1, "category": 1,
+}
+
+class HomepageSnapshot:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.body = None
+        self.etag = None
+        self.expires_at = None
+        self.generation = 0
+        self.rebuilds = 0
+        self._lock = None
+
+    def invalidate(self):
+        self.generation += 1
+        self.body = None
+
+    def stats(self):
+        return {"rebuilds": self.rebuilds, "expires_at": self.expires_at.isoformat() if self.body else None}
+
+    def fresh(self) -> bool:
+        return self.body is not None and utcnow() < self.expires_at
+
+    async def get(self):
+        if not self.fresh():
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            # Concurrent readers wait for a single rebuild
+            async with self._lock:
+                if not self.fresh():
+                    await self._rebuild()
+        return self.body, self.etag
+
+    async def _rebuild(self):
+        generation = self.generation
+        now = utcnow()
+        events = await db.events.find({"start_at": {"$gte": now}}, HOMEPAGE_PROJECTION).sort(
+            [("start_at", 1), ("id", 1)]
+        ).limit(self.limit).to_list(self.limit)
+        body = orjson.dumps({"events": events, "generated_at": now}, option=ORJSON_OPTIONS)
+        expires_at = now + timedelta(seconds=EVENTS_CACHE_TTL)
+        if events:
+            expires_at = min(expires_at, as_utc(events[0]["start_at"]))
+        if generation != self.generation:
+            # Events changed while querying, serve this once and rebuild next time
+            expires_at = now
+        self.body, self.etag, self.expires_at = body, '"%s"' % hashlib.sha1(body).hexdigest(), expires_at
+        self.rebuilds += 1
+
+homepage = HomepageSnapshot(HOMEPAGE_EVENTS_LIMIT)
+
+def events_changed():
+    events_cache.invalidate()
+    homepage.invalidate()
+
+# Keyset pagination on (created_at, id)
+def encode_cursor(doc: dict) -> str:
+    created_at = doc.get("created_at")
+    raw = json.dumps([created_at.isoformat() if created_at else None, doc.get("id")]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at) if created_at else None, doc_id
+    except Exception:
+        # A malformed query parameter, like the ones FastAPI rejects itself
+        raise HTTPException(status_code=422, detail="Curseur de pagination invalide")
+
+def keyset_query(filters: dict, after: Optional[tuple], descending: bool) -> dict:
+    if not after:
+        return filters
+    created_at, doc_id = after
+    op = "$lt" if descending else "$gt"
+    after = {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "id": {op: doc_id}},
+    ]}
+    return {"$and": [filters, after]} if filters else after
+
+async def fetch_page(collection, filters: dict, after: Optional[tuple], limit: int, descending: bool,
+                     projection: Optional[dict] = None):
+    direction = -1 if descending else 1
+    query = keyset_query(filters, after, descending)
+    # Fetch one extra document to know whether another page exists
+    docs = await collection.find(query, projection or {"_id": 0}).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+def parse_fields(fields: Optional[str], model) -> Optional[dict]:
+    # fields=title,date -> Mongo projection; id and created_at stay for the cursor
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(sorted(unknown))}")
+    return {"_id": 0, "id": 1, "created_at": 1, **{name: 1 for name in requested}}
+
+def date_range_filter(date_from: Optional[str], date_to: Optional[str]) -> dict:
+    # Dates are stored as YYYY-MM-DD strings, so lexical order is chronological
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from
+    if date_to:
+        date_range["$lte"] = date_to
+    return {"date": date_range} if date_range else {}
+
+# Full-text search
+# Text indexes use French stemming and are diacritic-insensitive. The score
+# can't be range-queried, so search pages use a bounded offset rather than the
+# keyset cursor used by the list endpoints.
+def fold_text(value: str) -> str:
+    # "Soirée Électro" -> "soiree electro", stored for prefix lookups
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+async def text_search(collection, query: str, filters: dict, offset: int, limit: int, projection: dict):
+    if offset + limit > SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Seuls les {SEARCH_MAX_RESULTS} premiers résultats sont accessibles")
+    score = {"$meta": "textScore"}
+    docs = await collection.find(
+        {"$text": {"$search": query, "$language": "french"}, **filters},
+        {**projection, "score": score}
+    ).sort([("score", score), ("id", 1)]).skip(offset).limit(limit + 1).to_list(limit + 1)
+    next_offset = offset + limit if len(docs) > limit else None
+    return docs[:limit], next_offset
+
+async def backfill_title_search() -> int:
+    # Events created before autocomplete existed have no folded title
+    updated = 0
+    batch = []
+    async for event in db.events.find({"title_search": {"$exists": False}}, {"_id": 1, "title": 1}):
+        batch.append(UpdateOne({"_id": event["_id"]}, {"$set": {"title_search": fold_text(event.get("title") or "")}}))
+        if len(batch) >= BULK_BATCH_SIZE:
+            updated += (await db.events.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.events.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+# collection -> timestamp fields once stored as strings, whether it gets start_at
+DATETIME_MIGRATIONS = {
+    "reservations": (("created_at",), True),
+    "events": (("created_at",), True),
+    "contact_messages": (("sent_at",), False),
+}
+
+def migrated_datetimes(doc: dict, fields=("created_at",), with_start_at: bool = True) -> dict:
+    # Legacy strings are naive server-local times from datetime.now(), astimezone
+    # reads a naive value in the server's zone, whatever VENUE_ZONE is
+    update = {}
+    for field in fields:
+        value = doc.get(field)
+        if isinstance(value, str):
+            update[field] = datetime.fromisoformat(value).astimezone(timezone.utc)
+    if with_start_at and "start_at" not in doc:
+        update["start_at"] = local_datetime(check_date(doc["date"]), check_time(doc["time"]))
+    return update
+
+async def migrate_datetimes() -> dict:
+    """Convert string timestamps, and add start_at on reservations and events"""
+    report = {}
+    for collection_name, (fields, with_start_at) in DATETIME_MIGRATIONS.items():
+        collection = db[collection_name]
+        migrated, skipped, batch = 0, 0, []
+        legacy = [{field: {"$type": "string"}} for field in fields]
+        projection = {"_id": 1, "id": 1, **{field: 1 for field in fields}}
+        if with_start_at:
+            legacy.append({"start_at": {"$exists": False}})
+            projection.update({"date": 1, "time": 1, "start_at": 1})
+        async for doc in collection.find({"$or": legacy}, projection):
+            try:
+                update = migrated_datetimes(doc, fields, with_start_at)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Cannot migrate %s %s: %s", collection.name, doc.get("id"), e)
+                skipped += 1
+                continue
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+            if len(batch) >= BULK_BATCH_SIZE:
+                migrated += (await collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            migrated += (await collection.bulk_write(batch, ordered=False)).modified_count
+        report[collection.name] = {"migrated": migrated, "skipped": skipped}
+    return report
+
+# Index definitions per collection: (keys, options)
+INDEXES = {
+    "reservations": [
+        ([("id", 1)], {"unique": True}),
+        ([("date", 1), ("time", 1)], {}),
+        # Compound indexes follow equality, sort, range order for the list filters
+        ([("created_at", -1), ("id", -1)], {}),
+        ([("status", 1), ("created_at", -1), ("id", -1), ("date", 1)], {}),
+        ([("status", 1), ("start_at", 1)], {}),
+    ],
+    "events": [
+        ([("id", 1)], {"unique": True}),
+        ([("date", 1)], {}),
+        ([("category", 1), ("date", 1)], {}),
+        ([("created_at", 1), ("id", 1)], {}),
+        ([("category", 1), ("created_at", 1), ("id", 1), ("date", 1)], {}),
+        ([("title", "text"), ("description", "text")], {
+            "name": "events_text", "default_language": "french", "weights": {"title": 5, "description": 1}
+        }),
+        ([("title_search", 1)], {}),
+        ([("start_at", 1), ("id", 1)], {}),
+        ([("category", 1), ("start_at", 1), ("id", 1)], {}),
+    ],
+    "newsletter": [
+        ([("email", 1)], {"unique": True}),
+        ([("id", 1)], {"unique": True}),
+    ],
+    "contact_messages": [
+        ([("id", 1)], {"unique": True}),
+        ([("status", 1), ("sent_at", -1)], {}),
+        ([("subject", "text"), ("message", "text"), ("name", "text")], {
+            "name": "contact_messages_text", "default_language": "french",
+            "weights": {"subject": 5, "name": 3, "message": 1}
+        }),
+    ],
+    "idempotency_keys": [
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "rate_limits": [
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "mail_outbox": [
+        ([("id", 1)], {"unique": True}),
+        ([("status", 1), ("next_attempt_at", 1)], {}),
+        # Only sent mails get an expires_at
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+}
+
+ARCHIVES = {"reservations": "reservations_archive", "contact_messages": "contact_messages_archive"}
+# The field each archival cutoff applies to, batches are read in its index order
+ARCHIVE_DATE_FIELDS = {"reservations": "date", "contact_messages": "sent_at"}
+
+if ARCHIVE_TTL_DAYS:
+    for archive_name in ARCHIVES.values():
+        INDEXES[archive_name] = [([("archived_at", 1)], {"expireAfterSeconds": ARCHIVE_TTL_DAYS * 86400})]
+
+async def ensure_collection_indexes(collection_name: str, indexes: list):
+    # One createIndexes command per collection, a no-op for existing indexes
+    try:
+        await db[collection_name].create_indexes([IndexModel(keys, **options) for keys, options in indexes])
+        return
+    except OperationFailure:
+        pass
+    # The batch fails as a whole, retry one by one to build the others and log the culprit
+    for keys, options in indexes:
+        try:
+            await db[collection_name].create_index(keys, **options)
+        except OperationFailure as e:
+            # e.g. a unique index over pre-existing duplicates, keep serving
+            logger.error("Index %s on %s could not be built: %s", keys, collection_name, e)
+
+async def ensure_indexes():
+    started = monotonic()
+    if ARCHIVE_ENABLED and ARCHIVE_TARGET == "collection":
+        # Before create_index would create them with the default compressor
+        await archiver.create_collections()
+    await asyncio.gather(*[
+        ensure_collection_indexes(collection_name, indexes) for collection_name, indexes in INDEXES.items()
+    ])
+    logger.info("Indexes ready in %.1f ms", (monotonic() - started) * 1000)
+
+# Slot capacity accounting
+# One availability document per day in db.availability, mapping each booked
+# time to its seats taken. It is both the booking counter and what
+# GET /api/availability serves, so reads never aggregate reservations.
+def opening_slots() -> List[str]:
+    start = datetime.strptime(SLOT_OPENING, "%H:%M")
+    end = datetime.strptime(SLOT_CLOSING, "%H:%M")
+    slots = []
+    while start <= end:
+        slots.append(start.strftime("%H:%M"))
+        start += timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+async def book_slot(slot_date: str, slot_time: str, party_size: int) -> bool:
+    # A single conditional upsert: it only matches while the seats fit, a
+    # missing day is created, and a full slot makes the upsert collide on _id.
+    if party_size > SLOT_CAPACITY:
+        return False
+    for attempt in range(2):
+        try:
+            await db.availability.update_one(
+                {"_id": slot_date, f"slots.{slot_time}": {"$not": {"$gt": SLOT_CAPACITY - party_size}}},
+                {"$inc": {f"slots.{slot_time}": party_size}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The first collision can be two bookings creating the same day,
+            # the retry matches the existing document. Only a second one is a full slot.
+            if attempt:
+                return False
+
+async def release_slot(slot_date: str, slot_time: str, party_size: int):
+    await db.availability.update_one(
+        {"_id": slot_date},
+        {"$inc": {f"slots.{slot_time}": -party_size}}
+    )
+
+async def alternative_slots(slot_date: str, slot_time: str, party_size: int) -> List[dict]:
+    try:
+        start = datetime.strptime(f"{slot_date} {slot_time}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return []
+    opening = opening_slots()
+    # Nearby slots on the same day within opening hours, closest first
+    candidates = []
+    for distance in range(1, SLOT_ALTERNATIVES + 1):
+        for sign in (-1, 1):
+            candidate = start + sign * timedelta(minutes=distance * SLOT_MINUTES)
+            if candidate.date() == start.date() and candidate.strftime("%H:%M") in opening:
+                candidates.append(candidate.strftime("%H:%M"))
+    day = await db.availability.find_one({"_id": slot_date}) or {}
+    booked = day.get("slots", {})
+    alternatives = []
+    for candidate in candidates:
+        remaining = SLOT_CAPACITY - booked.get(candidate, 0)
+        if remaining >= party_size:
+            alternatives.append({"date": slot_date, "time": candidate, "remaining": remaining})
+    return alternatives
+
+async def rebuild_availability():
+    # Backfill or repair the day documents from the confirmed reservations
+    pipeline = [
+        {"$match": {"status": "confirmed"}},
+        {"$group": {"_id": {"date": "$date", "time": "$time"}, "booked": {"$sum": "$party_size"}}},
+        {"$group": {"_id": "$_id.date", "slots": {"$push": {"k": "$_id.time", "v": "$booked"}}}},
+        {"$project": {"slots": {"$arrayToObject": "$slots"}}},
+    ]
+    days = 0
+    async for day in db.reservations.aggregate(pipeline, allowDiskUse=True):
+        await db.availability.replace_one({"_id": day["_id"]}, day, upsert=True)
+        days += 1
+    return days
+
+# Reporting rollups
+# Dashboards read small pre-aggregated documents from db.rollups instead of
+# scanning history: one per reservation day with per-slot counters, one per
+# ISO week of new subscribers and one with contact messages by status. Each
+# write bumps them with $inc; a failed bump is only logged, and
+# `manage.py rebuild-rollups` recomputes them from the collections.
+def iso_week(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+async def bump_rollup(rollup_id: str, increments: dict):
+    try:
+        await db.rollups.update_one({"_id": rollup_id}, {"$inc": increments}, upsert=True)
+    except Exception as e:
+        logger.error("Rollup %s not updated: %s", rollup_id, e)
+
+async def record_reservation(reservation: dict):
+    slot = f"slots.{reservation['time']}"
+    await bump_rollup(f"reservations:{reservation['date']}", {
+        "reservations": 1,
+        "covers": reservation["party_size"],
+        f"{slot}.reservations": 1,
+        f"{slot}.covers": reservation["party_size"],
+    })
+
+def subscription_week(subscribed_at: str) -> str:
+    # The week of the timestamp's own calendar day, for the incremental
+    # counts and rebuild_rollups alike
+    return iso_week(date.fromisoformat(subscribed_at.split("T")[0]))
+
+async def record_subscribers(subscriptions: List[dict]):
+    """Count newly stored subscription documents in their weekly rollups"""
+    weeks = {}
+    for subscription in subscriptions:
+        week = subscription_week(subscription["subscribed_at"])
+        weeks[week] = weeks.get(week, 0) + 1
+    for week, count in weeks.items():
+        await bump_rollup(f"newsletter:{week}", {"subscribers": count})
+
+async def record_contact_messages(count: int, status: str = "new"):
+    if count:
+        await bump_rollup("contact_messages:status", {f"counts.{status}": count})
+
+async def rebuild_rollups() -> dict:
+    """Recompute every rollup document with aggregation pipelines"""
+    rollups = []
+    # Archived documents still count when they were archived to collections
+    existing = set(await db.list_collection_names())
+    archived = {
+        name: [{"$unionWith": archive_name}] if archive_name in existing else []
+        for name, archive_name in ARCHIVES.items()
+    }
+    days = db.reservations.aggregate(archived["reservations"] + [
+        {"$match": {"status": "confirmed"}},
+        {"$group": {
+            "_id": {"date": "$date", "time": "$time"},
+            "reservations": {"$sum": 1},
+            "covers": {"$sum": "$party_size"},
+        }},
+        {"$group": {
+            "_id": "$_id.date",
+            "reservations": {"$sum": "$reservations"},
+            "covers": {"$sum": "$covers"},
+            "slots": {"$push": {"k": "$_id.time", "v": {"reservations": "$reservations", "covers": "$covers"}}},
+        }},
+        {"$project": {"reservations": 1, "covers": 1, "slots": {"$arrayToObject": "$slots"}}},
+    ], allowDiskUse=True)
+    async for day in days:
+        rollups.append({**day, "_id": f"reservations:{day['_id']}"})
+    # Counted per day of the subscribed_at date part, then per week with
+    # subscription_week, the same mapping record_subscribers uses
+    days = db.newsletter.aggregate([
+        {"$group": {
+            "_id": {"$arrayElemAt": [{"$split": ["$subscribed_at", "T"]}, 0]},
+            "subscribers": {"$sum": 1},
+        }},
+    ], allowDiskUse=True)
+    weeks = {}
+    async for day in days:
+        if not day["_id"]:
+            continue
+        week = subscription_week(day["_id"])
+        weeks[week] = weeks.get(week, 0) + day["subscribers"]
+    for week, subscribers in weeks.items():
+        rollups.append({"_id": f"newsletter:{week}", "subscribers": subscribers})
+    statuses = db.contact_messages.aggregate(
+        archived["contact_messages"] + [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    )
+    rollups.append({"_id": "contact_messages:status", "counts": {
+        status["_id"]: status["count"] async for status in statuses if status["_id"]
+    }})
+    for rollup in rollups:
+        await db.rollups.replace_one({"_id": rollup["_id"]}, rollup, upsert=True)
+    # Days or weeks that no longer have any data. Days archived to files are
+    # gone from Mongo but keep their rollups.
+    stale = {"_id": {"$regex": "^(reservations|newsletter):", "$nin": [rollup["_id"] for rollup in rollups]}}
+    if ARCHIVE_TARGET == "files":
+        cutoff = archiver.criteria()["reservations"]["date"]["$lt"]
+        stale = {"$and": [stale, {"$or": [
+            {"_id": {"$regex": "^newsletter:"}},
+            {"_id": {"$gte": f"reservations:{cutoff}"}},
+        ]}]}
+    stale = await db.rollups.delete_many(stale)
+    return {"rollups": len(rollups), "removed": stale.deleted_count}
+
+def average_party_size(rollup: dict) -> Optional[float]:
+    return round(rollup["covers"] / rollup["reservations"], 2) if rollup.get("reservations") else None
+
+# Outbound mail queue
+# Messages are persisted in db.mail_outbox first, then handed to a bounded
+# asyncio queue. Each worker owns one SMTP connection that it keeps open
+# between messages and drives from a thread, so smtplib never blocks the loop.
+# smtplib and email are imported on first use, most instances never send.
+def build_message(mail: dict):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart("alternative")
+    message["From"] = MAIL_FROM
+    message["To"] = mail["to"]
+    message["Subject"] = mail["subject"]
+    message.attach(MIMEText(mail["body"], "plain", "utf-8"))
+    return message
+
+class SMTPConnection:
+    def __init__(self):
+        self._smtp = None
+        self._last_used = 0.0
+
+    def send(self, message, retry: bool = True):
+        import smtplib
+
+        if self._smtp is not None and monotonic() - self._last_used > MAIL_SMTP_IDLE:
+            self.close()
+        if self._smtp is None:
+            retry = False
+            self._smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                self._smtp.starttls()
+            if SMTP_USER:
+                self._smtp.login(SMTP_USER, SMTP_PASSWORD)
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            if not retry:
+                raise
+            # The server dropped a reused connection, reconnect once
+            return self.send(message, retry=False)
+        self._last_used = monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+class MailQueue:
+    def __init__(self):
+        self.queue = None
+        self.tasks = []
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(SMTP_HOST)
+
+    async def enqueue(self, to: str, subject: str, body: str):
+        # Called after the booking or message is committed, a failure here is
+        # only logged so it never turns into a 5xx the client would retry
+        if not self.enabled:
+            # Nothing would ever send it, and enabling SMTP later must not flush a backlog
+            return
+        mail_data = {
+            "id": str(uuid.uuid4()),
+            "to": to,
+            "subject": subject,
+            "body": body,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": utcnow(),
+            "created_at": utcnow()
+        }
+        try:
+            await db.mail_outbox.insert_one(mail_data)
+        except Exception as e:
+            logger.error("Mail to %s could not be queued: %s", to, e)
+            return
+        if self.queue is not None:
+            try:
+                self.queue.put_nowait(mail_data["id"])
+            except asyncio.QueueFull:
+                # Still in the outbox, the poller will pick it up
+                pass
+
+    def start(self):
+        if not self.enabled or self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=MAIL_QUEUE_SIZE)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(MAIL_WORKERS)]
+        self.tasks.append(asyncio.create_task(self._poller()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue = None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+
+    async def _poller(self):
+        while True:
+            try:
+                # Recover messages left in "sending" by a crashed worker
+                await db.mail_outbox.update_many(
+                    {"status": "sending", "claimed_at": {"$lt": utcnow() - timedelta(seconds=MAIL_SENDING_LEASE)}},
+                    {"$set": {"status": "pending"}}
+                )
+                free = MAIL_QUEUE_SIZE - self.queue.qsize()
+                if free > 0:
+                    due = db.mail_outbox.find(
+                        {"status": "pending", "next_attempt_at": {"$lte": utcnow()}},
+                        {"_id": 0, "id": 1}
+                    ).sort("next_attempt_at", 1).limit(free)
+                    async for mail in due:
+                        self.queue.put_nowait(mail["id"])
+            except asyncio.CancelledError:
+                raise
+            except asyncio.QueueFull:
+                pass
+            except Exception as e:
+                logger.error("Mail outbox poll failed: %s", e)
+            await asyncio.sleep(MAIL_POLL_INTERVAL)
+
+    async def _worker(self):
+        connection = SMTPConnection()
+        try:
+            while True:
+                mail_id = await self.queue.get()
+                try:
+                    await self._deliver(connection, mail_id)
+                except Exception as e:
+                    logger.error("Mail %s could not be processed: %s", mail_id, e)
+                finally:
+                    self.queue.task_done()
+        finally:
+            connection.close()
+
+    async def _deliver(self, connection: SMTPConnection, mail_id: str):
+        # Claim the message so a duplicate queue entry or another worker skips it
+        mail = await db.mail_outbox.find_one_and_update(
+            {"id": mail_id, "status": "pending"},
+            {"$set": {"status": "sending", "claimed_at": utcnow()}}
+        )
+        if mail is None:
+            return
+        message = build_message(mail)
+        try:
+            await asyncio.to_thread(connection.send, message)
+        except Exception as e:
+            connection.close()
+            attempts = mail["attempts"] + 1
+            if attempts >= MAIL_MAX_ATTEMPTS:
+                self.failed += 1
+                update = {"status": "failed"}
+            else:
+                # Exponential backoff, picked up again by the poller
+                delay = MAIL_RETRY_BASE * 2 ** (attempts - 1)
+                update = {"status": "pending", "next_attempt_at": utcnow() + timedelta(seconds=delay)}
+            await db.mail_outbox.update_one(
+                {"id": mail_id},
+                {"$set": {**update, "attempts": attempts, "last_error": str(e)}}
+            )
+            return
+        self.sent += 1
+        await db.mail_outbox.update_one(
+            {"id": mail_id},
+            {"$set": sent_mail_fields(), "$inc": {"attempts": 1}}
+        )
+
+def sent_mail_fields() -> dict:
+    now = utcnow()
+    fields = {"status": "sent", "sent_at": now}
+    if MAIL_OUTBOX_RETENTION_DAYS:
+        fields["expires_at"] = now + timedelta(days=MAIL_OUTBOX_RETENTION_DAYS)
+    return fields
+
+mail_queue = MailQueue()
+
+image_cache = ImageCache(
+    IMAGE_CACHE_DIR, IMAGE_WIDTHS, IMAGE_FORMATS, IMAGE_QUALITY, IMAGE_CACHE_MAX_BYTES,
+    IMAGE_MAX_SOURCE_BYTES, IMAGE_FETCH_TIMEOUT, IMAGE_WORKERS, IMAGE_LOCAL_ROOT or None,
+    IMAGE_ALLOWED_HOSTS, IMAGE_RETRY_BASE, IMAGE_RETRY_MAX
+)
+
+def reservation_confirmation_body(reservation_data: dict) -> str:
+    return (
+        f"Bonjour {reservation_data['name']},\n\n"
+        f"Votre réservation pour {reservation_data['party_size']} personne(s) "
+        f"le {reservation_data['date']} à {reservation_data['time']} est confirmée.\n\n"
+        f"Référence : {reservation_data['id']}\n\n"
+        "À très vite à L'envers !"
+    )
+
+# Write-behind buffer
+# Entries are {"collection", "kind", "document"} dicts: inserts for contact
+# messages, $setOnInsert upserts on email for subscriptions. Both are
+# idempotent, so replaying a spool that was partly flushed is safe. The spool
+# holds pending entries, the ".flushing" file the ones being written; the
+# latter is only removed once a flush has written everything it took.
+class WriteBehindBuffer:
+    def __init__(self, spool_path: str = ""):
+        # Each worker process appends to its own "<spool>.<pid>" file
+        self.spool_base = Path(spool_path) if spool_path else None
+        self.spool_path = None
+        self.pending = []
+        self.spool = None
+        self.wakeup = None
+        self.task = None
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return WRITE_BEHIND_ENABLED and self.task is not None
+
+    @property
+    def flushing_path(self) -> Path:
+        return self.spool_path.with_name(self.spool_path.name + ".flushing")
+
+    async def start(self):
+        if not WRITE_BEHIND_ENABLED or self.task is not None:
+            return
+        if self.spool_base is not None:
+            self.spool_path = self.spool_base.with_name(f"{self.spool_base.name}.{os.getpid()}")
+            try:
+                await self._recover()
+            except Exception as e:
+                # The spools stay on disk and are replayed on the next start
+                logger.error("Spooled submissions could not be replayed: %s", e)
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            self.spool = open(self.spool_path, "ab")
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        await self.flush()
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+    def stats(self):
+        return {"enabled": self.enabled, "pending": len(self.pending), "flushed": self.flushed, "failed": self.failed}
+
+    def add(self, collection_name: str, kind: str, document: dict) -> bool:
+        """Buffer a write, False when the caller should write it directly"""
+        if not self.enabled or len(self.pending) >= WRITE_BEHIND_MAX_PENDING:
+            return False
+        entry = {"collection": collection_name, "kind": kind, "document": document}
+        if self.spool is not None:
+            self.spool.write(orjson.dumps(entry) + b"\n")
+            self.spool.flush()
+            if WRITE_BEHIND_FSYNC:
+                os.fsync(self.spool.fileno())
+        self.pending.append(entry)
+        if len(self.pending) >= WRITE_BEHIND_BATCH_SIZE:
+            self.wakeup.set()
+        return True
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), WRITE_BEHIND_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Write-behind flush failed, retrying: %s", e)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        entries, self.pending = self.pending, []
+        if self.spool is not None:
+            self._rotate_spool()
+        for offset in range(0, len(entries), WRITE_BEHIND_BATCH_SIZE):
+            try:
+                await self._write(entries[offset:offset + WRITE_BEHIND_BATCH_SIZE])
+            except Exception:
+                # Keep what's left, it is still on disk in the flushing file
+                self.pending[:0] = entries[offset:]
+                raise
+        if self.spool is not None and not self.pending:
+            self.flushing_path.unlink(missing_ok=True)
+
+    def _rotate_spool(self):
+        # Everything in the spool was just taken, move it to the flushing file
+        self.spool.close()
+        with open(self.flushing_path, "ab") as flushing:
+            flushing.write(self.spool_path.read_bytes())
+            flushing.flush()
+            if WRITE_BEHIND_FSYNC:
+                os.fsync(flushing.fileno())
+        self.spool = open(self.spool_path, "wb")
+
+    async def _write(self, entries: List[dict]):
+        operations = {}
+        for entry in entries:
+            document = entry["document"]
+            if entry["kind"] == "upsert":
+                operation = UpdateOne({"email": document["email"]}, {"$setOnInsert": document}, upsert=True)
+            else:
+                operation = InsertOne(document)
+            operations.setdefault(entry["collection"], []).append((operation, document))
+        for collection_name, pairs in operations.items():
+            batch = [operation for operation, _ in pairs]
+            try:
+                result = await db[collection_name].bulk_write(batch, ordered=False)
+                self.flushed += len(batch)
+                written = result.inserted_count + result.upserted_count
+                upserted = list(result.upserted_ids)
+            except BulkWriteError as e:
+                # Duplicates are replays or concurrent subscriptions, anything else is lost
+                errors = [error for error in e.details["writeErrors"] if error["code"] != 11000]
+                self.flushed += len(batch) - len(errors)
+                self.failed += len(errors)
+                written = e.details.get("nInserted", 0) + e.details.get("nUpserted", 0)
+                upserted = [item["index"] for item in e.details.get("upserted", [])]
+                for error in errors:
+                    logger.error("Write-behind %s write failed: %s", collection_name, error.get("errmsg"))
+            # Only documents that are actually new count in the reports
+            if collection_name == "newsletter":
+                await record_subscribers([pairs[index][1] for index in upserted])
+            else:
+                await record_contact_messages(written)
+
+    def _orphaned_spools(self) -> List[Path]:
+        # Files of this pid or of workers that are gone; live workers own theirs
+        orphaned = []
+        for path in self.spool_base.parent.glob(self.spool_base.name + "*"):
+            pid = path.name[len(self.spool_base.name):].removesuffix(".flushing").lstrip(".")
+            if pid and not pid.isdigit():
+                continue
+            if pid and int(pid) != os.getpid() and process_alive(int(pid)):
+                continue
+            orphaned.append(path)
+        return orphaned
+
+    async def _recover(self):
+        entries = []
+        paths = self._orphaned_spools()
+        for path in paths:
+            for line in path.read_bytes().splitlines():
+                try:
+                    entries.append(spooled_entry(orjson.loads(line)))
+                except orjson.JSONDecodeError:
+                    # A torn last line from a crash mid-append
+                    logger.warning("Skipping unreadable line in %s", path)
+        if entries:
+            # Two workers may replay the same dead spool, the writes are idempotent
+            for offset in range(0, len(entries), WRITE_BEHIND_BATCH_SIZE):
+                await self._write(entries[offset:offset + WRITE_BEHIND_BATCH_SIZE])
+            logger.info("Replayed %d spooled submissions", len(entries))
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+# The spool is JSON, these timestamps come back from it as ISO strings
+SPOOLED_DATETIMES = {"contact_messages": ("sent_at",)}
+
+def spooled_entry(entry: dict) -> dict:
+    document = entry["document"]
+    for field in SPOOLED_DATETIMES.get(entry["collection"], ()):
+        if isinstance(document.get(field), str):
+            document[field] = datetime.fromisoformat(document[field])
+    return entry
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+write_behind = WriteBehindBuffer(WRITE_BEHIND_SPOOL)
+
+# Archival
+# Old reservations and handled contact messages are moved out of the live
+# collections in bounded batches: copied to the archive first, then deleted
+# by _id. A crash in between only leaves a copy behind, which the next run
+# skips (collections) or appends again (files, readers dedupe on id). The
+# pause between batches and the batch cap per run keep it behind live traffic,
+# and a lease keeps it to one worker.
+class Archiver:
+    def __init__(self):
+        self.task = None
+        self.archived = {name: 0 for name in ARCHIVES}
+        self.last_run = None
+
+    def start(self):
+        if ARCHIVE_ENABLED and self.task is None:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self):
+        return {
+            "enabled": ARCHIVE_ENABLED,
+            "target": ARCHIVE_TARGET,
+            "archived": self.archived,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+    async def create_collections(self):
+        existing = set(await db.list_collection_names())
+        for archive_name in ARCHIVES.values():
+            if archive_name in existing:
+                continue
+            try:
+                await db.create_collection(archive_name, storageEngine={
+                    "wiredTiger": {"configString": f"block_compressor={ARCHIVE_COMPRESSOR}"}
+                })
+            except Exception as e:
+                logger.error("Archive collection %s could not be created: %s", archive_name, e)
+
+    def criteria(self) -> dict:
+        today = venue_today()
+        return {
+            "reservations": {
+                "date": {"$lt": (today - timedelta(days=ARCHIVE_RESERVATIONS_AFTER_DAYS)).isoformat()}
+            },
+            "contact_messages": {
+                "status": {"$in": ARCHIVE_CONTACT_STATUSES},
+                "sent_at": {"$lt": local_datetime((today - timedelta(days=ARCHIVE_CONTACT_AFTER_DAYS)).isoformat(), "00:00")},
+            },
+        }
+
+    async def _loop(self):
+        while True:
+            try:
+                if await acquire_lease("archival", ARCHIVE_INTERVAL):
+                    await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Archival run failed: %s", e)
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+    async def run(self) -> dict:
+        moved = {}
+        for collection_name, filters in self.criteria().items():
+            moved[collection_name] = await self.archive(collection_name, filters)
+            self.archived[collection_name] += moved[collection_name]
+        self.last_run = utcnow()
+        if any(moved.values()):
+            logger.info("Archived %s", moved)
+        return moved
+
+    async def archive(self, collection_name: str, filters: dict) -> int:
+        moved = 0
+        for _ in range(ARCHIVE_MAX_BATCHES):
+            docs = await db[collection_name].find(filters).sort(ARCHIVE_DATE_FIELDS[collection_name], 1).limit(
+                ARCHIVE_BATCH_SIZE
+            ).to_list(ARCHIVE_BATCH_SIZE)
+            if not docs:
+                break
+            archived_at = utcnow()
+            for doc in docs:
+                doc["archived_at"] = archived_at
+            if ARCHIVE_TARGET == "files":
+                await asyncio.to_thread(self._append_file, collection_name, docs)
+            else:
+                try:
+                    await db[ARCHIVES[collection_name]].insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    # Copies left by an interrupted run
+                    if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                        raise
+            # The filters again, so a document changed meanwhile stays live
+            result = await db[collection_name].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}, **filters})
+            moved += result.deleted_count
+            if len(docs) < ARCHIVE_BATCH_SIZE:
+                break
+            await asyncio.sleep(ARCHIVE_PAUSE)
+        return moved
+
+    def _append_file(self, collection_name: str, docs: List[dict]):
+        directory = Path(ARCHIVE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{collection_name}-{utcnow().strftime('%Y-%m')}.ndjson.gz"
+        lines = b"".join(orjson.dumps(doc, default=str, option=ORJSON_OPTIONS) + b"\n" for doc in docs)
+        # Each append is a gzip member of its own, gzip readers concatenate them
+        with gzip.open(path, "ab") as archive:
+            archive.write(lines)
+
+archiver = Archiver()
+
+# Live updates
+# One change stream per collection, shared by every subscriber. Each change is
+# published to bounded per-client queues and kept in a short replay buffer
+# keyed by its resume token, so a reconnecting client (Last-Event-ID) only
+# misses what fell out of the buffer and is then told to resync.
+class ChangeFeed:
+    def __init__(self, collection_name: str, on_change=None):
+        self.collection_name = collection_name
+        self.on_change = on_change
+        self.subscribers = set()
+        self.recent = deque(maxlen=LIVE_REPLAY_SIZE)
+        self.task = None
+        self.unsupported = False
+        self.dropped = 0
+
+    def start(self):
+        if LIVE_UPDATES_ENABLED and self.task is None and not self.unsupported:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def subscribe(self, last_event_id: Optional[str] = None):
+        missed = []
+        if last_event_id:
+            ids = [event_id for event_id, _ in self.recent]
+            # A client cut off for being slow missed more than a queue's worth
+            missed = list(self.recent)[ids.index(last_event_id) + 1:] if last_event_id in ids else None
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE + len(missed or ()))
+        if missed is None:
+            queue.put_nowait((None, b'{"operation":"resync"}'))
+        for event in missed or ():
+            queue.put_nowait(event)
+        self.subscribers.add(queue)
+        self.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, change: dict):
+        document = change.get("fullDocument") or {}
+        document.pop("_id", None)
+        event_id = change["_id"]["_data"]
+        payload = orjson.dumps(
+            {"operation": change["operationType"], "document": document}, default=str, option=ORJSON_OPTIONS
+        )
+        self.recent.append((event_id, payload))
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event_id, payload))
+            except asyncio.QueueFull:
+                # A slow client is cut off. Its undelivered changes are dropped
+                # too, so its Last-Event-ID precedes all of them and the
+                # reconnect replays them from the buffer
+                self.dropped += 1
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        if self.on_change is not None:
+            self.on_change(change)
+
+    async def _run(self):
+        resume_token = None
+        while True:
+            try:
+                async with db[self.collection_name].watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.publish(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == 40573:
+                    # Standalone mongod, change streams will never work here
+                    logger.warning("Live updates disabled for %s: %s", self.collection_name, e)
+                    self.unsupported = True
+                    self.task = None
+                    for queue in list(self.subscribers):
+                        self.unsubscribe(queue)
+                        queue.put_nowait(None)
+                    return
+                logger.error("Change stream on %s failed: %s", self.collection_name, e)
+            except Exception as e:
+                logger.error("Change stream on %s failed: %s", self.collection_name, e)
+            await asyncio.sleep(LIVE_RETRY_DELAY)
+
+def invalidate_events_cache(change: dict):
+    # Also catches writes from other workers and from outside the API
+    events_changed()
+
+change_feeds = {
+    name: ChangeFeed(name, invalidate_events_cache if name == "events" else None)
+    for name in LIVE_COLLECTIONS
+}
+
+async def stream_changes(request: Request, feed: ChangeFeed, queue):
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), LIVE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield b": ping\n\n"
+                continue
+            if event is None:
+                return
+            event_id, payload = event
+            prefix = f"id: {event_id}\n".encode("ascii") if event_id else b""
+            yield prefix + b"data: " + payload + b"\n\n"
+    finally:
+        feed.unsubscribe(queue)
+
+# Document builders shared by the single and bulk endpoints
+def build_event_document(event: EventModel) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        **event.model_dump(exclude={"id"}),
+        "title_search": fold_text(event.title),
+        "start_at": local_datetime(event.date, event.time),
+        "created_at": utcnow()
+    }
+
+def build_subscription_document(subscription: NewsletterSubscription) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        **subscription.model_dump(),
+        # Venue time with its offset, its date part is the subscription's reporting day
+        "subscribed_at": datetime.now(VENUE_ZONE).isoformat(),
+        "active": True
+    }
+
+# Bulk ingestion
+# Bodies are a JSON array, NDJSON (one object per line) or CSV with a header
+# row. NDJSON and CSV are parsed while the upload streams in.
+async def iter_body(request: Request):
+    # Refuses bodies over BULK_MAX_BYTES, whether or not Content-Length announces it
+    too_large = HTTPException(status_code=413, detail=f"Le fichier dépasse la taille maximale de {BULK_MAX_BYTES} octets")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > BULK_MAX_BYTES:
+        raise too_large
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > BULK_MAX_BYTES:
+            raise too_large
+        yield chunk
+
+async def iter_lines(request: Request):
+    # Chunks can split a multi-byte character, the decoder keeps the partial bytes
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        async for chunk in iter_body(request):
+            pending += decoder.decode(chunk)
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Le fichier doit être encodé en UTF-8")
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_records(request: Request):
+    # Yields (row number, record dict or parse error message)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "application/json":
+        try:
+            records = json.loads(b"".join([chunk async for chunk in iter_body(request)]))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON invalide")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Un tableau JSON est attendu")
+        for row, record in enumerate(records, start=1):
+            yield row, record
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        row = 0
+        async for line in iter_lines(request):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError as e:
+                yield row, f"JSON invalide: {e}"
+    elif content_type == "text/csv":
+        header = None
+        row = 0
+        record_lines = []
+        async for line in iter_lines(request):
+            # A quoted field may span lines, wait for the quotes to balance
+            record_lines.append(line)
+            if sum(part.count('"') for part in record_lines) % 2:
+                continue
+            values = next(csv.reader(["\n".join(record_lines)]), [])
+            record_lines = []
+            if not any(values):
+                continue
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            row += 1
+            if len(values) != len(header):
+                yield row, f"{len(values)} colonnes au lieu de {len(header)}"
+                continue
+            # Empty cells fall back to the model defaults
+            yield row, {name: value for name, value in zip(header, values) if value != ""}
+    else:
+        raise HTTPException(status_code=415, detail="Formats acceptés : application/json, application/x-ndjson, text/csv")
+
+async def bulk_ingest(request: Request, model, write_batch) -> dict:
+    # write_batch(rows, documents) writes one batch and returns (written, skipped, errors)
+    started = monotonic()
+    report = {"rows": 0, "inserted": 0, "skipped": 0, "error_count": 0, "errors": []}
+
+    def add_error(row, error):
+        report["error_count"] += 1
+        if len(report["errors"]) < BULK_MAX_ERRORS:
+            report["errors"].append({"row": row, "error": error})
+
+    async def flush(rows, documents):
+        written, skipped, errors = await write_batch(rows, documents)
+        report["inserted"] += written
+        report["skipped"] += skipped
+        for row, error in errors:
+            add_error(row, error)
+
+    rows, documents = [], []
+    async for row, record in iter_records(request):
+        if report["rows"] >= BULK_MAX_ROWS:
+            # What was read so far is imported, the rest of the body is ignored
+            add_error(row, f"Import limité à {BULK_MAX_ROWS} lignes, lignes suivantes ignorées")
+            break
+        report["rows"] += 1
+        if isinstance(record, str):
+            add_error(row, record)
+            continue
+        try:
+            documents.append(model.model_validate(record))
+            rows.append(row)
+        except ValidationError as e:
+            add_error(row, "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc']) or 'ligne'}: {error['msg']}" for error in e.errors()
+            ))
+            continue
+        if len(documents) >= BULK_BATCH_SIZE:
+            await flush(rows, documents)
+            rows, documents = [], []
+    if documents:
+        await flush(rows, documents)
+
+    elapsed = monotonic() - started
+    report["elapsed_ms"] = round(elapsed * 1000, 1)
+    report["rows_per_second"] = round(report["rows"] / elapsed, 1) if elapsed > 0 else None
+    report["success"] = report["error_count"] == 0
+    return report
+
+def bulk_write_errors(write_errors: List[dict], rows: List[int]):
+    return [(rows[error["index"]], error.get("errmsg", "Erreur d'écriture")) for error in write_errors]
+
+async def write_events_batch(rows: List[int], events: List[EventModel]):
+    documents = [build_event_document(event) for event in events]
+    try:
+        result = await db.events.insert_many(documents, ordered=False)
+        written, errors = len(result.inserted_ids), []
+    except BulkWriteError as e:
+        written, errors = e.details.get("nInserted", 0), bulk_write_errors(e.details.get("writeErrors", []), rows)
+    failed = {row for row, _ in errors}
+    for row, document in zip(rows, documents):
+        if document["image_url"] and row not in failed:
+            image_cache.schedule(document["id"], document["image_url"])
+    return written, 0, errors
+
+async def write_subscriptions_batch(rows: List[int], subscriptions: List[NewsletterSubscription]):
+    documents = [build_subscription_document(subscription) for subscription in subscriptions]
+    operations = [
+        UpdateOne({"email": document["email"]}, {"$setOnInsert": document}, upsert=True) for document in documents
+    ]
+    try:
+        result = await db.newsletter.bulk_write(operations, ordered=False)
+        await record_subscribers([documents[index] for index in result.upserted_ids])
+        # Existing addresses match instead of upserting
+        return result.upserted_count, result.matched_count, []
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        # A duplicate key here is a concurrent subscription of the same address
+        duplicates = [error for error in write_errors if error.get("code") == 11000]
+        others = [error for error in write_errors if error.get("code") != 11000]
+        await record_subscribers([documents[upserted["index"]] for upserted in e.details.get("upserted", [])])
+        return e.details.get("nUpserted", 0), e.details.get("nMatched", 0) + len(duplicates), bulk_write_errors(others, rows)
+
+# Staff access
+def require_staff(request: Request):
+    token = request.headers.get("x-staff-token", "")
+    if not STAFF_TOKEN or not hmac.compare_digest(token.encode(), STAFF_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Accès réservé à l'équipe")
+
+# Streaming exports
+# Reservations were always exportable; the other collections need staff access
+STAFF_EXPORTS = {"contact_messages", "newsletter"}
+# collection -> (date field used by date_from/date_to, what it holds, CSV columns):
+# a bare "date", an ISO "timestamp" string, or a BSON "datetime"
+EXPORTS = {
+    "reservations": ("date", "date", [
+        "id", "name", "email", "phone", "date", "time", "party_size", "special_requests", "status", "start_at",
+        "created_at"
+    ]),
+    "contact_messages": ("sent_at", "datetime", ["id", "name", "email", "subject", "message", "status", "sent_at"]),
+    "newsletter": ("subscribed_at", "timestamp", ["id", "email", "name", "active", "subscribed_at"]),
+}
+
+def export_filter(field: str, kind: str, date_from: Optional[str], date_to: Optional[str]) -> dict:
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Les dates doivent être au format AAAA-MM-JJ")
+    bounds = {}
+    if kind == "datetime":
+        # Whole venue days, as UTC instants
+        if start:
+            bounds["$gte"] = local_datetime(start.isoformat(), "00:00")
+        if end:
+            bounds["$lt"] = local_datetime((end + timedelta(days=1)).isoformat(), "00:00")
+        return {field: bounds} if bounds else {}
+    if start:
+        bounds["$gte"] = start.isoformat()
+    if end:
+        # ISO timestamps of the last day sort after the bare date, so bound on the next day
+        if kind == "timestamp":
+            bounds["$lt"] = (end + timedelta(days=1)).isoformat()
+        else:
+            bounds["$lte"] = end.isoformat()
+    return {field: bounds} if bounds else {}
+
+# The headers are sent by the time a cursor fails, so a failed export ends
+# with this line instead of a silently truncated file
+EXPORT_FAILED = "Export interrompu par une erreur, le fichier est incomplet"
+
+async def export_ndjson(cursor, batch_size: int):
+    lines = []
+    try:
+        async for doc in cursor:
+            lines.append(orjson.dumps(doc, default=str, option=ORJSON_OPTIONS))
+            if len(lines) >= batch_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+    except Exception as e:
+        logger.error("Export interrupted: %s", e)
+        lines.append(orjson.dumps({"error": EXPORT_FAILED}))
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+# Spreadsheets run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return as_utc(value).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        # Public form input, the quote makes Excel show it as text
+        return "'" + value
+    return value
+
+async def export_csv(cursor, columns: List[str], batch_size: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    rows = 0
+    try:
+        async for doc in cursor:
+            writer.writerow([csv_value(doc.get(column)) for column in columns])
+            rows += 1
+            if rows >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                rows = 0
+    except Exception as e:
+        logger.error("Export interrupted: %s", e)
+        writer.writerow([f"# {EXPORT_FAILED}"])
+    yield buffer.getvalue()
+
 # API Routes
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "L'envers API"}
+    return {
+        "status": "healthy",
+        "service": "L'envers API",
+        "events_cache": events_cache.stats(),
+        "mail_queue": mail_queue.stats(),
+        "write_behind": write_behind.stats(),
+        "homepage": homepage.stats(),
+        "compression": compression_cache.stats(),
+        "archival": archiver.stats()
+    }
 
-@app.post("/api/reservations")
+@app.post("/api/reservations", response_model=ReservationCreated)
 async def create_reservation(reservation: ReservationRequest):
+    if reservation.time not in opening_slots():
+        raise HTTPException(status_code=422, detail={
+            "message": "Cet horaire ne correspond à aucun créneau d'ouverture.",
+            "slots": opening_slots()
+        })
+    if reservation.party_size > SLOT_CAPACITY:
+        # No slot could ever take the group, alternatives would be empty
+        raise HTTPException(status_code=422, detail={
+            "message": f"Pour les groupes de plus de {SLOT_CAPACITY} personnes, contactez-nous directement.",
+            "max_party_size": SLOT_CAPACITY
+        })
+    if not await book_slot(reservation.date, reservation.time, reservation.party_size):
+        raise HTTPException(status_code=409, detail={
+            "message": "Ce créneau est complet. Voici d'autres horaires disponibles.",
+            "alternatives": await alternative_slots(reservation.date, reservation.time, reservation.party_size)
+        })
     try:
         # Create reservation record
         reservation_data = {
             "id": str(uuid.uuid4()),
-            "name": reservation.name,
-            "email": reservation.email,
-            "phone": reservation.phone,
-            "date": reservation.date,
-            "time": reservation.time,
-            "party_size": reservation.party_size,
-            "special_requests": reservation.special_requests,
+            **reservation.model_dump(),
             "status": "confirmed",
-            "created_at": datetime.now().isoformat()
+            "start_at": local_datetime(reservation.date, reservation.time),
+            "created_at": utcnow()
         }
         
-        # Save to database
-        await db.reservations.insert_one(reservation_data)
+        # Save to database, giving the seats back if the write fails
+        try:
+            await db.reservations.insert_one(reservation_data)
+        except Exception:
+            await release_slot(reservation.date, reservation.time, reservation.party_size)
+            raise
         # Remove the MongoDB _id field if it exists before returning
         reservation_data.pop('_id', None)
+        await record_reservation(reservation_data)
+        await mail_queue.enqueue(
+            reservation_data["email"],
+            "Confirmation de votre réservation - L'envers",
+            reservation_confirmation_body(reservation_data)
+        )
         
         return {
             "success": True,
@@ -92,126 +2384,573 @@ async def create_reservation(reservation: ReservationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la réservation: {str(e)}")
 
-@app.get("/api/reservations")
-async def get_reservations():
+@app.get("/api/reservations", response_model=ReservationList, response_model_exclude_unset=True)
+async def get_reservations(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    projection = parse_fields(fields, ReservationOut)
+    filters = date_range_filter(date_from, date_to)
+    if status:
+        filters["status"] = status
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        # Newest reservations first for the staff dashboards
+        reservations, next_cursor = await fetch_page(db.reservations, filters, after, limit, True, projection)
+        return {"reservations": reservations, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+
+@app.get("/api/reservations/tonight", response_model=ReservationList, response_model_exclude_unset=True)
+async def get_tonight_reservations(
+    day: Optional[str] = Query(None, alias="date", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    status: str = "confirmed",
+    limit: int = Query(500, ge=1, le=2000),
+    fields: Optional[str] = None,
+):
+    # One local day in start_at order, bounded in UTC so DST days stay correct
+    projection = parse_fields(fields, ReservationOut) or {"_id": 0}
+    try:
+        first = date.fromisoformat(day) if day else venue_today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date invalide")
+    filters = {
+        "status": status,
+        "start_at": {
+            "$gte": local_datetime(first.isoformat(), "00:00"),
+            "$lt": local_datetime((first + timedelta(days=1)).isoformat(), "00:00"),
+        },
+    }
     try:
-        reservations = await db.reservations.find({}, {"_id": 0}).to_list(100)
+        reservations = await db.reservations.find(filters, projection).sort("start_at", 1).limit(limit).to_list(limit)
         return {"reservations": reservations}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
 
-@app.get("/api/events")
-async def get_events():
+@app.get("/api/availability")
+async def get_availability(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else venue_today()
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else start + timedelta(days=13)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Les dates doivent être au format AAAA-MM-JJ")
+    if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"La période doit couvrir entre 1 et {AVAILABILITY_MAX_DAYS} jours")
+    try:
+        # At most AVAILABILITY_MAX_DAYS small documents, fetched by _id range
+        booked_days = {
+            day["_id"]: day.get("slots", {})
+            async for day in db.availability.find({"_id": {"$gte": start.isoformat(), "$lte": end.isoformat()}})
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+    slots = opening_slots()
+    days = []
+    for offset in range((end - start).days + 1):
+        day = (start + timedelta(days=offset)).isoformat()
+        booked = booked_days.get(day, {})
+        days.append({
+            "date": day,
+            "slots": [{"time": slot, "remaining": max(0, SLOT_CAPACITY - booked.get(slot, 0))} for slot in slots]
+        })
+    return {"capacity": SLOT_CAPACITY, "days": days}
+
+@app.get("/api/reports/reservations")
+async def report_reservations(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    try:
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else venue_today()
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Les dates doivent être au format AAAA-MM-JJ")
+    if end < start or (end - start).days >= REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"La période doit couvrir entre 1 et {REPORT_MAX_DAYS} jours")
+    try:
+        # One rollup per day with bookings, whatever the size of the history
+        rollups = await db.rollups.find(
+            {"_id": {"$gte": f"reservations:{start.isoformat()}", "$lte": f"reservations:{end.isoformat()}"}}
+        ).sort("_id", 1).to_list(REPORT_MAX_DAYS)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+    totals = {
+        "reservations": sum(rollup.get("reservations", 0) for rollup in rollups),
+        "covers": sum(rollup.get("covers", 0) for rollup in rollups),
+    }
+    days = [{
+        "date": rollup["_id"].split(":", 1)[1],
+        "reservations": rollup.get("reservations", 0),
+        "covers": rollup.get("covers", 0),
+        "average_party_size": average_party_size(rollup),
+        "slots": [
+            {"time": slot, "average_party_size": average_party_size(counts), **counts}
+            for slot, counts in sorted(rollup.get("slots", {}).items())
+        ],
+    } for rollup in rollups]
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "totals": {**totals, "average_party_size": average_party_size(totals)},
+        "days": days,
+    }
+
+@app.get("/api/reports/newsletter")
+async def report_newsletter(weeks: int = Query(12, ge=1, le=REPORT_MAX_WEEKS)):
+    today = venue_today()
+    week_ids = [iso_week(today - timedelta(weeks=offset)) for offset in reversed(range(weeks))]
+    try:
+        counts = {
+            rollup["_id"]: rollup.get("subscribers", 0)
+            async for rollup in db.rollups.find({"_id": {"$in": [f"newsletter:{week}" for week in week_ids]}})
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+    series = [{"week": week, "subscribers": counts.get(f"newsletter:{week}", 0)} for week in week_ids]
+    return {"weeks": series, "total": sum(point["subscribers"] for point in series)}
+
+@app.get("/api/reports/contact")
+async def report_contact_messages():
+    try:
+        rollup = await db.rollups.find_one({"_id": "contact_messages:status"}) or {}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+    counts = rollup.get("counts", {})
+    return {"by_status": counts, "total": sum(counts.values())}
+
+EVENT_PROJECTION = {"_id": 0, "title_search": 0}
+
+@app.get("/api/events", response_model=EventList, response_model_exclude_unset=True)
+async def get_events(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    projection = parse_fields(fields, EventOut) or EVENT_PROJECTION
+    filters = date_range_filter(date_from, date_to)
+    if category:
+        filters["category"] = category
+    after = decode_cursor(cursor) if cursor else None
+    # Served from memory until the TTL expires or create_event invalidates it
+    cache_key = (cursor, limit, date_from, date_to, category, fields)
+    cached = events_cache.get(cache_key)
+    if cached is None:
+        try:
+            events, next_cursor = await fetch_page(db.events, filters, after, limit, False, projection)
+        except Exception as e:
+            logger.error("Events could not be read: %s", e)
+            return {"events": [], "next_cursor": None}
+        # The body is cached already serialized, response_model only documents it
+        body = orjson.dumps({"events": events, "next_cursor": next_cursor}, option=ORJSON_OPTIONS)
+        cached = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+        events_cache.set(cache_key, cached)
+    body, etag = cached
+    return cached_json_response(request, body, etag, EVENTS_CACHE_CONTROL)
+
+@app.get("/api/events/home", response_model=HomepageEvents)
+async def get_homepage_events(request: Request):
+    try:
+        body, etag = await homepage.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des événements: {str(e)}")
+    return cached_json_response(request, body, etag, EVENTS_CACHE_CONTROL)
+
+@app.get("/api/events/upcoming", response_model=EventList, response_model_exclude_unset=True)
+async def get_upcoming_events(
+    limit: int = Query(20, ge=1, le=200),
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    projection = parse_fields(fields, EventOut) or EVENT_PROJECTION
+    filters = {"start_at": {"$gte": utcnow()}}
+    if category:
+        filters["category"] = category
     try:
-        events = await db.events.find({}, {"_id": 0}).to_list(50)
+        events = await db.events.find(filters, projection).sort([("start_at", 1), ("id", 1)]).limit(limit).to_list(limit)
         return {"events": events}
     except Exception as e:
-        return {"events": []}
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des événements: {str(e)}")
 
-@app.post("/api/events")
+@app.get("/api/events/search", response_model=EventSearchResults, response_model_exclude_none=True)
+async def search_events(
+    q: str = Query(..., min_length=2, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    category: Optional[str] = None,
+):
+    filters = {"category": category} if category else {}
+    try:
+        events, next_offset = await text_search(db.events, q, filters, offset, limit, EVENT_PROJECTION)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la recherche: {str(e)}")
+    return {"events": events, "next_offset": next_offset}
+
+@app.get("/api/events/autocomplete", response_model=List[TitleSuggestion])
+async def autocomplete_event_titles(q: str = Query(..., min_length=1, max_length=100)):
+    # Anchored on the folded title so the title_search index serves a range scan
+    prefix = fold_text(q.strip())
+    if not prefix:
+        return []
+    try:
+        return await db.events.find(
+            {"title_search": {"$regex": "^" + re.escape(prefix)}}, {"_id": 0, "id": 1, "title": 1}
+        ).sort("title_search", 1).limit(AUTOCOMPLETE_LIMIT).to_list(AUTOCOMPLETE_LIMIT)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la recherche: {str(e)}")
+
+@app.post("/api/events", response_model=EventCreated)
 async def create_event(event: EventModel):
     try:
-        event_data = {
-            "id": str(uuid.uuid4()),
-            "title": event.title,
-            "description": event.description,
-            "date": event.date,
-            "time": event.time,
-            "image_url": event.image_url,
-            "price": event.price,
-            "category": event.category,
-            "created_at": datetime.now().isoformat()
-        }
-        
+        event_data = build_event_document(event)
         await db.events.insert_one(event_data)
+        events_changed()
+        if event_data["image_url"]:
+            image_cache.schedule(event_data["id"], event_data["image_url"])
         # Remove the MongoDB _id field if it exists before returning
         event_data.pop('_id', None)
         return {"success": True, "event": event_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création de l'événement: {str(e)}")
 
-@app.post("/api/newsletter/subscribe")
+@app.post("/api/events/bulk")
+async def import_events(request: Request):
+    try:
+        report = await bulk_ingest(request, EventModel, write_events_batch)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'import des événements: {str(e)}")
+    finally:
+        events_changed()
+    return report
+
+@app.post("/api/newsletter/subscribe", response_model=MessageResponse)
 async def subscribe_newsletter(subscription: NewsletterSubscription):
     try:
-        # Check if email already exists
-        existing = await db.newsletter.find_one({"email": subscription.email})
-        if existing:
+        subscription_data = build_subscription_document(subscription)
+        # Buffered writes can't tell an existing subscriber apart, both get the welcome message
+        if write_behind.add("newsletter", "upsert", subscription_data):
+            return {"success": True, "message": "Merci pour votre inscription à notre newsletter !"}
+        # Single round trip: the unique index on email makes the upsert race-free
+        try:
+            result = await db.newsletter.update_one(
+                {"email": subscription.email},
+                {"$setOnInsert": subscription_data},
+                upsert=True
+            )
+            created = result.upserted_id is not None
+        except DuplicateKeyError:
+            created = False
+        if not created:
             return {"success": True, "message": "Vous êtes déjà abonné à notre newsletter !"}
+        await record_subscribers([subscription_data])
         
-        subscription_data = {
-            "id": str(uuid.uuid4()),
-            "email": subscription.email,
-            "name": subscription.name,
-            "subscribed_at": datetime.now().isoformat(),
-            "active": True
-        }
-        
-        await db.newsletter.insert_one(subscription_data)
         return {"success": True, "message": "Merci pour votre inscription à notre newsletter !"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur d'inscription: {str(e)}")
 
-@app.post("/api/contact")
+@app.post("/api/newsletter/bulk")
+async def import_newsletter(request: Request):
+    try:
+        return await bulk_ingest(request, NewsletterSubscription, write_subscriptions_batch)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'import des abonnés: {str(e)}")
+
+@app.post("/api/contact", response_model=MessageResponse)
 async def send_contact_message(contact: ContactMessage):
     try:
         contact_data = {
             "id": str(uuid.uuid4()),
-            "name": contact.name,
-            "email": contact.email,
-            "subject": contact.subject,
-            "message": contact.message,
-            "sent_at": datetime.now().isoformat(),
+            **contact.model_dump(),
+            "sent_at": utcnow(),
             "status": "new"
         }
         
-        await db.contact_messages.insert_one(contact_data)
+        if not write_behind.add("contact_messages", "insert", contact_data):
+            await db.contact_messages.insert_one(contact_data)
+            await record_contact_messages(1)
+        if CONTACT_NOTIFY_EMAIL:
+            await mail_queue.enqueue(
+                CONTACT_NOTIFY_EMAIL,
+                f"Nouveau message : {contact_data['subject']}",
+                f"De : {contact_data['name']} <{contact_data['email']}>\n\n{contact_data['message']}"
+            )
         return {"success": True, "message": "Votre message a été envoyé avec succès ! Nous vous répondrons rapidement."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'envoi: {str(e)}")
 
+@app.get("/api/contact/search", response_model=ContactSearchResults, response_model_exclude_none=True)
+async def search_contact_messages(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[str] = None,
+):
+    require_staff(request)
+    filters = {"status": status} if status else {}
+    try:
+        messages, next_offset = await text_search(db.contact_messages, q, filters, offset, limit, {"_id": 0})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la recherche: {str(e)}")
+    return {"messages": messages, "next_offset": next_offset}
+
+@app.get("/api/export/{collection}")
+async def export_collection(
+    collection: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=10000),
+):
+    if collection not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Export inconnu")
+    if collection in STAFF_EXPORTS:
+        require_staff(request)
+    field, kind, columns = EXPORTS[collection]
+    query = export_filter(field, kind, date_from, date_to)
+    # The cursor pulls batch_size documents per round trip and the generators
+    # flush per batch, so memory stays flat whatever the collection size
+    cursor = db[collection].find(query, {"_id": 0}).batch_size(batch_size)
+    filename = f"{collection}-{datetime.now().strftime('%Y%m%d')}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "csv":
+        return StreamingResponse(export_csv(cursor, columns, batch_size), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(export_ndjson(cursor, batch_size), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/api/health/deep")
+async def deep_health_check():
+    started = monotonic()
+    try:
+        await client.admin.command("ping")
+        mongo = {"status": "up", "ping_ms": round((monotonic() - started) * 1000, 2)}
+    except Exception as e:
+        mongo = {"status": "down", "error": str(e)}
+    body = {
+        "status": "healthy" if mongo["status"] == "up" else "unhealthy",
+        "service": "L'envers API",
+        "mongo": mongo,
+        "pool": mongo_pool_stats.stats(),
+        "events_cache": events_cache.stats(),
+        "mail_queue": mail_queue.stats(),
+        "image_cache": image_cache.stats()
+    }
+    if mongo["status"] != "up":
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    mail_stats = mail_queue.stats()
+    pool_stats = mongo_pool_stats.stats()
+    return metrics.render({
+        "lenvers_events_cache_hits_total": events_cache.hits,
+        "lenvers_events_cache_misses_total": events_cache.misses,
+        "lenvers_rate_limited_total": rate_limiter.rejected,
+        "lenvers_mail_queue_depth": mail_stats["queued"],
+        "lenvers_mail_sent_total": mail_stats["sent"],
+        "lenvers_mail_failed_total": mail_stats["failed"],
+        "lenvers_mongo_pool_open_connections": pool_stats["open"],
+        "lenvers_mongo_pool_in_use_connections": pool_stats["in_use"],
+        "lenvers_mongo_pool_checkout_failures_total": pool_stats["checkout_failures"],
+    })
+
+@app.get("/api/images/{event_id}/{width}")
+async def get_event_image(event_id: str, width: int, request: Request):
+    if not image_cache.valid_event_id(event_id) or width < 1:
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    width = image_cache.pick_width(width)
+    fmt = image_cache.pick_format(request.headers.get("accept", ""))
+    await image_cache.ensure_loaded()
+    path = image_cache.lookup(event_id, width, fmt)
+    if path is None:
+        # Not processed yet, evicted or failing: the original is shown meanwhile
+        # and the variants are built in the background, never in the request
+        url = image_cache.failed_source(event_id)
+        if url is None:
+            event = await db.events.find_one({"id": event_id}, {"_id": 0, "image_url": 1})
+            if not event or not event.get("image_url"):
+                raise HTTPException(status_code=404, detail="Image introuvable")
+            url = event["image_url"]
+            image_cache.schedule(event_id, url)
+        # image_url comes from a public form, only hosts the cache would fetch from are redirected to
+        if not await image_cache.redirect_allowed(url):
+            raise HTTPException(status_code=404, detail="Image introuvable")
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": IMAGE_FALLBACK_CACHE_CONTROL})
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Cache-Control": IMAGE_CACHE_CONTROL, "Vary": "Accept"}
+    )
+
+@app.get("/api/live/{collection}")
+async def live_updates(collection: str, request: Request):
+    feed = change_feeds.get(collection)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Flux inconnu")
+    if collection not in LIVE_PUBLIC_COLLECTIONS:
+        # EventSource can't set headers, staff clients read the stream with fetch
+        require_staff(request)
+    if not LIVE_UPDATES_ENABLED or feed.unsupported:
+        raise HTTPException(status_code=503, detail="Mises à jour en direct indisponibles")
+    queue = feed.subscribe(request.headers.get("last-event-id"))
+    return StreamingResponse(
+        stream_changes(request, feed, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Startup coordination
+# Workers share the database, so index setup and seeding run under a lease in
+# db.leases: the first worker takes it, the others skip that part. The lease
+# expires on its own if its holder dies halfway.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+async def acquire_lease(name: str, ttl: float) -> bool:
+    now = utcnow()
+    try:
+        # Matches only an expired lease, a live one makes the upsert collide on _id
+        await db.leases.find_one_and_update(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_lease(name: str):
+    await db.leases.delete_one({"_id": name, "owner": WORKER_ID})
+
 # Initialize some sample events
-@app.on_event("startup")
-async def startup_event():
-    # Create some sample events if none exist
-    event_count = await db.events.count_documents({})
-    if event_count == 0:
-        sample_events = [
+async def seed_sample_events():
+    # find_one stops at the first document, count_documents would scan them all
+    if await db.events.find_one({}, {"_id": 1}) is None:
+        sample_events = [build_event_document(EventModel(**event)) for event in [
             {
-                "id": str(uuid.uuid4()),
                 "title": "Soirée Jazz & Cocktails",
                 "description": "Une soirée intimiste avec les meilleurs musiciens de jazz de la région. Ambiance feutrée et cocktails d'exception.",
                 "date": "2025-02-15",
                 "time": "20:00",
                 "image_url": "https://images.unsplash.com/photo-1571950006119-9f047f9d27b9?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Njd8MHwxfHNlYXJjaHwyfHxhcnRpc3RpYyUyMGJhcnxlbnwwfHx8fDE3NTI5MTc2NDd8MA&ixlib=rb-4.1.0&q=85",
                 "price": "Entrée libre",
-                "category": "Concert",
-                "created_at": datetime.now().isoformat()
+                "category": "Concert"
             },
             {
-                "id": str(uuid.uuid4()),
                 "title": "Exposition Art Local",
                 "description": "Découvrez les œuvres d'artistes locaux d'Aubagne et des environs. Vernissage avec animations et dégustations.",
                 "date": "2025-02-20",
                 "time": "18:30",
                 "image_url": "https://images.unsplash.com/photo-1600007525237-3ffb936cd20f?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Njd8MHwxfHNlYXJjaHwxfHxhcnRpc3RpYyUyMGJhcnxlbnwwfHx8fDE3NTI5MTc2NDd8MA&ixlib=rb-4.1.0&q=85",
                 "price": "Entrée libre",
-                "category": "Exposition",
-                "created_at": datetime.now().isoformat()
+                "category": "Exposition"
             },
             {
-                "id": str(uuid.uuid4()),
                 "title": "Soirée DJ Set Electro",
                 "description": "Une soirée électro avec les meilleurs DJ de la scène underground marseillaise. Dancefloor jusqu'au bout de la nuit !",
                 "date": "2025-02-28",
                 "time": "21:00",
                 "image_url": "https://images.unsplash.com/photo-1636067017589-269088431994?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NDQ2MzR8MHwxfHNlYXJjaHwzfHxhbHRlcm5hdGl2ZSUyMGJhcnxlbnwwfHx8fDE3NTI5MTc2MzB8MA&ixlib=rb-4.1.0&q=85",
                 "price": "10€",
-                "category": "Soirée",
-                "created_at": datetime.now().isoformat()
+                "category": "Soirée"
             }
-        ]
+        ]]
         await db.events.insert_many(sample_events)
+        events_changed()
+        for event in sample_events:
+            image_cache.schedule(event["id"], event["image_url"])
+
+async def ensure_datetimes_migrated():
+    # Keyset paging compares created_at within one BSON type, legacy strings
+    # must be converted before serving. db.migrations skips the scan once done,
+    # a marker that predates a collection of DATETIME_MIGRATIONS runs it again.
+    done = await db.migrations.find_one({"_id": "datetimes"})
+    if done and set(DATETIME_MIGRATIONS) <= set(done["report"]):
+        return
+    report = await migrate_datetimes()
+    logger.info("Datetime migration: %s", report)
+    if not any(counts["skipped"] for counts in report.values()):
+        await db.migrations.replace_one(
+            {"_id": "datetimes"}, {"completed_at": utcnow(), "report": report}, upsert=True
+        )
+
+async def ensure_title_search_backfilled():
+    # Autocomplete only matches events with a folded title, run once per database
+    if await db.migrations.find_one({"_id": "title_search"}):
+        return
+    events = await backfill_title_search()
+    logger.info("Search titles backfilled for %d events", events)
+    await db.migrations.insert_one({"_id": "title_search", "completed_at": utcnow(), "events": events})
+
+async def setup_database():
+    if await acquire_lease("startup", STARTUP_LEASE_TTL):
+        try:
+            await ensure_indexes()
+            await ensure_datetimes_migrated()
+            await ensure_title_search_backfilled()
+            if SEED_SAMPLE_EVENTS:
+                await seed_sample_events()
+        finally:
+            await release_lease("startup")
+    else:
+        logger.info("Another worker is setting up the database, skipping")
+
+async def startup_event(database_ready: bool = True):
+    if not database_ready:
+        logger.warning("Skipping database setup, Mongo is unreachable")
+    elif not LEAN_RUNTIME:
+        await setup_database()
+    mail_queue.start()
+    await write_behind.start()
+    archiver.start()
+    # The events feed always runs so every worker drops its cache on changes
+    change_feeds["events"].start()
+
+async def shutdown_event():
+    # A failing step, e.g. the last write-behind flush, must not skip the others
+    steps = [
+        ("image cache", image_cache.stop),
+        ("archiver", archiver.stop),
+        ("write-behind buffer", write_behind.stop),
+        ("mail queue", mail_queue.stop),
+    ] + [(f"{name} live feed", feed.stop) for name, feed in change_feeds.items()]
+    for name, stop in steps:
+        try:
+            await stop()
+        except Exception as e:
+            logger.error("Stopping the %s failed: %s", name, e)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if SERVER_WORKERS > 1 and RATE_LIMIT_ENABLED and RATE_LIMIT_BACKEND != "mongo":
+        logger.warning("In-memory rate limits apply per worker, set RATE_LIMIT_BACKEND=mongo to share them")
+    # On SIGTERM uvicorn stops accepting, waits up to SHUTDOWN_TIMEOUT for
+    # in-flight requests, then runs the lifespan shutdown of each worker.
+    uvicorn.run(
+        "server:app",
+        app_dir=str(Path(__file__).parent),
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        timeout_graceful_shutdown=SHUTDOWN_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
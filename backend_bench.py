@@ -0,0 +1,886 @@
+#!/usr/bin/env python3
+"""
+Backend Benchmark Suite for L'envers Website
+Drives the API in-process through an ASGI transport and reports throughput,
+latency percentiles and allocations per endpoint.
+
+Usage:
+    python backend_bench.py routes --requests 500 --concurrency 50 --save baseline.json
+    python backend_bench.py routes --compare baseline.json
+    python backend_bench.py routes --only POST --with-mail
+    python backend_bench.py ratelimit
+    python backend_bench.py serialization
+    python backend_bench.py writebehind
+    python backend_bench.py compression
+    python backend_bench.py workers --mongo-url mongodb://localhost:27017 --workers 1 2 4
+    python backend_bench.py search --mongo-url mongodb://localhost:27017
+    python backend_bench.py coldstart --mongo-url mongodb://localhost:27017
+
+Runs against mongomock unless --mongo-url points at a real mongod. The
+routes suite covers every /api route; the two text search routes only run
+with --mongo-url, mongomock has no $text.
+Needs httpx and mongomock-motor (aiosmtpd for --with-mail).
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import shutil
+import signal
+import statistics
+import subprocess
+import tempfile
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from time import perf_counter, process_time, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import httpx
+import server
+
+
+def use_database(mongo_url=None):
+    """Point the server lifespan at a throwaway database"""
+    if mongo_url:
+        server.MONGO_URL = mongo_url
+        client = server.create_mongo_client()
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    server.MONGO_DB_NAME = f"lenvers_bench_{os.getpid()}"
+    server.create_mongo_client = lambda: client
+    # The sample events point at Unsplash, startup would schedule their downloads
+    server.SEED_SAMPLE_EVENTS = False
+    return client, client[server.MONGO_DB_NAME]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# Each scenario: name -> (method, path, request kwargs factory taking the request index)
+# Sent to the routes behind require_staff, bench_routes sets the matching STAFF_TOKEN
+STAFF_HEADERS = {"X-Staff-Token": "bench"}
+
+
+def route_scenarios(text_search=False):
+    slots = server.opening_slots()
+    scenarios = {
+        "GET /api/health": ("GET", "/api/health", lambda i: {}),
+        "GET /api/health/deep": ("GET", "/api/health/deep", lambda i: {}),
+        "GET /api/metrics": ("GET", "/api/metrics", lambda i: {}),
+        "GET /api/events": ("GET", "/api/events", lambda i: {}),
+        "GET /api/events?category": ("GET", "/api/events", lambda i: {"params": {"category": "Concert", "limit": 20}}),
+        # The homepage request, the hottest path
+        "GET /api/events/home": ("GET", "/api/events/home", lambda i: {}),
+        "GET /api/events/upcoming": ("GET", "/api/events/upcoming", lambda i: {"params": {"limit": 20}}),
+        "GET /api/events/autocomplete": ("GET", "/api/events/autocomplete", lambda i: {
+            "params": {"q": ("Be", "Con", "Soi", "Exp")[i % 4]},
+        }),
+        "POST /api/events": ("POST", "/api/events", lambda i: {"json": {
+            "title": f"Bench {i}",
+            "description": "Soirée de test pour le benchmark",
+            "date": "2026-06-%02d" % (i % 28 + 1),
+            "time": "20:00",
+            "category": "Concert",
+        }}),
+        "POST /api/events/bulk": ("POST", "/api/events/bulk", lambda i: {"json": [{
+            "title": f"Bulk {i}-{n}",
+            "description": "Import groupé",
+            "date": "2026-07-01",
+            "time": "21:00",
+            "category": "Soirée",
+        } for n in range(20)]}),
+        "GET /api/reservations": ("GET", "/api/reservations", lambda i: {"params": {"limit": 50}}),
+        # Spread bookings over many slots so capacity never rejects them
+        "POST /api/reservations": ("POST", "/api/reservations", lambda i: {"json": {
+            "name": "Bench",
+            "email": f"bench{i}@example.com",
+            "phone": "0600000000",
+            "date": "2026-%02d-%02d" % (i // len(slots) // 28 % 12 + 1, i // len(slots) % 28 + 1),
+            "time": slots[i % len(slots)],
+            "party_size": 2,
+        }}),
+        "POST /api/newsletter/subscribe": ("POST", "/api/newsletter/subscribe", lambda i: {"json": {
+            "email": f"bench{i % 200}@example.com",
+        }}),
+        "POST /api/newsletter/bulk": ("POST", "/api/newsletter/bulk", lambda i: {
+            "content": "\n".join(json.dumps({"email": f"bulk{i}-{n}@example.com"}) for n in range(20)),
+            "headers": {"content-type": "application/x-ndjson"},
+        }),
+        "POST /api/contact": ("POST", "/api/contact", lambda i: {"json": {
+            "name": "Bench",
+            "email": "bench@example.com",
+            "subject": "Benchmark",
+            "message": "Message de test",
+        }}),
+        "GET /api/export/reservations": ("GET", "/api/export/reservations", lambda i: {"params": {"format": "csv"}}),
+        "GET /api/export/contact_messages": ("GET", "/api/export/contact_messages", lambda i: {
+            "headers": STAFF_HEADERS,
+        }),
+        "GET /api/export/newsletter": ("GET", "/api/export/newsletter", lambda i: {"headers": STAFF_HEADERS}),
+        "GET /api/availability": ("GET", "/api/availability", lambda i: {"params": {"from": "2026-01-01"}}),
+        "GET /api/reservations/tonight": ("GET", "/api/reservations/tonight", lambda i: {
+            "params": {"date": "2026-01-%02d" % (i % 28 + 1)},
+        }),
+        "GET /api/reports/reservations": ("GET", "/api/reports/reservations", lambda i: {
+            "params": {"from": "2026-01-01", "to": "2026-03-31"},
+        }),
+        "GET /api/reports/newsletter": ("GET", "/api/reports/newsletter", lambda i: {}),
+        "GET /api/reports/contact": ("GET", "/api/reports/contact", lambda i: {}),
+        # A variant prepared by prepare_image, the file-serving path
+        "GET /api/images/{event_id}/{width}": ("GET", f"/api/images/{BENCH_IMAGE_EVENT}/480", lambda i: {
+            "headers": {"accept": "image/avif,image/webp,*/*"},
+        }),
+        # Subscribe, receive one change, disconnect; see bounded_live_feeds
+        "GET /api/live/{collection}": ("GET", "/api/live/reservations", lambda i: {"headers": STAFF_HEADERS}),
+    }
+    if text_search:
+        # $text needs a real mongod, mongomock answers 500
+        scenarios["GET /api/events/search"] = ("GET", "/api/events/search", lambda i: {
+            "params": {"q": ("concert", "soirée jazz", "exposition")[i % 3]},
+        })
+        scenarios["GET /api/contact/search"] = ("GET", "/api/contact/search", lambda i: {
+            "params": {"q": ("réservation", "concert", "privatisation")[i % 3], "status": "new"},
+            "headers": STAFF_HEADERS,
+        })
+    return scenarios
+
+
+BENCH_IMAGE_EVENT = "bench-image"
+
+
+def use_image_cache(directory):
+    """A fresh image cache reading a local source image, so no request leaves the machine"""
+    from images import ImageCache
+    from PIL import Image
+
+    source = os.path.join(directory, "source.jpg")
+    Image.new("RGB", (1600, 1000), (200, 40, 90)).save(source, "JPEG")
+    server.image_cache = ImageCache(
+        os.path.join(directory, "cache"), server.IMAGE_WIDTHS, server.IMAGE_FORMATS, server.IMAGE_QUALITY,
+        server.IMAGE_CACHE_MAX_BYTES, server.IMAGE_MAX_SOURCE_BYTES, server.IMAGE_FETCH_TIMEOUT,
+        server.IMAGE_WORKERS, local_root=directory, allowed_hosts=[], allow_remote=False,
+    )
+    return source
+
+
+async def prepare_image(source):
+    await server.db.events.insert_one({
+        "id": BENCH_IMAGE_EVENT, "title": "Bench image", "description": "Affiche", "date": "2026-06-01",
+        "time": "20:00", "category": "Concert", "image_url": source,
+    })
+    await server.image_cache.process(BENCH_IMAGE_EVENT, source)
+
+
+def bounded_live_feeds():
+    """Let each live request end after one change
+
+    The in-process transport returns a response once its body is complete,
+    so an open event stream would never come back. Every subscriber gets a
+    change and the end-of-stream marker, which times subscribing, framing
+    one event and unsubscribing."""
+    for feed in server.change_feeds.values():
+        def subscribe(last_event_id=None, feed=feed, subscribe=feed.subscribe):
+            queue = subscribe(last_event_id)
+            queue.put_nowait(("bench", b'{"operation":"insert","document":{"id":"bench"}}'))
+            queue.put_nowait(None)
+            return queue
+        feed.subscribe = subscribe
+
+
+async def run_scenario(client, method, path, make_kwargs, total, concurrency):
+    latencies = []
+    statuses = {}
+    next_index = iter(range(total))
+
+    async def worker():
+        for i in next_index:
+            started = perf_counter()
+            response = await client.request(method, path, **make_kwargs(i))
+            latencies.append(perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def measure_allocations(client, method, path, make_kwargs, samples):
+    """Peak traced memory and allocated blocks still alive per request"""
+    tracemalloc.start()
+    peaks = []
+    blocks = []
+    try:
+        for i in range(samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            await client.request(method, path, **make_kwargs(i))
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            after = tracemalloc.take_snapshot()
+            blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename")))
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kib": round(statistics.median(peaks) / 1024, 1),
+        "alloc_blocks": int(statistics.median(blocks)),
+    }
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_smtp_stand_in():
+    from aiosmtpd.controller import Controller
+
+    class Sink:
+        async def handle_DATA(self, smtp_server, session, envelope):
+            return "250 OK"
+
+    port = free_port()
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port)
+    controller.start()
+    server.SMTP_HOST = "127.0.0.1"
+    server.SMTP_PORT = port
+    server.SMTP_STARTTLS = False
+    return controller
+
+
+async def bench_routes(args):
+    mongo_client, database = use_database(args.mongo_url)
+    # Every scenario hammers from one client, keep the limiter out of the numbers
+    server.RATE_LIMIT_ENABLED = False
+    server.STAFF_TOKEN = STAFF_HEADERS["X-Staff-Token"]
+    # The main pass never sends mail, --with-mail compares both modes afterwards
+    server.SMTP_HOST = ""
+    scenarios = route_scenarios(text_search=bool(args.mongo_url))
+    if not args.mongo_url:
+        print("GET /api/events/search and GET /api/contact/search need --mongo-url, skipped\n")
+    if args.only:
+        scenarios = {name: scenario for name, scenario in scenarios.items() if args.only in name}
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    image_dir = tempfile.mkdtemp(prefix="lenvers_images_")
+    image_source = use_image_cache(image_dir)
+    bounded_live_feeds()
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            await prepare_image(image_source)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, (method, path, make_kwargs) in scenarios.items():
+                    # Warm up caches and code paths before measuring
+                    for i in range(min(args.warmup, args.requests)):
+                        await client.request(method, path, **make_kwargs(args.requests + i))
+                    result = await run_scenario(client, method, path, make_kwargs, args.requests, args.concurrency)
+                    if args.allocations:
+                        result.update(await measure_allocations(client, method, path, make_kwargs, args.allocations))
+                    results[name] = result
+                    print_result(name, result)
+                if args.with_mail:
+                    results.update(await compare_mail_delivery(client, scenarios, args))
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+        if args.mongo_url:
+            await mongo_client.drop_database(database.name)
+    return results
+
+
+# Routes that queue a mail: a booking confirmation, a staff notification
+MAIL_SCENARIOS = ("POST /api/reservations", "POST /api/contact")
+
+
+async def compare_mail_delivery(client, scenarios, args):
+    """p99 of the routes that queue a mail, with SMTP off and with delivery to a local sink"""
+    names = [name for name in MAIL_SCENARIOS if name in scenarios]
+    if not names:
+        return {}
+    controller = start_smtp_stand_in()
+    smtp_host = server.SMTP_HOST
+    server.CONTACT_NOTIFY_EMAIL = "staff@example.com"
+    results = {}
+    print()
+    try:
+        for mode, host in (("without mail", ""), ("with mail", smtp_host)):
+            # The queue starts its workers only while SMTP_HOST is set
+            await server.mail_queue.stop()
+            server.SMTP_HOST = host
+            server.mail_queue.start()
+            for name in names:
+                method, path, make_kwargs = scenarios[name]
+                # Same starting state in both modes: free slots, collections of the same size
+                for collection in ("reservations", "availability", "contact_messages", "mail_outbox"):
+                    await server.db[collection].delete_many({})
+                for i in range(min(args.warmup, args.requests)):
+                    await client.request(method, path, **make_kwargs(args.requests + i))
+                result = await run_scenario(client, method, path, make_kwargs, args.requests, args.concurrency)
+                results[f"{name} ({mode})"] = result
+                print_result(f"{name} ({mode})", result)
+    finally:
+        await server.mail_queue.stop()
+        server.SMTP_HOST = ""
+        controller.stop()
+    print("\np99 with outbox delivery against without")
+    for name in names:
+        without, with_mail = results[f"{name} (without mail)"]["p99_ms"], results[f"{name} (with mail)"]["p99_ms"]
+        print(f"  {name:<36} {without:>8.2f} ms -> {with_mail:>8.2f} ms  ({with_mail - without:+.2f} ms)")
+    return results
+
+
+async def bench_ratelimit(args):
+    """Cost of the token-bucket limiter, alone and on a real POST route"""
+    store = server.MemoryBucketStore(server.RATE_LIMIT_SHARDS, server.RATE_LIMIT_MAX_KEYS)
+    keys = [f"/api/contact|ip|10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}" for n in range(args.keys)]
+    started = perf_counter()
+    for i in range(args.operations):
+        await store.take(keys[i % args.keys], 1000000, 1.0)
+    per_take = (perf_counter() - started) / args.operations
+    print(f"MemoryBucketStore.take over {args.keys} keys: {per_take * 1e6:.2f} us/op")
+
+    use_database(None)
+    method, path, make_kwargs = route_scenarios()["POST /api/contact"]
+    modes = {
+        "limiter off": (False, "/api/contact:ip:1000000000/1"),
+        "limiter on, allowed": (True, "/api/contact:ip:1000000000/1,/api/contact:email:1000000000/1"),
+        "limiter on, rejected": (True, "/api/contact:ip:1/1000000000"),
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, (enabled, rules) in modes.items():
+                server.RATE_LIMIT_ENABLED = enabled
+                server.rate_limiter = server.RateLimiter(server.parse_rate_limits(rules), server.create_rate_limit_store())
+                # Same collection size for every mode, mongomock inserts slow down as it grows
+                await server.db.contact_messages.delete_many({})
+                for i in range(args.warmup):
+                    await client.request(method, path, **make_kwargs(i))
+                results[name] = await run_scenario(client, method, path, make_kwargs, args.requests, args.concurrency)
+                print_result(f"POST /api/contact ({name})", results[name])
+    overhead = results["limiter on, allowed"]["p50_ms"] - results["limiter off"]["p50_ms"]
+    print(f"\nLimiter overhead on allowed requests: {overhead:+.3f} ms at p50")
+    return {"take_us": round(per_take * 1e6, 3), "routes": results}
+
+
+async def bench_writebehind(args):
+    """Newsletter and contact throughput with direct writes and write-behind batching"""
+    mongo_client, database = use_database(args.mongo_url)
+    server.RATE_LIMIT_ENABLED = False
+    scenarios = {name: route_scenarios()[name] for name in ("POST /api/newsletter/subscribe", "POST /api/contact")}
+    # Every request subscribes a new address, repeated ones hit the cheaper "already subscribed" path
+    scenarios["POST /api/newsletter/subscribe"] = ("POST", "/api/newsletter/subscribe", lambda i: {"json": {
+        "email": f"writebehind{i}@example.com",
+    }})
+    spool_dir = tempfile.mkdtemp(prefix="lenvers_spool_")
+    modes = {
+        "direct": (False, "", False),
+        "write-behind": (True, "", False),
+        "write-behind + spool": (True, os.path.join(spool_dir, "spool.ndjson"), False),
+        "write-behind + spool + fsync": (True, os.path.join(spool_dir, "spool.ndjson"), True),
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        for mode, (enabled, spool, fsync) in modes.items():
+            server.WRITE_BEHIND_ENABLED = enabled
+            server.WRITE_BEHIND_FSYNC = fsync
+            server.write_behind = server.WriteBehindBuffer(spool)
+            async with server.app.router.lifespan_context(server.app):
+                await server.db.newsletter.delete_many({})
+                await server.db.contact_messages.delete_many({})
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    for name, (method, path, make_kwargs) in scenarios.items():
+                        label = f"{name} ({mode})"
+                        results[label] = await run_scenario(
+                            client, method, path, make_kwargs, args.requests, args.concurrency
+                        )
+                        print_result(label, results[label])
+            # The lifespan exit flushed the buffer, nothing may be missing
+            stored = await database.contact_messages.count_documents({})
+            if stored != args.requests:
+                print(f"  {mode}: {stored} of {args.requests} contact messages stored")
+    finally:
+        if args.mongo_url:
+            await mongo_client.drop_database(database.name)
+    return results
+
+
+def load_client(port, path, requests, concurrency):
+    """One load generator process, so the client side isn't the bottleneck"""
+    async def run():
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            return await run_scenario(client, "GET", path, lambda i: {}, requests, concurrency)
+    return asyncio.run(run())
+
+
+def wait_until_ready(port, timeout):
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start within {timeout:.0f} s")
+
+
+def bench_workers(args):
+    """Throughput of the production launcher per worker count, over real HTTP"""
+    database_name = f"lenvers_bench_{os.getpid()}"
+    results = {}
+    try:
+        for workers in args.workers:
+            port = free_port()
+            env = dict(
+                os.environ,
+                WEB_CONCURRENCY=str(workers),
+                SERVER_HOST="127.0.0.1",
+                SERVER_PORT=str(port),
+                MONGO_URL=args.mongo_url,
+                DB_NAME=database_name,
+                RATE_LIMIT_ENABLED="false",
+                SEED_SAMPLE_EVENTS="false",
+            )
+            process = subprocess.Popen(
+                [sys.executable, server.__file__], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_until_ready(port, args.startup_timeout)
+                per_client = args.requests // args.clients
+                with multiprocessing.Pool(args.clients) as pool:
+                    samples = pool.starmap(
+                        load_client, [(port, args.path, per_client, args.concurrency)] * args.clients
+                    )
+            finally:
+                # Same path as a deployment stop: SIGTERM, drain, lifespan shutdown
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=server.SHUTDOWN_TIMEOUT + 10)
+            result = {
+                "requests": per_client * args.clients,
+                "concurrency": args.concurrency * args.clients,
+                "throughput_rps": round(sum(sample["throughput_rps"] for sample in samples), 1),
+                "p50_ms": round(statistics.median(sample["p50_ms"] for sample in samples), 3),
+                "p95_ms": max(sample["p95_ms"] for sample in samples),
+                "p99_ms": max(sample["p99_ms"] for sample in samples),
+                "statuses": {},
+            }
+            for sample in samples:
+                for code, count in sample["statuses"].items():
+                    result["statuses"][code] = result["statuses"].get(code, 0) + count
+            results[workers] = result
+            print_result(f"GET {args.path} ({workers} workers)", result)
+    finally:
+        import pymongo
+        pymongo.MongoClient(args.mongo_url).drop_database(database_name)
+    base = results[args.workers[0]]["throughput_rps"]
+    for workers, result in results.items():
+        print(f"{workers:>3} workers: {result['throughput_rps'] / base:.2f}x the throughput of {args.workers[0]}")
+    return results
+
+
+def import_times(runs):
+    """Wall time of a fresh interpreter importing the server module"""
+    backend = os.path.dirname(server.__file__)
+    samples = []
+    for _ in range(runs):
+        started = perf_counter()
+        subprocess.run([sys.executable, "-c", "import server"], cwd=backend, check=True)
+        samples.append((perf_counter() - started) * 1000)
+    return samples
+
+
+def heaviest_imports(top):
+    """Top-level packages by cumulative import time, from -X importtime"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=os.path.dirname(server.__file__), check=True, capture_output=True, text=True,
+    ).stderr
+    packages = {}
+    for line in output.splitlines():
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # Only first-level entries, their cumulative time covers the submodules
+        if depth != 1 or not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(cumulative)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def time_to_health(args, lean, database_name):
+    """Launcher start to the first 200 from /api/health, over real HTTP"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY="1",
+        SERVER_HOST="127.0.0.1",
+        SERVER_PORT=str(port),
+        MONGO_URL=args.mongo_url,
+        DB_NAME=database_name,
+        LEAN_RUNTIME="true" if lean else "false",
+        SEED_SAMPLE_EVENTS="false",
+    )
+    started = perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, server.__file__], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_ready(port, args.startup_timeout)
+        return (perf_counter() - started) * 1000
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=server.SHUTDOWN_TIMEOUT + 10)
+
+
+def bench_coldstart(args):
+    """Import cost of the API module and, with a mongod, time to the first healthy response"""
+    samples = import_times(args.runs)
+    results = {"import_ms": round(statistics.median(samples), 1)}
+    print(f"import server: median {results['import_ms']:.1f} ms, min {min(samples):.1f} ms over {args.runs} runs")
+    print("\nHeaviest imports (cumulative, first level):")
+    for name, microseconds in heaviest_imports(args.top):
+        print(f"  {name:<32} {microseconds / 1000:>8.1f} ms")
+    if args.mongo_url:
+        database_name = f"lenvers_bench_{os.getpid()}"
+        try:
+            for lean in (False, True):
+                mode = "lean" if lean else "full"
+                # The first run pays for index builds and migrations, the others find them in place
+                timings = [time_to_health(args, lean, database_name) for _ in range(args.runs)]
+                results[f"health_{mode}_ms"] = round(statistics.median(timings), 1)
+                print(f"first /api/health ({mode} startup): median {results[f'health_{mode}_ms']:.1f} ms, "
+                      f"first run {timings[0]:.1f} ms")
+        finally:
+            import pymongo
+            pymongo.MongoClient(args.mongo_url).drop_database(database_name)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"created_at": datetime.now().isoformat(), "python": platform.python_version(),
+                       "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(f"\nComparison with {args.compare}")
+        for name, value in results.items():
+            if name in baseline:
+                print(f"  {name:<20} {baseline[name]:>8.1f} -> {value:>8.1f} ms ({(value - baseline[name]) / baseline[name] * 100:+.1f}%)")
+    return results
+
+
+def synthetic_events(count):
+    return [{
+        "id": f"00000000-0000-4000-8000-{n:012d}",
+        "title": f"Soirée Jazz & Cocktails n°{n}",
+        "description": "Une soirée intimiste avec les meilleurs musiciens de jazz de la région. "
+                       "Ambiance feutrée et cocktails d'exception. " * 3,
+        "date": "2026-02-%02d" % (n % 28 + 1),
+        "time": "20:00",
+        "image_url": "https://images.unsplash.com/photo-1571950006119-9f047f9d27b9?crop=entropy&cs=srgb&fm=jpg"
+                     "&ixid=M3w3NTY2Njd8MHwxfHNlYXJjaHwyfHxhcnRpc3RpYyUyMGJhcnxlbnwwfHx8fDE3NTI5MTc2NDd8MA&ixlib=rb-4.1.0&q=85",
+        "price": "Entrée libre",
+        "category": "Concert",
+        "start_at": datetime(2026, 2, n % 28 + 1, 19, 0),
+        "created_at": datetime(2026, 1, 15, 17, 42, 7, 123000),
+    } for n in range(count)]
+
+
+def bench_serialization(args):
+    """Previous jsonable_encoder + json path against orjson, full and projected"""
+    from fastapi.encoders import jsonable_encoder
+    import orjson
+
+    slim_fields = ("id", "title", "date", "time", "category", "created_at")
+    results = {}
+    for size in args.sizes:
+        events = synthetic_events(size)
+        slim = [{field: event[field] for field in slim_fields} for event in events]
+        variants = {
+            "json + jsonable_encoder": lambda: json.dumps(
+                jsonable_encoder({"events": events}), ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8"),
+            "orjson": lambda: orjson.dumps({"events": events}, option=server.ORJSON_OPTIONS),
+            "orjson, slim fields": lambda: orjson.dumps({"events": slim}, option=server.ORJSON_OPTIONS),
+        }
+        results[size] = {}
+        for name, serialize in variants.items():
+            payload = serialize()
+            started = perf_counter()
+            for _ in range(args.iterations):
+                serialize()
+            per_call = (perf_counter() - started) / args.iterations
+            results[size][name] = {"us_per_call": round(per_call * 1e6, 2), "bytes": len(payload)}
+            print(f"{size:>5} events  {name:<26} {per_call * 1e6:>10.2f} us  {len(payload):>9} bytes")
+    return results
+
+
+SEARCH_SUBJECTS = [
+    "Réservation anniversaire", "Privatisation de la salle", "Question sur le concert", "Allergies alimentaires",
+    "Objet oublié", "Proposition de partenariat", "Exposition d'artistes", "Soirée d'entreprise",
+]
+SEARCH_WORDS = (
+    "bonjour nous souhaiterions réserver une table pour samedi soir avec des amis merci de nous confirmer "
+    "la disponibilité terrasse intérieur groupe menu végétarien cocktails jazz électro vernissage artiste "
+    "musiciens scène décoration gâteau surprise été hiver accessibilité poussette parking horaires fermeture "
+    "facture devis traiteur boissons sans alcool noël mariage séminaire photographe"
+).split()
+
+
+def synthetic_messages(count, seed=42):
+    rng = random.Random(seed)
+    return [{
+        "id": f"00000000-0000-4000-9000-{n:012d}",
+        "name": rng.choice(["Camille", "Léa", "Hugo", "Inès", "Théo", "Chloé"]) + f" {n}",
+        "email": f"client{n}@example.com",
+        "subject": rng.choice(SEARCH_SUBJECTS),
+        "message": " ".join(rng.choices(SEARCH_WORDS, k=rng.randint(15, 60))),
+        "sent_at": datetime(2026, 1, n % 28 + 1, 12, 0, tzinfo=timezone.utc),
+        "status": rng.choice(["new", "new", "read", "answered"]),
+    } for n in range(count)]
+
+
+async def bench_search(args):
+    """Text-index search against an unindexed regex scan on a synthetic corpus"""
+    mongo_client, database = use_database(args.mongo_url)
+    server.RATE_LIMIT_ENABLED = False
+    queries = ["anniversaire", "privatisation", "végétarien", "concert jazz", "seminaire devis", "gateau surprise"]
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            started = perf_counter()
+            corpus = synthetic_messages(args.messages)
+            for offset in range(0, len(corpus), 5000):
+                await server.db.contact_messages.insert_many(corpus[offset:offset + 5000], ordered=False)
+            print(f"Inserted {args.messages} messages with the text index in {perf_counter() - started:.1f} s")
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for query in queries:
+                    def make_kwargs(i, query=query):
+                        return {"params": {"q": query, "limit": 20}}
+                    for i in range(args.warmup):
+                        await client.get("/api/contact/search", **make_kwargs(i))
+                    result = await run_scenario(
+                        client, "GET", "/api/contact/search", make_kwargs, args.requests, args.concurrency
+                    )
+                    results[f"$text {query}"] = result
+                    print_result(f"$text {query}", result)
+            # Baseline: what a search without the index costs, a case-insensitive regex over every document
+            for query in queries:
+                pattern = {"$regex": query.split()[0], "$options": "i"}
+                latencies = []
+                for _ in range(args.scans):
+                    started = perf_counter()
+                    await server.db.contact_messages.find(
+                        {"$or": [{"subject": pattern}, {"message": pattern}]}, {"_id": 0}
+                    ).limit(20).to_list(20)
+                    latencies.append(perf_counter() - started)
+                results[f"$regex {query}"] = {"p50_ms": round(percentile(latencies, 50) * 1000, 3)}
+                print(f"{'$regex ' + query:<36} p50 {results[f'$regex {query}']['p50_ms']:>8.2f} ms")
+    finally:
+        await mongo_client.drop_database(database.name)
+    return results
+
+
+async def bench_compression(args):
+    """Bytes on the wire and CPU per request for GET /api/events per encoding"""
+    use_database(None)
+    modes = {
+        "identity": ("identity", True),
+        "gzip": ("gzip", True),
+        "gzip, no cache": ("gzip", False),
+        "br": ("br", True),
+        "br, no cache": ("br", False),
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for size in args.sizes:
+                await server.db.events.delete_many({})
+                await server.db.events.insert_many(synthetic_events(size))
+                server.events_changed()
+                results[size] = {}
+                for name, (encoding, cached) in modes.items():
+                    entries = server.COMPRESSION_CACHE_ENTRIES if cached else 0
+                    server.compression_cache = server.CompressionCache(entries, server.COMPRESSION_CACHE_BYTES)
+                    headers = {"Accept-Encoding": encoding}
+                    params = {"limit": size}
+                    # The first request fills the events cache, and the compression cache when enabled
+                    response = await client.get("/api/events", params=params, headers=headers)
+                    wire_bytes = int(response.headers["content-length"])
+                    started_cpu = process_time()
+                    started = perf_counter()
+                    for _ in range(args.requests):
+                        await client.get("/api/events", params=params, headers=headers)
+                    cpu = (process_time() - started_cpu) / args.requests
+                    wall = (perf_counter() - started) / args.requests
+                    results[size][name] = {
+                        "bytes": wire_bytes,
+                        "cpu_us": round(cpu * 1e6, 1),
+                        "wall_us": round(wall * 1e6, 1),
+                        "encoding": response.headers.get("content-encoding", "identity"),
+                    }
+                    print(
+                        f"{size:>5} events  {name:<16} {wire_bytes:>9} bytes  "
+                        f"cpu {cpu * 1e6:>9.1f} us  wall {wall * 1e6:>9.1f} us"
+                    )
+    return results
+
+
+def print_result(name, result):
+    allocations = ""
+    if "alloc_peak_kib" in result:
+        allocations = f"  peak {result['alloc_peak_kib']:>8.1f} KiB  blocks {result['alloc_blocks']:>6}"
+    print(
+        f"{name:<36} {result['throughput_rps']:>9.1f} req/s"
+        f"  p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms"
+        f"{allocations}  {result['statuses']}"
+    )
+
+
+def compare(results, baseline_path, tolerance):
+    """Print deltas against a saved baseline, returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (tolerance {tolerance:.0f}%)")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"  {name:<36} new endpoint")
+            continue
+        p95_delta = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        rps_delta = (result["throughput_rps"] - previous["throughput_rps"]) / previous["throughput_rps"] * 100
+        regressed = p95_delta > tolerance or rps_delta < -tolerance
+        regressions += regressed
+        print(f"  {name:<36} p95 {p95_delta:+7.1f}%  throughput {rps_delta:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def save(results, path, args):
+    payload = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": "mongod" if args.mongo_url else "mongomock",
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "with_mail": args.with_mail},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    print(f"\nBaseline saved to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="L'envers API benchmarks")
+    subparsers = parser.add_subparsers(dest="suite", required=True)
+
+    routes = subparsers.add_parser(
+        "routes", help="throughput and latency for every /api route, the search routes need --mongo-url"
+    )
+    routes.add_argument("--requests", type=int, default=300, help="requests per endpoint")
+    routes.add_argument("--concurrency", type=int, default=32)
+    routes.add_argument("--warmup", type=int, default=10)
+    routes.add_argument("--allocations", type=int, default=20, help="requests sampled under tracemalloc, 0 to skip")
+    routes.add_argument("--only", help="only endpoints whose name contains this string")
+    routes.add_argument("--mongo-url", help="benchmark against a real mongod instead of mongomock")
+    routes.add_argument(
+        "--with-mail", action="store_true",
+        help="also time the mail-sending routes with delivery to a local aiosmtpd sink, against SMTP off"
+    )
+    routes.add_argument("--save", help="write results as a JSON baseline")
+    routes.add_argument("--compare", help="baseline JSON to compare against")
+    routes.add_argument("--tolerance", type=float, default=20.0, help="allowed p95/throughput drift in percent")
+
+    ratelimit = subparsers.add_parser("ratelimit", help="overhead of the rate limiter per request")
+    ratelimit.add_argument("--operations", type=int, default=200000, help="store operations for the raw measurement")
+    ratelimit.add_argument("--keys", type=int, default=10000, help="distinct client keys")
+    ratelimit.add_argument("--requests", type=int, default=500)
+    ratelimit.add_argument("--concurrency", type=int, default=32)
+    ratelimit.add_argument("--warmup", type=int, default=10)
+
+    serialization = subparsers.add_parser("serialization", help="events list serialization time and size")
+    serialization.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    serialization.add_argument("--iterations", type=int, default=500)
+
+    writebehind = subparsers.add_parser("writebehind", help="submission throughput with and without write-behind")
+    writebehind.add_argument("--requests", type=int, default=1000, help="requests per endpoint and mode")
+    writebehind.add_argument("--concurrency", type=int, default=32)
+    writebehind.add_argument("--mongo-url", help="benchmark against a real mongod instead of mongomock")
+
+    compression = subparsers.add_parser("compression", help="GET /api/events bytes and CPU per encoding")
+    compression.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    compression.add_argument("--requests", type=int, default=200, help="requests per size and encoding")
+
+    workers = subparsers.add_parser("workers", help="throughput scaling with the worker count, needs a mongod")
+    workers.add_argument("--mongo-url", required=True, help="workers are separate processes and can't share mongomock")
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    workers.add_argument("--path", default="/api/events")
+    workers.add_argument("--requests", type=int, default=4000, help="total requests per worker count")
+    workers.add_argument("--clients", type=int, default=4, help="load generator processes")
+    workers.add_argument("--concurrency", type=int, default=32, help="connections per load generator")
+    workers.add_argument("--startup-timeout", type=float, default=30.0)
+
+    search = subparsers.add_parser("search", help="contact message search on a synthetic corpus, needs a mongod")
+    search.add_argument("--mongo-url", required=True, help="text indexes are not supported by mongomock")
+    search.add_argument("--messages", type=int, default=100000)
+    search.add_argument("--requests", type=int, default=200, help="requests per query")
+    search.add_argument("--concurrency", type=int, default=16)
+    search.add_argument("--warmup", type=int, default=5)
+    search.add_argument("--scans", type=int, default=5, help="regex scans per query for the baseline")
+
+    coldstart = subparsers.add_parser("coldstart", help="import time and time to the first /api/health")
+    coldstart.add_argument("--runs", type=int, default=10)
+    coldstart.add_argument("--top", type=int, default=15, help="heaviest imports to list")
+    coldstart.add_argument("--mongo-url", help="also time a real launcher start, full and lean")
+    coldstart.add_argument("--startup-timeout", type=float, default=30.0)
+    coldstart.add_argument("--save", help="write results as a JSON baseline")
+    coldstart.add_argument("--compare", help="baseline JSON to compare against")
+
+    args = parser.parse_args()
+    if args.suite == "coldstart":
+        bench_coldstart(args)
+    elif args.suite == "workers":
+        bench_workers(args)
+    elif args.suite == "compression":
+        asyncio.run(bench_compression(args))
+    elif args.suite == "writebehind":
+        asyncio.run(bench_writebehind(args))
+    elif args.suite == "search":
+        asyncio.run(bench_search(args))
+    elif args.suite == "serialization":
+        bench_serialization(args)
+    elif args.suite == "ratelimit":
+        asyncio.run(bench_ratelimit(args))
+    elif args.suite == "routes":
+        results = asyncio.run(bench_routes(args))
+        if args.save:
+            save(results, args.save, args)
+        if args.compare and compare(results, args.compare, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
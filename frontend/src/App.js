@@ -1,6 +1,65 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 
+// crypto.randomUUID only exists on secure origins (https or localhost)
+const newIdempotencyKey = () => {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  const bytes = new Uint8Array(16);
+  if (window.crypto && window.crypto.getRandomValues) {
+    window.crypto.getRandomValues(bytes);
+  } else {
+    for (let i = 0; i < bytes.length; i++) bytes[i] = Math.floor(Math.random() * 256);
+  }
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
+// The key is created on first use and kept until the server gives a final answer
+const idempotencyKey = (ref) => {
+  if (ref.current === null) {
+    ref.current = newIdempotencyKey();
+  }
+  return ref.current;
+};
+
+// 5xx, 429 and the plain-text 409 sent while a first attempt with the same key
+// is still running are worth retrying as is; any other answer ends the key
+const isFinalAnswer = (response, data) => {
+  if (response.status >= 500 || response.status === 429) {
+    return false;
+  }
+  return !(response.status === 409 && data === null);
+};
+
+// Middleware answers (409 in progress, 422 key reuse) are plain text, not JSON
+const readBody = async (response) => {
+  const text = await response.text();
+  try {
+    return { data: JSON.parse(text), text };
+  } catch (error) {
+    return { data: null, text };
+  }
+};
+
+// FastAPI details are a string, an object with a message, or validation errors;
+// server errors keep the generic message, their detail is meant for logs
+const errorMessage = (response, data, text, fallback) => {
+  if (response.status >= 500) {
+    return fallback;
+  }
+  if (data === null) {
+    return text || fallback;
+  }
+  if (typeof data.detail === 'string') {
+    return data.detail;
+  }
+  return (data.detail && data.detail.message) || fallback;
+};
+
 const App = () => {
   const [currentSection, setCurrentSection] = useState('home');
   const [events, setEvents] = useState([]);
@@ -22,6 +81,12 @@ const App = () => {
   });
   const [loading, setLoading] = useState(false);
   const [message, setMessage] = useState('');
+  // Opening slots of the chosen day with their remaining seats, from /api/availability
+  const [slots, setSlots] = useState([]);
+  const availabilityDay = useRef('');
+  // Idempotency keys, kept across network retries so duplicates are dropped server-side
+  const reservationKey = useRef(null);
+  const contactKey = useRef(null);
 
   const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
@@ -29,9 +94,13 @@ const App = () => {
     fetchEvents();
   }, []);
 
+  useEffect(() => {
+    fetchAvailability(reservationForm.date);
+  }, [reservationForm.date]);
+
   const fetchEvents = async () => {
     try {
-      const response = await fetch(`${backendUrl}/api/events`);
+      const response = await fetch(`${backendUrl}/api/events/home`);
       const data = await response.json();
       setEvents(data.events || []);
     } catch (error) {
@@ -39,6 +108,26 @@ const App = () => {
     }
   };
 
+  const fetchAvailability = async (day) => {
+    availabilityDay.current = day;
+    if (!day) {
+      setSlots([]);
+      return;
+    }
+    try {
+      const response = await fetch(`${backendUrl}/api/availability?from=${day}&to=${day}`);
+      const data = await response.json();
+      // The date may have changed while this request was in flight
+      if (availabilityDay.current === day) {
+        setSlots(data.days && data.days.length ? data.days[0].slots : []);
+      }
+    } catch (error) {
+      if (availabilityDay.current === day) {
+        setSlots([]);
+      }
+    }
+  };
+
   const showMessage = (msg, type = 'success') => {
     setMessage({ text: msg, type });
     setTimeout(() => setMessage(''), 5000);
@@ -53,24 +142,35 @@ const App = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey(reservationKey),
         },
         body: JSON.stringify(reservationForm),
       });
+      const { data, text } = await readBody(response);
+      if (isFinalAnswer(response, data)) {
+        // The next submission is a new request
+        reservationKey.current = null;
+      }
 
-      const data = await response.json();
-      if (data.success) {
+      if (response.ok && data && data.success) {
         showMessage('Réservation confirmée ! Nous vous avons envoyé un email de confirmation.');
+        // The date stays selected, its slots now show the seats just taken
         setReservationForm({
           name: '',
           email: '',
           phone: '',
-          date: '',
+          date: reservationForm.date,
           time: '',
           party_size: 1,
           special_requests: ''
         });
+        fetchAvailability(reservationForm.date);
+      } else if (response.status === 409 && data && data.detail) {
+        const alternatives = (data.detail.alternatives || []).map((slot) => slot.time).join(', ');
+        showMessage(alternatives ? `${data.detail.message} ${alternatives}` : data.detail.message, 'error');
+        fetchAvailability(reservationForm.date);
       } else {
-        showMessage('Erreur lors de la réservation. Veuillez réessayer.', 'error');
+        showMessage(errorMessage(response, data, text, 'Erreur lors de la réservation. Veuillez réessayer.'), 'error');
       }
     } catch (error) {
       showMessage('Erreur de connexion. Veuillez réessayer.', 'error');
@@ -109,14 +209,20 @@ const App = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey(contactKey),
         },
         body: JSON.stringify(contactForm),
       });
+      const { data, text } = await readBody(response);
+      if (isFinalAnswer(response, data)) {
+        contactKey.current = null;
+      }
 
-      const data = await response.json();
-      if (data.success) {
+      if (response.ok && data && data.success) {
         showMessage('Votre message a été envoyé ! Nous vous répondrons rapidement.');
         setContactForm({ name: '', email: '', subject: '', message: '' });
+      } else {
+        showMessage(errorMessage(response, data, text, 'Erreur lors de l\'envoi.'), 'error');
       }
     } catch (error) {
       showMessage('Erreur lors de l\'envoi.', 'error');
@@ -318,7 +424,7 @@ const App = () => {
                 {event.image_url && (
                   <div 
                     className="h-48 bg-cover bg-center"
-                    style={{ backgroundImage: `url('${event.image_url}')` }}
+                    style={{ backgroundImage: `url('${backendUrl}/api/images/${event.id}/960')` }}
                   ></div>
                 )}
                 <div className="p-6">
@@ -448,18 +554,15 @@ const App = () => {
                     className="w-full px-4 py-3 bg-gray-700 text-white rounded-lg border border-gray-600 focus:border-amber-500 focus:outline-none"
                     required
                   >
-                    <option value="">Choisir...</option>
-                    <option value="17:00">17:00</option>
-                    <option value="17:30">17:30</option>
-                    <option value="18:00">18:00</option>
-                    <option value="18:30">18:30</option>
-                    <option value="19:00">19:00</option>
-                    <option value="19:30">19:30</option>
-                    <option value="20:00">20:00</option>
-                    <option value="20:30">20:30</option>
-                    <option value="21:00">21:00</option>
-                    <option value="21:30">21:30</option>
-                    <option value="22:00">22:00</option>
+                    <option value="">{reservationForm.date ? 'Choisir...' : "Choisissez d'abord une date"}</option>
+                    {slots.map(({ time, remaining }) => {
+                      const full = remaining < reservationForm.party_size;
+                      return (
+                        <option key={time} value={time} disabled={full}>
+                          {full ? `${time} (complet)` : time}
+                        </option>
+                      );
+                    })}
                   </select>
                 </div>
               </div>
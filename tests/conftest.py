@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+from zoneinfo import ZoneInfo
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def isolated_app(monkeypatch):
+    """An empty events cache and no rate limits, test_rate_limits turns them back on"""
+    monkeypatch.setattr(server, "events_cache", server.TTLCache(60))
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", False)
+
+
+@pytest.fixture
+def far_venue(monkeypatch):
+    # Far enough from any server zone that its calendar day differs most of the time
+    zone = ZoneInfo("Pacific/Kiritimati")
+    monkeypatch.setattr(server, "VENUE_ZONE", zone)
+    return zone
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["lenvers_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+@pytest.fixture
+def api(db):
+    """Sends one request through the full middleware stack, without the lifespan"""
+    def send(method, path, **kwargs):
+        async def run():
+            transport = httpx.ASGITransport(app=server.app, client=kwargs.pop("client", ("127.0.0.1", 123)))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, path, **kwargs)
+        return asyncio.run(run())
+    return send
+
+
+@pytest.fixture
+def staff(monkeypatch):
+    """Headers that pass require_staff"""
+    monkeypatch.setattr(server, "STAFF_TOKEN", "staff-secret")
+    return {"X-Staff-Token": "staff-secret"}
@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(server, "ARCHIVE_BATCH_SIZE", 2)
+    monkeypatch.setattr(server, "ARCHIVE_PAUSE", 0)
+    monkeypatch.setattr(server, "ARCHIVE_TARGET", "collection")
+
+
+def days_ago(days):
+    return (server.venue_today() - timedelta(days=days)).isoformat()
+
+
+@pytest.fixture
+def history(db):
+    cutoff = server.ARCHIVE_RESERVATIONS_AFTER_DAYS
+    reservations = [
+        {"id": f"old-{n}", "date": days_ago(cutoff + 1 + n), "time": "20:00", "status": "confirmed"} for n in range(5)
+    ] + [
+        {"id": "boundary", "date": days_ago(cutoff), "time": "20:00", "status": "confirmed"},
+        {"id": "recent", "date": days_ago(1), "time": "20:00", "status": "confirmed"},
+    ]
+    asyncio.run(db.reservations.insert_many(reservations))
+    old = server.local_datetime(days_ago(server.ARCHIVE_CONTACT_AFTER_DAYS + 1), "23:59")
+    asyncio.run(db.contact_messages.insert_many([
+        {"id": "answered", "status": "answered", "sent_at": old},
+        {"id": "unread", "status": "new", "sent_at": old},
+        {"id": "on-cutoff-day", "status": "answered",
+         "sent_at": server.local_datetime(days_ago(server.ARCHIVE_CONTACT_AFTER_DAYS), "00:00")},
+        {"id": "fresh", "status": "read", "sent_at": server.local_datetime(days_ago(1), "10:00")},
+    ]))
+    return reservations
+
+
+def live_ids(db, collection_name):
+    return sorted(doc["id"] for doc in asyncio.run(db[collection_name].find().to_list(None)))
+
+
+def test_only_rows_older_than_the_cutoff_are_moved(db, history):
+    moved = asyncio.run(server.archiver.run())
+    assert moved == {"reservations": 5, "contact_messages": 1}
+    assert live_ids(db, "reservations") == ["boundary", "recent"]
+    assert live_ids(db, "reservations_archive") == [f"old-{n}" for n in range(5)]
+    assert live_ids(db, "contact_messages") == ["fresh", "on-cutoff-day", "unread"]
+    assert live_ids(db, "contact_messages_archive") == ["answered"]
+    assert all(doc["archived_at"] for doc in asyncio.run(db.reservations_archive.find().to_list(None)))
+
+
+class InterruptedDelete:
+    """Fails the delete of the second batch, after its copy was written"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.deletes = 0
+
+    async def delete_many(self, filter):
+        self.deletes += 1
+        if self.deletes == 2:
+            raise ConnectionError("connection lost")
+        return await self.collection.delete_many(filter)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class InterruptedDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.reservations = InterruptedDelete(database.reservations)
+
+    def __getitem__(self, name):
+        return self.reservations if name == "reservations" else self.database[name]
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+
+def test_interrupted_batch_loses_nothing_and_reruns_cleanly(db, history, monkeypatch):
+    filters = server.archiver.criteria()["reservations"]
+    monkeypatch.setattr(server, "db", InterruptedDatabase(db))
+    with pytest.raises(ConnectionError):
+        asyncio.run(server.archiver.archive("reservations", filters))
+    # The second batch is both live and archived, nothing is missing
+    live, archived = live_ids(db, "reservations"), live_ids(db, "reservations_archive")
+    assert sorted(set(live) | set(archived)) == sorted(doc["id"] for doc in history)
+    assert len(archived) == 4
+
+    monkeypatch.setattr(server, "db", db)
+    assert asyncio.run(server.archiver.archive("reservations", filters)) == 3
+    assert live_ids(db, "reservations") == ["boundary", "recent"]
+    assert live_ids(db, "reservations_archive") == [f"old-{n}" for n in range(5)]
+
+
+def test_file_target_writes_every_moved_row_once(db, history, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "ARCHIVE_TARGET", "files")
+    monkeypatch.setattr(server, "ARCHIVE_DIR", str(tmp_path))
+    asyncio.run(server.archiver.run())
+    archived = {}
+    for path in tmp_path.glob("*.ndjson.gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            archived[path.name.split("-")[0]] = sorted(json.loads(line)["id"] for line in archive)
+    assert archived == {"reservations": [f"old-{n}" for n in range(5)], "contact_messages": ["answered"]}
+    assert live_ids(db, "reservations") == ["boundary", "recent"]
+    assert "reservations_archive" not in asyncio.run(db.list_collection_names())
+
+
+def test_batches_walk_the_cutoff_field(db, history, monkeypatch):
+    # Inserted newest first, so _id order would pick old-0 and old-1
+    monkeypatch.setattr(server, "ARCHIVE_MAX_BATCHES", 1)
+    asyncio.run(server.archiver.archive("reservations", server.archiver.criteria()["reservations"]))
+    assert live_ids(db, "reservations_archive") == ["old-3", "old-4"]
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+
+def chunked(data, size):
+    async def stream():
+        for start in range(0, len(data), size):
+            yield data[start:start + size]
+    return stream()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 4096])
+def test_ndjson_split_inside_multibyte_characters(db, api, chunk_size):
+    lines = [{"email": f"abonné{n}@example.com", "name": f"Zoé Œuvre {n} €"} for n in range(5)]
+    body = ("\ufeff" + "\n".join(json.dumps(line, ensure_ascii=False) for line in lines)).encode("utf-8")
+    response = api("POST", "/api/newsletter/bulk", content=chunked(body, chunk_size),
+                   headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    names = sorted(subscriber["name"] for subscriber in asyncio.run(db.newsletter.find().to_list(None)))
+    assert names == sorted(line["name"] for line in lines)
+
+
+def test_csv_split_inside_multibyte_characters(db, api):
+    body = "email,name\nbérénice@example.com,Bérénice\nchloé@example.com,Chloé\n".encode("utf-8")
+    response = api("POST", "/api/newsletter/bulk", content=chunked(body, 3), headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    assert asyncio.run(db.newsletter.count_documents({})) == 2
+
+
+def test_invalid_utf8_is_a_client_error(api):
+    response = api("POST", "/api/newsletter/bulk", content=b'{"email": "caf\xe9@example.com"}\n',
+                   headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 400
+
+
+def test_oversized_body_is_refused_before_import(db, api, monkeypatch):
+    monkeypatch.setattr(server, "BULK_MAX_BYTES", 100)
+    body = json.dumps([{"email": f"abonne{n}@example.com"} for n in range(10)])
+    response = api("POST", "/api/newsletter/bulk", content=body, headers={"content-type": "application/json"})
+    assert response.status_code == 413
+    assert asyncio.run(db.newsletter.count_documents({})) == 0
+
+
+def test_streamed_body_is_capped_without_content_length(db, api, monkeypatch):
+    monkeypatch.setattr(server, "BULK_MAX_BYTES", 100)
+    body = "\n".join(json.dumps({"email": f"abonne{n}@example.com"}) for n in range(10)).encode("utf-8")
+    response = api("POST", "/api/newsletter/bulk", content=chunked(body, 16),
+                   headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
+
+
+def test_rows_past_the_cap_are_ignored(db, api, monkeypatch):
+    monkeypatch.setattr(server, "BULK_MAX_ROWS", 3)
+    body = "\n".join(json.dumps({"email": f"abonne{n}@example.com"}) for n in range(10))
+    response = api("POST", "/api/newsletter/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["rows"] == 3
+    assert not report["success"]
+    assert asyncio.run(db.newsletter.count_documents({})) == 3
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+
+async def booked_seats(db, day, slot):
+    document = await db.availability.find_one({"_id": day}) or {}
+    return document.get("slots", {}).get(slot, 0)
+
+
+@pytest.mark.parametrize("party_size", [1, 2, 3, 7])
+def test_concurrent_bookings_never_oversell(db, party_size):
+    async def run():
+        results = await asyncio.gather(*[
+            server.book_slot("2026-06-12", "20:00", party_size) for _ in range(3000)
+        ])
+        return results, await booked_seats(db, "2026-06-12", "20:00")
+
+    results, seats = asyncio.run(run())
+    assert seats <= server.SLOT_CAPACITY
+    assert seats == sum(results) * party_size
+    assert sum(results) == server.SLOT_CAPACITY // party_size
+
+
+def test_concurrent_bookings_spread_over_slots(db):
+    slots = server.opening_slots()
+
+    async def run():
+        results = await asyncio.gather(*[
+            server.book_slot("2026-06-13", slots[i % len(slots)], 4) for i in range(2000)
+        ])
+        return results, {slot: await booked_seats(db, "2026-06-13", slot) for slot in slots}
+
+    results, seats = asyncio.run(run())
+    assert all(booked <= server.SLOT_CAPACITY for booked in seats.values())
+    assert sum(results) * 4 == sum(seats.values())
+
+
+def test_oversized_party_is_rejected(db):
+    assert not asyncio.run(server.book_slot("2026-06-14", "20:00", server.SLOT_CAPACITY + 1))
+
+
+class RacingCollection:
+    """Lets another booking create the day document right before the first upsert lands"""
+
+    def __init__(self, collection, party_size):
+        self.collection = collection
+        self.party_size = party_size
+        self.raced = False
+
+    async def update_one(self, filter, update, upsert=False):
+        if not self.raced:
+            self.raced = True
+            await self.collection.update_one(
+                {"_id": filter["_id"]}, {"$inc": {"slots.20:00": self.party_size}}, upsert=True
+            )
+            # What a real mongod raises to the loser of two upserts on an empty day
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return await self.collection.update_one(filter, update, upsert=upsert)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RacingDatabase:
+    def __init__(self, database, party_size):
+        self.database = database
+        self.availability = RacingCollection(database.availability, party_size)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+
+def test_first_bookings_of_an_empty_day_both_succeed(db, monkeypatch):
+    monkeypatch.setattr(server, "db", RacingDatabase(db, 2))
+    assert asyncio.run(server.book_slot("2026-06-15", "20:00", 3))
+    assert asyncio.run(booked_seats(db, "2026-06-15", "20:00")) == 5
+
+
+def test_empty_day_race_still_respects_capacity(db, monkeypatch):
+    monkeypatch.setattr(server, "db", RacingDatabase(db, server.SLOT_CAPACITY - 1))
+    assert not asyncio.run(server.book_slot("2026-06-16", "20:00", 2))
+    assert asyncio.run(booked_seats(db, "2026-06-16", "20:00")) == server.SLOT_CAPACITY - 1
+
+
+@pytest.mark.parametrize("time", ["03:17", "20:01", "16:30", "22:30"])
+def test_reservation_outside_opening_slots_is_rejected(db, api, time):
+    response = api("POST", "/api/reservations", json={
+        "name": "Test", "email": "test@example.com", "phone": "0600000000",
+        "date": "2026-06-17", "time": time, "party_size": 2,
+    })
+    assert response.status_code == 422
+    assert asyncio.run(db.availability.find_one({"_id": "2026-06-17"})) is None
+
+
+def test_group_larger_than_a_slot_is_a_422(db, api):
+    response = api("POST", "/api/reservations", json={
+        "name": "Test", "email": "test@example.com", "phone": "0600000000",
+        "date": "2026-06-19", "time": "20:00", "party_size": server.SLOT_CAPACITY + 1,
+    })
+    assert response.status_code == 422
+    assert response.json()["detail"]["max_party_size"] == server.SLOT_CAPACITY
+    assert "groupes" in response.json()["detail"]["message"]
+    assert asyncio.run(db.availability.find_one({"_id": "2026-06-19"})) is None
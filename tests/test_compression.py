@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+
+import brotli
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(server, "compression_cache", server.CompressionCache(8, 1024 * 1024))
+
+
+@pytest.fixture
+def events(db):
+    # Well over COMPRESSION_MIN_SIZE once serialised
+    asyncio.run(db.events.insert_many([
+        {"id": f"e{n}", "title": f"Event {n}", "description": "Jazz " * 40, "date": "2026-06-01"} for n in range(10)
+    ]))
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("*, br;q=0", "gzip"),
+    ("identity", None),
+    ("", None),
+    ("gzip;q=oops", None),
+])
+def test_negotiation(accept_encoding, expected):
+    assert server.negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiation_skips_brotli_when_it_is_not_installed(monkeypatch):
+    monkeypatch.setattr(server, "brotli", None)
+    assert server.negotiate_encoding("br, gzip") == "gzip"
+    assert server.negotiate_encoding("br") is None
+
+
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)])
+def test_large_json_is_compressed(api, events, encoding, decompress):
+    plain = api("GET", "/api/events", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert int(plain.headers["content-length"]) >= server.COMPRESSION_MIN_SIZE
+
+    response = api("GET", "/api/events", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < int(plain.headers["content-length"])
+    # httpx decodes the body, both encodings carry the same payload
+    assert response.content == plain.content
+    assert decompress(server.compress(plain.content, encoding)) == plain.content
+
+
+def test_small_bodies_are_left_alone(api):
+    response = api("GET", "/api/events", headers={"Accept-Encoding": "gzip, br"})
+    assert len(response.content) < server.COMPRESSION_MIN_SIZE
+    assert "content-encoding" not in response.headers
+    # Still varies, a larger list under the same URL would be compressed
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_refused_encodings_get_identity(api, events):
+    response = api("GET", "/api/events", headers={"Accept-Encoding": "gzip;q=0, br;q=0"})
+    assert "content-encoding" not in response.headers
+
+
+def test_compressed_etag_is_weak_and_revalidates(api, events):
+    plain = api("GET", "/api/events", headers={"Accept-Encoding": "identity"})
+    compressed = api("GET", "/api/events", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["etag"] == f"W/{plain.headers['etag']}"
+
+    revalidated = api("GET", "/api/events", headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == compressed.headers["etag"]
+    # A strong tag from an identity response still matches, and stays strong for that client
+    revalidated = api("GET", "/api/events", headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == plain.headers["etag"]
+
+
+def test_tagged_bodies_are_compressed_once(api, events):
+    for _ in range(3):
+        api("GET", "/api/events", headers={"Accept-Encoding": "gzip"})
+    assert server.compression_cache.stats()["misses"] == 1
+    assert server.compression_cache.stats()["hits"] == 2
+
+
+def test_compression_can_be_disabled(api, events, monkeypatch):
+    monkeypatch.setattr(server, "COMPRESSION_ENABLED", False)
+    response = api("GET", "/api/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert not response.headers["etag"].startswith("W/")
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def legacy_reservations(db):
+    asyncio.run(db.reservations.insert_many([{
+        "id": f"legacy-{n}",
+        "name": "Ancien",
+        "email": f"ancien{n}@example.com",
+        "phone": "0600000000",
+        "date": "2024-03-%02d" % (n + 1),
+        "time": "20:00",
+        "party_size": 2,
+        "status": "confirmed",
+        "created_at": "2024-02-%02dT18:30:00" % (n + 1),
+    } for n in range(5)]))
+
+
+def test_setup_migrates_legacy_created_at(db, api, legacy_reservations, monkeypatch):
+    monkeypatch.setattr(server, "SEED_SAMPLE_EVENTS", False)
+    asyncio.run(server.setup_database())
+    ids, cursor = [], None
+    while True:
+        response = api("GET", "/api/reservations", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        ids += [reservation["id"] for reservation in page["reservations"]]
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    assert ids == [f"legacy-{n}" for n in reversed(range(5))]
+
+
+def test_migration_runs_once(db, legacy_reservations, monkeypatch):
+    monkeypatch.setattr(server, "SEED_SAMPLE_EVENTS", False)
+    asyncio.run(server.setup_database())
+    asyncio.run(db.reservations.update_one({"id": "legacy-0"}, {"$set": {"created_at": "2024-02-01T18:30:00"}}))
+    asyncio.run(server.setup_database())
+    # The marker skips the scan, manage.py migrate-datetimes still converts stragglers
+    assert asyncio.run(db.reservations.count_documents({"created_at": {"$type": "string"}})) == 1
+    assert asyncio.run(db.migrations.find_one({"_id": "datetimes"}))["report"]["reservations"]["migrated"] == 5
+
+
+def test_contact_sent_at_strings_are_migrated_after_an_older_marker(db, monkeypatch):
+    monkeypatch.setattr(server, "SEED_SAMPLE_EVENTS", False)
+    # Left by a deployment whose migration only covered reservations and events
+    asyncio.run(db.migrations.insert_one({"_id": "datetimes", "report": {
+        "reservations": {"migrated": 0, "skipped": 0}, "events": {"migrated": 0, "skipped": 0},
+    }}))
+    asyncio.run(db.contact_messages.insert_one({"id": "m1", "status": "new", "sent_at": "2024-02-01T18:30:00+01:00"}))
+    asyncio.run(server.setup_database())
+    message = asyncio.run(db.contact_messages.find_one({"id": "m1"}))
+    assert message["sent_at"] == datetime(2024, 2, 1, 17, 30)
+    assert asyncio.run(db.migrations.find_one({"_id": "datetimes"}))["report"]["contact_messages"]["migrated"] == 1
+
+
+def test_new_contact_messages_store_a_utc_datetime(db, api):
+    response = api("POST", "/api/contact", json={
+        "name": "Test", "email": "test@example.com", "subject": "Question", "message": "Bonjour",
+    })
+    assert response.status_code == 200
+    sent_at = asyncio.run(db.contact_messages.find_one({}))["sent_at"]
+    assert isinstance(sent_at, datetime)
+    assert abs(server.as_utc(sent_at) - server.utcnow()).total_seconds() < 60
+
+
+@pytest.fixture
+def server_zone(monkeypatch):
+    def use(zone):
+        monkeypatch.setenv("TZ", zone)
+        time.tzset()
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("zone, expected", [
+    ("UTC", datetime(2024, 2, 1, 18, 30, tzinfo=timezone.utc)),
+    ("America/New_York", datetime(2024, 2, 1, 23, 30, tzinfo=timezone.utc)),
+])
+def test_legacy_strings_are_read_in_the_server_zone(server_zone, monkeypatch, zone, expected):
+    # The baseline wrote datetime.now() of the server, not of the venue
+    monkeypatch.setattr(server, "VENUE_ZONE", ZoneInfo("Europe/Paris"))
+    server_zone(zone)
+    update = server.migrated_datetimes({"created_at": "2024-02-01T18:30:00", "start_at": None})
+    assert update == {"created_at": expected}
+
+
+def test_offset_aware_strings_keep_their_offset():
+    update = server.migrated_datetimes({"created_at": "2024-02-01T18:30:00+01:00", "start_at": None})
+    assert update["created_at"] == datetime(2024, 2, 1, 17, 30, tzinfo=timezone.utc)
@@ -0,0 +1,55 @@
+import json
+
+import server
+
+EVENT = {"title": "Concert", "description": "Jazz", "date": "2026-06-01", "time": "20:00", "category": "Concert"}
+
+
+def test_etag_revalidates_with_304(api):
+    api("POST", "/api/events", json=EVENT)
+    first = api("GET", "/api/events")
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == server.EVENTS_CACHE_CONTROL
+    etag = first.headers["etag"]
+    revalidated = api("GET", "/api/events", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    # Weakened by the compression middleware, the client got a gzip body
+    assert revalidated.headers["etag"] in (etag, f"W/{etag}")
+    assert revalidated.content == b""
+    assert api("GET", "/api/events", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_repeated_reads_are_served_from_memory(api):
+    api("GET", "/api/events")
+    api("GET", "/api/events")
+    api("GET", "/api/events", params={"category": "Concert"})
+    assert server.events_cache.stats()["hits"] == 1
+    assert server.events_cache.stats()["entries"] == 2
+
+
+def test_create_invalidates_the_cached_list(api):
+    before = api("GET", "/api/events")
+    assert before.json()["events"] == []
+    api("POST", "/api/events", json=EVENT)
+    after = api("GET", "/api/events", headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert [event["title"] for event in after.json()["events"]] == ["Concert"]
+    assert after.headers["etag"] != before.headers["etag"]
+
+
+def test_bulk_import_invalidates_the_cached_list(api):
+    api("GET", "/api/events")
+    body = json.dumps([{**EVENT, "title": f"Import {n}"} for n in range(3)])
+    api("POST", "/api/events/bulk", content=body, headers={"content-type": "application/json"})
+    assert len(api("GET", "/api/events").json()["events"]) == 3
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(server, "monotonic", lambda: now[0])
+    cache = server.TTLCache(10)
+    cache.set("key", "value")
+    now[0] += 9
+    assert cache.get("key") == "value"
+    now[0] += 2
+    assert cache.get("key") is None
@@ -0,0 +1,97 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+
+import server
+
+
+@pytest.fixture
+def messages(db):
+    asyncio.run(db.contact_messages.insert_many([
+        {"id": "1", "name": "=HYPERLINK(\"http://evil.example\")", "email": "a@example.com", "subject": "+33",
+         "message": "@SUM(A1)", "status": "new", "sent_at": "2026-01-01T10:00:00"},
+        {"id": "2", "name": "-2+3", "email": "b@example.com", "subject": "\tTab", "message": "\rRetour",
+         "status": "new", "sent_at": "2026-01-02T10:00:00"},
+        {"id": "3", "name": "Zoé", "email": "c@example.com", "subject": "Réservation", "message": "Bonjour",
+         "status": "new", "sent_at": "2026-01-03T10:00:00"},
+    ]))
+
+
+def csv_rows(response):
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+
+def test_formula_prefixes_are_neutralized(api, messages, staff):
+    response = api("GET", "/api/export/contact_messages", params={"format": "csv"}, headers=staff)
+    assert response.status_code == 200
+    rows = {row["id"]: row for row in csv_rows(response)}
+    assert rows["1"]["name"] == "'=HYPERLINK(\"http://evil.example\")"
+    assert rows["1"]["subject"] == "'+33"
+    assert rows["1"]["message"] == "'@SUM(A1)"
+    assert rows["2"]["name"] == "'-2+3"
+    assert rows["2"]["subject"] == "'\tTab"
+    assert rows["2"]["message"] == "'\rRetour"
+    assert rows["3"]["name"] == "Zoé"
+
+
+def test_private_exports_need_the_staff_token(api, messages, staff, monkeypatch):
+    for collection in ("contact_messages", "newsletter"):
+        assert api("GET", f"/api/export/{collection}").status_code == 403
+        assert api("GET", f"/api/export/{collection}", headers={"X-Staff-Token": "guess"}).status_code == 403
+        assert api("GET", f"/api/export/{collection}", headers=staff).status_code == 200
+    assert api("GET", "/api/export/reservations").status_code == 200
+    # Without a configured token the private exports are closed to everyone
+    monkeypatch.setattr(server, "STAFF_TOKEN", "")
+    assert api("GET", "/api/export/contact_messages", headers={"X-Staff-Token": ""}).status_code == 403
+
+
+def test_contact_date_filter_covers_whole_venue_days(api, db, staff):
+    # 23:30 UTC on January 4th is already January 5th in Paris
+    asyncio.run(db.contact_messages.insert_many([
+        {"id": "late", "status": "new", "sent_at": datetime(2026, 1, 4, 23, 30, tzinfo=timezone.utc)},
+        {"id": "day", "status": "new", "sent_at": datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)},
+        {"id": "next", "status": "new", "sent_at": datetime(2026, 1, 5, 23, 30, tzinfo=timezone.utc)},
+    ]))
+    response = api("GET", "/api/export/contact_messages", params={"date_from": "2026-01-05", "date_to": "2026-01-05"},
+                   headers=staff)
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [line["id"] for line in lines] == ["late", "day"]
+    assert lines[0]["sent_at"] == "2026-01-04T23:30:00Z"
+
+
+class FailingCursor:
+    """Yields one document then loses the connection"""
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        yield self.doc
+        raise ConnectionError("connection lost")
+
+
+def collect(generator):
+    async def run():
+        return [chunk async for chunk in generator]
+    return asyncio.run(run())
+
+
+def test_failed_csv_export_ends_with_an_error_line():
+    chunks = collect(server.export_csv(FailingCursor({"id": "1", "name": "Zoé"}), ["id", "name"], 500))
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[:2] == [["id", "name"], ["1", "Zoé"]]
+    assert rows[-1] == [f"# {server.EXPORT_FAILED}"]
+
+
+def test_failed_ndjson_export_ends_with_an_error_line():
+    chunks = collect(server.export_ndjson(FailingCursor({"id": "1"}), 500))
+    lines = b"".join(chunks).splitlines()
+    assert orjson.loads(lines[0]) == {"id": "1"}
+    assert orjson.loads(lines[-1]) == {"error": server.EXPORT_FAILED}
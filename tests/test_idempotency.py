@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import json
+from datetime import timedelta
+
+import pytest
+
+import server
+
+ORIGIN = {"Origin": "https://lenvers.example"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_store(monkeypatch):
+    monkeypatch.setattr(server, "idempotency_store", server.IdempotencyStore(100))
+
+
+def contact_body(message="Bonjour"):
+    return json.dumps({"name": "Test", "email": "test@example.com", "subject": "Question", "message": message})
+
+
+def contact(api, key, message="Bonjour"):
+    headers = {**ORIGIN, "Idempotency-Key": key, "Content-Type": "application/json"}
+    return api("POST", "/api/contact", headers=headers, content=contact_body(message))
+
+
+def test_replay_carries_cors_headers(api):
+    first = contact(api, "key-1")
+    replay = contact(api, "key-1")
+    assert first.status_code == replay.status_code == 200
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.headers["access-control-allow-origin"] == "*"
+    assert replay.json() == first.json()
+
+
+def test_fingerprint_mismatch_carries_cors_headers(api):
+    contact(api, "key-2")
+    response = contact(api, "key-2", message="Autre chose")
+    assert response.status_code == 422
+    assert response.headers["access-control-allow-origin"] == "*"
+
+
+def test_in_progress_claim_is_a_short_lease(db, api):
+    fingerprint = hashlib.sha256(contact_body().encode()).hexdigest()
+    asyncio.run(server.idempotency_store.claim("/api/contact:key-3", fingerprint))
+    claim = asyncio.run(db.idempotency_keys.find_one({"_id": "/api/contact:key-3"}))
+    assert server.as_utc(claim["expires_at"]) <= server.utcnow() + timedelta(seconds=server.IDEMPOTENCY_CLAIM_TTL)
+    response = contact(api, "key-3")
+    assert response.status_code == 409
+    assert response.headers["access-control-allow-origin"] == "*"
+
+
+def test_abandoned_claim_is_taken_over(db, api):
+    # What a worker that crashed mid-request leaves behind
+    asyncio.run(db.idempotency_keys.insert_one({
+        "_id": "/api/contact:key-4",
+        "status": "in_progress",
+        "fingerprint": "fingerprint",
+        "expires_at": server.utcnow() - timedelta(seconds=1),
+    }))
+    response = contact(api, "key-4")
+    assert response.status_code == 200
+    record = asyncio.run(db.idempotency_keys.find_one({"_id": "/api/contact:key-4"}))
+    assert record["status"] == "completed"
+    assert server.as_utc(record["expires_at"]) > server.utcnow() + timedelta(seconds=server.IDEMPOTENCY_TTL - 60)
+
+
+def test_replays_are_counted_under_their_route(api, monkeypatch):
+    monkeypatch.setattr(server, "metrics", server.Metrics())
+    contact(api, "key-5")
+    contact(api, "key-5")
+    assert server.metrics.requests[("POST", "/api/contact", 200)] == 2
@@ -0,0 +1,252 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+import server
+from images import ImageCache, ImageSourceRefused
+
+PUBLIC_ADDRESSES = {"images.unsplash.com": ["151.101.2.208"], "cdn.example.org": ["93.184.215.14"]}
+
+
+def source_image(width=1200, height=800):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 90)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    # IMAGE_LOCAL_ROOT for these tests
+    root = tmp_path / "fixtures"
+    root.mkdir()
+    (root / "affiche.jpg").write_bytes(source_image())
+    (root / "vignette.jpg").write_bytes(source_image(300, 200))
+    return root
+
+
+@pytest.fixture
+def cache(tmp_path, fixtures):
+    cache = ImageCache(
+        str(tmp_path / "cache"), [480, 960], ["webp"], 70, 50 * 1024 * 1024,
+        5 * 1024 * 1024, 5.0, 2, local_root=str(fixtures),
+        allowed_hosts=["images.unsplash.com", "cdn.example.org"],
+    )
+
+    async def resolve(host, port):
+        return PUBLIC_ADDRESSES.get(host, ["10.0.0.8"])
+    cache._resolve = resolve
+    return cache
+
+
+def test_local_fixture_is_rendered_into_every_variant(cache, fixtures):
+    asyncio.run(cache.process("evt-1", str(fixtures / "affiche.jpg")))
+    for width in (480, 960):
+        path = cache.lookup("evt-1", width, "webp")
+        assert path is not None
+        with Image.open(path) as variant:
+            assert variant.format == "WEBP"
+            assert variant.width == width
+    assert cache.stats()["files"] == 2
+
+
+def test_small_sources_are_not_upscaled(cache, fixtures):
+    asyncio.run(cache.process("evt-2", (fixtures / "vignette.jpg").as_uri()))
+    with Image.open(cache.lookup("evt-2", 960, "webp")) as variant:
+        assert variant.width == 300
+
+
+def test_local_file_outside_the_root_is_refused(cache, tmp_path):
+    (tmp_path / "secret.jpg").write_bytes(source_image())
+    with pytest.raises(ValueError):
+        asyncio.run(cache.process("evt-3", str(tmp_path / "secret.jpg")))
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8001/api/health",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://localhost/image.jpg",
+    "https://internal.example.org/image.jpg",
+    "ftp://images.unsplash.com/photo.jpg",
+])
+def test_disallowed_remote_sources_are_refused(cache, url):
+    with pytest.raises(ImageSourceRefused):
+        asyncio.run(cache.process("evt-4", url))
+
+
+def test_allowed_host_resolving_to_a_private_address_is_refused(cache, monkeypatch):
+    monkeypatch.setitem(PUBLIC_ADDRESSES, "cdn.example.org", ["192.168.1.20"])
+    with pytest.raises(ImageSourceRefused):
+        asyncio.run(cache.process("evt-5", "https://cdn.example.org/photo.jpg"))
+
+
+def test_offline_cache_refuses_every_remote_source(cache, fixtures):
+    cache.allow_remote = False
+    with pytest.raises(ImageSourceRefused):
+        asyncio.run(cache.process("evt-5", "https://images.unsplash.com/photo.jpg"))
+    # Local sources are still rendered
+    asyncio.run(cache.process("evt-5", str(fixtures / "affiche.jpg")))
+    assert cache.lookup("evt-5", 480, "webp") is not None
+
+
+def test_redirects_are_checked_on_every_hop(cache):
+    requested = []
+
+    def handler(request):
+        requested.append(request.headers["host"])
+        if request.headers["host"] == "images.unsplash.com":
+            return httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data/"})
+        return httpx.Response(200, content=source_image())
+    cache.transport = httpx.MockTransport(handler)
+    with pytest.raises(ImageSourceRefused):
+        asyncio.run(cache.process("evt-6", "https://images.unsplash.com/photo.jpg"))
+    assert requested == ["images.unsplash.com"]
+
+
+def test_redirect_between_allowed_hosts_is_followed(cache):
+    def handler(request):
+        if request.headers["host"] == "images.unsplash.com":
+            return httpx.Response(301, headers={"location": "https://cdn.example.org/photo.jpg"})
+        return httpx.Response(200, content=source_image())
+    cache.transport = httpx.MockTransport(handler)
+    asyncio.run(cache.process("evt-7", "https://images.unsplash.com/photo.jpg"))
+    assert cache.lookup("evt-7", 480, "webp") is not None
+
+
+def test_downloads_connect_to_the_checked_address(cache):
+    answers = iter([["151.101.2.208"], ["10.0.0.8"]])
+
+    async def resolve(host, port):
+        return next(answers)
+    cache._resolve = resolve
+    connections = []
+
+    def handler(request):
+        connections.append((request.url.host, request.headers["host"], request.extensions["sni_hostname"]))
+        return httpx.Response(200, content=source_image())
+    cache.transport = httpx.MockTransport(handler)
+    asyncio.run(cache.process("evt-14", "https://images.unsplash.com/photo.jpg"))
+    # A second lookup would now answer with a private address, the download never asks it
+    assert connections == [("151.101.2.208", "images.unsplash.com", "images.unsplash.com")]
+
+
+def test_one_run_per_event_at_a_time(cache):
+    running = []
+    overlaps = []
+
+    async def process_locked(event_id, url):
+        overlaps.append(len(running))
+        running.append(url)
+        await asyncio.sleep(0.01)
+        running.remove(url)
+    cache._process_locked = process_locked
+
+    async def run():
+        first = asyncio.create_task(cache.process("evt-15", "a"))
+        second = asyncio.create_task(cache.process("evt-15", "b"))
+        await first
+        # The second run was woken but doesn't hold the lock yet
+        await asyncio.gather(second, cache.process("evt-15", "c"))
+    asyncio.run(run())
+    assert overlaps == [0, 0, 0]
+    assert cache._locks == {}
+
+
+def unreachable(request):
+    raise httpx.ConnectError("unreachable", request=request)
+
+
+def test_failures_back_off_before_the_next_attempt(cache):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url)
+        return unreachable(request)
+    cache.transport = httpx.MockTransport(handler)
+    url = "https://images.unsplash.com/photo.jpg"
+
+    async def run():
+        cache.schedule("evt-8", url)
+        cache.schedule("evt-8", url)
+        await asyncio.gather(*cache._tasks)
+        # Still backing off, nothing is fetched again
+        cache.schedule("evt-8", url)
+        await asyncio.gather(*cache._tasks)
+    asyncio.run(run())
+    assert len(attempts) == 1
+    assert cache.failed_source("evt-8") == url
+    assert cache.stats()["failing"] == 1
+
+
+def test_backoff_doubles_up_to_the_maximum(cache):
+    cache.transport = httpx.MockTransport(unreachable)
+    cache.retry_base, cache.retry_max = 10, 25
+    delays = []
+    for _ in range(4):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(cache.process("evt-9", "https://images.unsplash.com/photo.jpg"))
+        delays.append(cache._failures["evt-9"][1])
+    assert delays == [10, 20, 25, 25]
+
+
+def test_success_clears_the_failure(cache, fixtures):
+    cache._failures["evt-10"] = (0, 60, str(fixtures / "affiche.jpg"))
+    asyncio.run(cache.process("evt-10", str(fixtures / "affiche.jpg")))
+    assert "evt-10" not in cache._failures
+
+
+def test_stop_cancels_background_work(cache):
+    async def run():
+        started = asyncio.Event()
+
+        async def hang(url):
+            started.set()
+            await asyncio.sleep(3600)
+        cache._fetch = hang
+        cache.schedule("evt-11", "https://images.unsplash.com/photo.jpg")
+        await started.wait()
+        await cache.stop()
+        return cache._tasks
+    assert not asyncio.run(run())
+
+
+@pytest.fixture
+def served_cache(cache, db, monkeypatch):
+    monkeypatch.setattr(server, "image_cache", cache)
+    asyncio.run(db.events.insert_one({"id": "evt-12", "image_url": "https://images.unsplash.com/photo.jpg"}))
+    return cache
+
+
+def test_missing_variant_redirects_and_schedules(served_cache, api, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(served_cache, "schedule", lambda event_id, url: scheduled.append((event_id, url)))
+    response = api("GET", "/api/images/evt-12/480")
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://images.unsplash.com/photo.jpg"
+    assert response.headers["cache-control"] == "public, max-age=60"
+    assert scheduled == [("evt-12", "https://images.unsplash.com/photo.jpg")]
+
+
+def test_failing_source_redirects_without_touching_the_database(served_cache, api, db):
+    served_cache._failures["evt-12"] = (float("inf"), 60, "https://images.unsplash.com/photo.jpg")
+    asyncio.run(db.events.delete_many({}))
+    response = api("GET", "/api/images/evt-12/480")
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://images.unsplash.com/photo.jpg"
+
+
+@pytest.mark.parametrize("image_url", [
+    "https://evil.example.com/photo.jpg",
+    "https://cdn.example.org/photo.jpg",
+    "javascript:alert(1)",
+])
+def test_fallback_only_redirects_to_fetchable_sources(served_cache, api, db, monkeypatch, image_url):
+    # cdn.example.org is allowed but now resolves to a private address
+    monkeypatch.setitem(PUBLIC_ADDRESSES, "cdn.example.org", ["192.168.1.20"])
+    monkeypatch.setattr(served_cache, "schedule", lambda event_id, url: None)
+    asyncio.run(db.events.update_one({"id": "evt-12"}, {"$set": {"image_url": image_url}}))
+    response = api("GET", "/api/images/evt-12/480")
+    assert response.status_code == 404
+    assert "location" not in response.headers
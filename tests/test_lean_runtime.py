@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import manage
+import server
+
+RESERVATION = {"name": "Test", "email": "test@example.com", "phone": "0600000000",
+               "date": "2030-06-12", "time": "20:00", "party_size": 2}
+
+
+@pytest.fixture
+def mock_mongo(monkeypatch):
+    client = AsyncMongoMockClient()
+
+    def open_database():
+        monkeypatch.setattr(server, "client", client)
+        monkeypatch.setattr(server, "db", client["lenvers_test"])
+
+    async def warm_up_pool():
+        pass
+    monkeypatch.setattr(server, "open_database", open_database)
+    monkeypatch.setattr(server, "warm_up_pool", warm_up_pool)
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+    return client["lenvers_test"]
+
+
+def test_lean_runtime_skips_setup_and_serves_requests(mock_mongo, monkeypatch):
+    monkeypatch.setattr(server, "LEAN_RUNTIME", True)
+
+    async def setup_database():
+        raise AssertionError("setup runs from manage.py under LEAN_RUNTIME")
+    monkeypatch.setattr(server, "setup_database", setup_database)
+
+    async def run():
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [
+                    await client.get("/api/health"),
+                    await client.post("/api/reservations", json=RESERVATION),
+                    await client.get("/api/reservations"),
+                    await client.get("/api/availability", params={"from": RESERVATION["date"], "to": RESERVATION["date"]}),
+                    await client.get("/api/events"),
+                ]
+
+    health, booked, listed, availability, events = asyncio.run(run())
+    assert health.status_code == 200
+    assert booked.status_code == 200, booked.text
+    assert [reservation["id"] for reservation in listed.json()["reservations"]] == [booked.json()["reservation_id"]]
+    assert availability.status_code == 200
+    [day] = availability.json()["days"]
+    assert day["date"] == RESERVATION["date"]
+    remaining = {slot["time"]: slot["remaining"] for slot in day["slots"]}
+    assert remaining[RESERVATION["time"]] == server.SLOT_CAPACITY - RESERVATION["party_size"]
+    # Nothing was seeded, no indexes were built
+    assert events.json()["events"] == []
+    assert asyncio.run(mock_mongo.leases.find_one({"_id": "startup"})) is None
+
+
+def test_manage_setup_prepares_the_database(mock_mongo, monkeypatch):
+    monkeypatch.setattr(server, "SEED_SAMPLE_EVENTS", True)
+    asyncio.run(manage.run("setup"))
+    assert asyncio.run(mock_mongo.events.count_documents({})) > 0
+    assert asyncio.run(mock_mongo.migrations.find_one({"_id": "title_search"})) is not None
+    indexes = asyncio.run(mock_mongo.reservations.index_information())
+    assert len(indexes) > 1
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def feeds(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_QUEUE_SIZE", 3)
+    monkeypatch.setattr(server, "LIVE_HEARTBEAT", 0.01)
+    feeds = {name: server.ChangeFeed(name) for name in server.LIVE_COLLECTIONS}
+    monkeypatch.setattr(server, "change_feeds", feeds)
+    return feeds
+
+
+def change(n, operation="insert"):
+    return {"_id": {"_data": f"token-{n}"}, "operationType": operation,
+            "fullDocument": {"_id": object(), "id": f"r{n}", "name": "Test"}}
+
+
+def payload(n, operation="insert"):
+    return (f"token-{n}", b'{"operation":"%s","document":{"id":"r%d","name":"Test"}}' % (operation.encode(), n))
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_changes_fan_out_to_every_subscriber(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+
+    async def run():
+        feed = server.ChangeFeed("reservations")
+        first, second = feed.subscribe(), feed.subscribe()
+        feed.publish(change(1))
+        feed.unsubscribe(second)
+        feed.publish(change(2, "update"))
+        return drain(first), drain(second)
+
+    first, second = asyncio.run(run())
+    assert first == [payload(1), payload(2, "update")]
+    assert second == [payload(1)]
+
+
+def test_reconnect_replays_what_was_missed(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+
+    async def run():
+        feed = server.ChangeFeed("reservations")
+        for n in range(3):
+            feed.publish(change(n))
+        return (drain(feed.subscribe("token-0")), drain(feed.subscribe("token-2")),
+                drain(feed.subscribe("unknown")))
+
+    missed, current, unknown = asyncio.run(run())
+    assert missed == [payload(1), payload(2)]
+    assert current == []
+    # Fell out of the replay buffer, the client reloads everything
+    assert unknown == [(None, b'{"operation":"resync"}')]
+
+
+def test_slow_subscriber_is_cut_off_without_losing_changes(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+
+    async def run():
+        feed = server.ChangeFeed("reservations")
+        slow, fast = feed.subscribe(), feed.subscribe()
+        feed.publish(change(0))
+        delivered = [slow.get_nowait()]
+        for n in range(1, 5):
+            feed.publish(change(n))
+            drain(fast)
+        pending = drain(slow)
+        # The client reconnects with the id of the last change it actually got
+        last_event_id = delivered[-1][0]
+        return feed, slow, pending, drain(feed.subscribe(last_event_id))
+
+    feed, slow, pending, replayed = asyncio.run(run())
+    assert feed.dropped == 1
+    assert slow not in feed.subscribers
+    # Only the end-of-stream marker is left, nothing past the last delivered change
+    assert pending == [None]
+    assert replayed == [payload(n) for n in range(1, 5)]
+
+
+def test_event_changes_invalidate_the_events_cache(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+    server.events_cache.set("events", b"cached")
+    feed = server.ChangeFeed("events", server.invalidate_events_cache)
+    feed.publish(change(1))
+    assert server.events_cache.get("events") is None
+
+
+class StandaloneCollection:
+    def watch(self, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+class StandaloneDatabase:
+    def __getitem__(self, name):
+        return StandaloneCollection()
+
+
+def test_standalone_mongod_disables_the_feed(api, monkeypatch, feeds, staff):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", True)
+    monkeypatch.setattr(server, "db", StandaloneDatabase())
+
+    async def run():
+        feed = feeds["reservations"]
+        queue = feed.subscribe()
+        await asyncio.wait_for(feed.task, 1)
+        return feed, queue
+
+    feed, queue = asyncio.run(run())
+    assert feed.unsupported and feed.task is None
+    assert feed.subscribers == set()
+    assert drain(queue) == [None]
+    # No further retries, and new clients fall back to polling
+    feed.start()
+    assert feed.task is None
+    response = api("GET", "/api/live/reservations", headers=staff)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Mises à jour en direct indisponibles"
+
+
+def test_live_route_status_codes(api, monkeypatch):
+    assert api("GET", "/api/live/leases").status_code == 404
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+    assert api("GET", "/api/live/events").status_code == 503
+
+
+def test_private_feeds_need_the_staff_token(api, monkeypatch, feeds, staff):
+    # Disabled updates answer 503 once past the check, so no stream is opened
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+    for collection in ("reservations", "contact_messages"):
+        assert api("GET", f"/api/live/{collection}").status_code == 403
+        assert api("GET", f"/api/live/{collection}", headers={"X-Staff-Token": "guess"}).status_code == 403
+        assert api("GET", f"/api/live/{collection}", headers=staff).status_code == 503
+    assert all(not feed.subscribers for feed in feeds.values())
+
+
+class ClientRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_stream_writes_server_sent_events(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_UPDATES_ENABLED", False)
+
+    async def run():
+        feed = server.ChangeFeed("reservations")
+        queue, request = feed.subscribe(), ClientRequest()
+        stream = server.stream_changes(request, feed, queue)
+        chunks = [await stream.__anext__()]
+        feed.publish(change(1))
+        chunks.append(await stream.__anext__())
+        # Nothing queued, a heartbeat keeps proxies from closing the connection
+        chunks.append(await stream.__anext__())
+        request.disconnected = True
+        chunks += [chunk async for chunk in stream]
+        return feed, chunks
+
+    feed, chunks = asyncio.run(run())
+    assert chunks == [
+        b"retry: 3000\n\n",
+        b"id: token-1\ndata: " + payload(1)[1] + b"\n\n",
+        b": ping\n\n",
+    ]
+    assert feed.subscribers == set()
@@ -0,0 +1,122 @@
+import asyncio
+import email
+import email.policy
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import server
+
+
+def test_enqueue_without_smtp_writes_nothing(db, monkeypatch):
+    monkeypatch.setattr(server, "SMTP_HOST", "")
+    asyncio.run(server.mail_queue.enqueue("client@example.com", "Confirmation", "Merci"))
+    assert asyncio.run(db.mail_outbox.count_documents({})) == 0
+
+
+def test_enqueue_with_smtp_persists_to_the_outbox(db, monkeypatch):
+    monkeypatch.setattr(server, "SMTP_HOST", "smtp.example.com")
+    asyncio.run(server.mail_queue.enqueue("client@example.com", "Confirmation", "Merci"))
+    mail = asyncio.run(db.mail_outbox.find_one({}))
+    assert mail["status"] == "pending"
+    assert mail["to"] == "client@example.com"
+
+
+class BrokenOutbox:
+    async def insert_one(self, document):
+        raise RuntimeError("outbox unavailable")
+
+
+class BrokenOutboxDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.mail_outbox = BrokenOutbox()
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    def __getitem__(self, name):
+        return self.database[name]
+
+
+def test_outbox_failure_keeps_the_booking(db, api, monkeypatch):
+    monkeypatch.setattr(server, "SMTP_HOST", "smtp.example.com")
+    monkeypatch.setattr(server, "db", BrokenOutboxDatabase(db))
+    response = api("POST", "/api/reservations", headers={"Idempotency-Key": "outbox-down"}, json={
+        "name": "Test", "email": "test@example.com", "phone": "0600000000",
+        "date": "2026-06-18", "time": "20:00", "party_size": 2,
+    })
+    assert response.status_code == 200, response.text
+    assert asyncio.run(db.reservations.count_documents({})) == 1
+    assert asyncio.run(db.idempotency_keys.find_one({"_id": "/api/reservations:outbox-down"}))["status"] == "completed"
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, smtp_server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(server, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(server, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(server, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(server, "SMTP_USER", "")
+    yield inbox
+    controller.stop()
+
+
+def run_queue(db, done, **mail):
+    """Runs the queue until done(outbox row) holds"""
+    async def run():
+        queue = server.MailQueue()
+        queue.start()
+        try:
+            await queue.enqueue(**mail)
+            for _ in range(200):
+                row = await db.mail_outbox.find_one({"to": mail["to"]})
+                if done(row):
+                    return queue, row
+                await asyncio.sleep(0.01)
+            raise AssertionError(f"mail stayed {row}")
+        finally:
+            await queue.stop()
+    return asyncio.run(run())
+
+
+def test_queued_mail_is_delivered_and_marked_sent(db, smtp_server):
+    queue, row = run_queue(db, lambda row: row["status"] == "sent",
+                           to="client@example.com", subject="Confirmation", body="Merci de votre visite")
+    assert queue.sent == 1
+    assert row["attempts"] == 1 and row["sent_at"]
+    assert server.as_utc(row["expires_at"]) > server.utcnow()
+    [envelope] = smtp_server.messages
+    assert envelope.rcpt_tos == ["client@example.com"]
+    message = email.message_from_bytes(envelope.content, policy=email.policy.default)
+    assert message["Subject"] == "Confirmation"
+    assert message.get_body(("plain",)).get_content().strip() == "Merci de votre visite"
+
+
+def test_unreachable_smtp_backs_off(db, monkeypatch):
+    monkeypatch.setattr(server, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(server, "SMTP_PORT", free_port())
+    monkeypatch.setattr(server, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(server, "SMTP_TIMEOUT", 1)
+    queue, row = run_queue(db, lambda row: row["attempts"], to="client@example.com", subject="Confirmation", body="Merci")
+    assert queue.sent == 0
+    assert row["status"] == "pending" and row["last_error"]
+    assert server.as_utc(row["next_attempt_at"]) > server.utcnow()
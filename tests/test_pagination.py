@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+CREATED_AT = datetime(2026, 1, 15, 18, 0)
+
+
+@pytest.fixture
+def tied_reservations(db):
+    # Seven reservations share one created_at, as a bulk insert or a clock tick can produce
+    asyncio.run(db.reservations.insert_many([{
+        "id": f"r{n}",
+        "name": "Test",
+        "date": "2026-02-%02d" % (n + 1),
+        "time": "20:00",
+        "party_size": 2,
+        "status": "cancelled" if n == 3 else "confirmed",
+        "created_at": CREATED_AT if n < 7 else CREATED_AT + timedelta(minutes=n),
+    } for n in range(9)]))
+
+
+def all_pages(api, path, key, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        response = api("GET", path, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        ids += [item["id"] for item in page[key]]
+        pages += 1
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return ids, pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 9, 20])
+def test_ties_on_created_at_are_paged_without_gaps_or_repeats(api, tied_reservations, limit):
+    ids, pages = all_pages(api, "/api/reservations", "reservations", limit=limit)
+    # Newest first, ties broken by id in the same direction
+    assert ids == ["r8", "r7"] + [f"r{n}" for n in reversed(range(7))]
+    assert pages == -(-9 // limit)
+
+
+def test_last_full_page_has_no_cursor(api, tied_reservations):
+    page = api("GET", "/api/reservations", params={"limit": 9}).json()
+    assert len(page["reservations"]) == 9
+    assert page.get("next_cursor") is None
+
+
+def test_filters_apply_across_pages(api, tied_reservations):
+    ids, _ = all_pages(api, "/api/reservations", "reservations", limit=2, status="confirmed",
+                       date_from="2026-02-02", date_to="2026-02-08")
+    assert ids == ["r7", "r6", "r5", "r4", "r2", "r1"]
+
+
+def test_events_page_oldest_first(api, db):
+    asyncio.run(db.events.insert_many([
+        {"id": f"e{n}", "title": f"Event {n}", "created_at": CREATED_AT} for n in range(5)
+    ]))
+    ids, _ = all_pages(api, "/api/events", "events", limit=2)
+    assert ids == [f"e{n}" for n in range(5)]
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "!!!", "WyJ4Il0", "eyJhIjogMX0"])
+def test_bad_cursor_is_a_422(api, cursor):
+    for path in ("/api/reservations", "/api/events"):
+        response = api("GET", path, params={"cursor": cursor})
+        assert response.status_code == 422
+        assert response.json()["detail"] == "Curseur de pagination invalide"
+
+
+def test_limit_out_of_range_is_a_422(api):
+    assert api("GET", "/api/reservations", params={"limit": 0}).status_code == 422
+    assert api("GET", "/api/events", params={"limit": 501}).status_code == 422
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+import orjson
+import pytest
+
+
+@pytest.fixture
+def events(db):
+    asyncio.run(db.events.insert_many([{
+        "id": f"e{n}",
+        "title": f"Soirée {n}",
+        "description": "Une longue description " * 20,
+        "date": "2026-06-%02d" % (n + 1),
+        "time": "20:00",
+        "category": "Concert",
+        "title_search": f"soiree {n}",
+        "start_at": datetime(2030, 6, n + 1, 18, 0),
+        "created_at": datetime(2026, 1, 15, 18, n),
+    } for n in range(3)]))
+
+
+def test_events_projection_returns_only_the_requested_fields(api, events):
+    response = api("GET", "/api/events", params={"fields": "title,date"})
+    assert response.status_code == 200
+    assert response.json()["events"][0] == {
+        "id": "e0", "title": "Soirée 0", "date": "2026-06-01", "created_at": "2026-01-15T18:00:00Z",
+    }
+
+
+def test_full_events_hide_internal_fields(api, events):
+    event = api("GET", "/api/events").json()["events"][0]
+    assert "title_search" not in event and "_id" not in event
+    assert event["start_at"] == "2030-06-01T18:00:00Z"
+
+
+def test_projection_keeps_pages_consistent(api, events):
+    first = api("GET", "/api/events", params={"fields": "title", "limit": 2}).json()
+    second = api("GET", "/api/events", params={"fields": "title", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [event["id"] for event in first["events"] + second["events"]] == ["e0", "e1", "e2"]
+
+
+def test_upcoming_and_reservations_accept_projections(api, db, events):
+    asyncio.run(db.reservations.insert_one({
+        "id": "r1", "name": "Test", "email": "test@example.com", "phone": "0600000000", "date": "2026-06-01",
+        "time": "20:00", "party_size": 2, "status": "confirmed", "created_at": datetime(2026, 1, 15, 18, 0),
+    }))
+    upcoming = api("GET", "/api/events/upcoming", params={"fields": "title"}).json()["events"]
+    assert [set(event) for event in upcoming] == [{"id", "title", "created_at"}] * 3
+    reservations = api("GET", "/api/reservations", params={"fields": "name,party_size"}).json()["reservations"]
+    assert reservations == [{"id": "r1", "name": "Test", "party_size": 2, "created_at": "2026-01-15T18:00:00Z"}]
+
+
+def test_unknown_fields_are_rejected(api):
+    response = api("GET", "/api/events", params={"fields": "title,title_search"})
+    assert response.status_code == 400
+    assert "title_search" in response.json()["detail"]
+
+
+def test_responses_are_serialized_with_orjson(api, events):
+    response = api("GET", "/api/events/upcoming")
+    assert response.headers["content-type"] == "application/json"
+    # orjson writes compact, non-ASCII-escaped JSON
+    assert b"Soir\xc3\xa9e 0" in response.content and b'", "' not in response.content
+    assert orjson.loads(response.content)["events"][0]["id"] == "e0"
@@ -0,0 +1,47 @@
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "rate_limiter", server.RateLimiter(
+        server.parse_rate_limits("/api/newsletter/subscribe:ip:10/60"), server.MemoryBucketStore(4, 1000)
+    ))
+
+
+def subscribe(api, n, headers=None):
+    return api("POST", "/api/newsletter/subscribe", headers=headers or {}, json={"email": f"test{n}@example.com"})
+
+
+def test_rejections_carry_cors_headers(api):
+    statuses = [subscribe(api, n, {"Origin": "https://lenvers.example"}) for n in range(11)]
+    assert [response.status_code for response in statuses[:10]] == [200] * 10
+    assert statuses[10].status_code == 429
+    assert statuses[10].headers["access-control-allow-origin"] == "*"
+    assert "retry-after" in statuses[10].headers
+
+
+def test_spoofed_forwarded_for_does_not_reset_the_bucket(api):
+    statuses = [subscribe(api, n, {"X-Forwarded-For": f"203.0.113.{n}"}).status_code for n in range(20)]
+    assert statuses.count(200) == 10
+    assert statuses.count(429) == 10
+
+
+def test_rejections_are_counted_under_their_route(api, monkeypatch):
+    monkeypatch.setattr(server, "metrics", server.Metrics())
+    for n in range(12):
+        subscribe(api, n)
+    assert server.metrics.requests[("POST", "/api/newsletter/subscribe", 429)] == 2
+    assert not any(route == "unmatched" for _, route, _ in server.metrics.requests)
+
+
+def test_bulk_imports_are_rate_limited_by_default(api, monkeypatch):
+    monkeypatch.setattr(server, "rate_limiter", server.RateLimiter(
+        server.parse_rate_limits(server.RATE_LIMITS), server.MemoryBucketStore(4, 1000)
+    ))
+    statuses = [
+        api("POST", "/api/newsletter/bulk", json=[{"email": f"bulk{n}@example.com"}]).status_code for n in range(3)
+    ]
+    assert statuses == [200, 200, 429]
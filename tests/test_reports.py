@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+
+pytestmark = pytest.mark.usefixtures("far_venue")
+
+
+def rollups(db):
+    return {rollup["_id"]: {key: value for key, value in rollup.items() if key != "_id"}
+            for rollup in asyncio.run(db.rollups.find().to_list(None))}
+
+
+def test_incremental_rollups_match_a_rebuild(db, api):
+    for n in range(3):
+        assert api("POST", "/api/reservations", json={
+            "name": "Test", "email": f"client{n}@example.com", "phone": "0600000000",
+            "date": "2026-06-%02d" % (n % 2 + 1), "time": ("20:00", "20:30", "20:00")[n], "party_size": n + 1,
+        }).status_code == 200
+    for n in range(3):
+        assert api("POST", "/api/newsletter/subscribe", json={"email": f"abonne{n}@example.com"}).status_code == 200
+    # An existing address counts once
+    assert api("POST", "/api/newsletter/subscribe", json={"email": "abonne0@example.com"}).status_code == 200
+    body = "\n".join(json.dumps({"email": f"import{n}@example.com"}) for n in range(4) for _ in range(2))
+    assert api("POST", "/api/newsletter/bulk", content=body + '\n{"email": "abonne1@example.com"}',
+               headers={"content-type": "application/x-ndjson"}).status_code == 200
+    for n in range(2):
+        assert api("POST", "/api/contact", json={
+            "name": "Test", "email": "test@example.com", "subject": "Question", "message": f"Message {n}",
+        }).status_code == 200
+
+    incremental = rollups(db)
+    assert sum(rollup.get("subscribers", 0) for rollup in incremental.values()) == 7
+    asyncio.run(server.rebuild_rollups())
+    assert rollups(db) == incremental
+
+
+def test_subscriptions_count_in_the_week_of_their_timestamp(db):
+    asyncio.run(server.record_subscribers([
+        {"subscribed_at": "2026-01-04T23:59:59+14:00"},
+        {"subscribed_at": "2026-01-05T00:00:01+14:00"},
+        {"subscribed_at": "2026-01-05T08:00:00"},
+    ]))
+    assert rollups(db) == {"newsletter:2026-W01": {"subscribers": 1}, "newsletter:2026-W02": {"subscribers": 2}}
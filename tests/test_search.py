@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def legacy_events(db, monkeypatch):
+    monkeypatch.setattr(server, "SEED_SAMPLE_EVENTS", False)
+    # Created before autocomplete existed, without title_search
+    asyncio.run(db.events.insert_many([
+        {"id": "legacy-1", "title": "Soirée Électro", "description": "DJ set", "date": "2026-03-01", "time": "21:00",
+         "category": "Soirée"},
+        {"id": "legacy-2", "title": "Exposition", "description": "Vernissage", "date": "2026-03-02", "time": "18:30",
+         "category": "Exposition"},
+    ]))
+
+
+def test_setup_backfills_titles_for_autocomplete(db, api, legacy_events):
+    assert api("GET", "/api/events/autocomplete", params={"q": "soiree"}).json() == []
+    asyncio.run(server.setup_database())
+    response = api("GET", "/api/events/autocomplete", params={"q": "soiree"})
+    assert response.status_code == 200
+    assert response.json() == [{"id": "legacy-1", "title": "Soirée Électro"}]
+
+
+def test_backfill_runs_once(db, legacy_events):
+    asyncio.run(server.setup_database())
+    asyncio.run(server.setup_database())
+    assert asyncio.run(db.migrations.find_one({"_id": "title_search"}))["events"] == 2
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Stands in for $text, which mongomock lacks: every document of the collection matches"""
+    calls = []
+
+    async def text_search(collection, query, filters, offset, limit, projection):
+        calls.append({"collection": collection.name, "query": query, "filters": filters,
+                      "offset": offset, "limit": limit})
+        docs = await collection.find(filters, projection).sort("id", 1).skip(offset).to_list(limit + 1)
+        hits = [{**doc, "score": 1.5} for doc in docs[:limit]]
+        return hits, offset + limit if len(docs) > limit else None
+    monkeypatch.setattr(server, "text_search", text_search)
+    return calls
+
+
+def test_event_search_route(db, api, legacy_events, searches):
+    response = api("GET", "/api/events/search", params={"q": "soirée", "limit": 1, "category": "Soirée"})
+    assert response.status_code == 200
+    assert response.json() == {"events": [
+        {"id": "legacy-1", "title": "Soirée Électro", "description": "DJ set", "date": "2026-03-01", "time": "21:00",
+         "category": "Soirée", "score": 1.5},
+    ]}
+    assert searches == [{"collection": "events", "query": "soirée", "filters": {"category": "Soirée"},
+                         "offset": 0, "limit": 1}]
+    page = api("GET", "/api/events/search", params={"q": "soirée", "limit": 1}).json()
+    assert page["next_offset"] == 1
+
+
+def test_contact_search_needs_the_staff_token(db, api, searches, staff):
+    asyncio.run(db.contact_messages.insert_many([
+        {"id": f"m{n}", "name": "Test", "email": "test@example.com", "subject": "Groupe", "message": "Bonjour",
+         "status": "new", "sent_at": "2026-01-0%dT10:00:00" % (n + 1)} for n in range(3)
+    ]))
+    assert api("GET", "/api/contact/search", params={"q": "groupe"}).status_code == 403
+    assert searches == []
+    response = api("GET", "/api/contact/search", params={"q": "groupe", "limit": 2, "status": "new"}, headers=staff)
+    assert response.status_code == 200
+    body = response.json()
+    assert [message["id"] for message in body["messages"]] == ["m0", "m1"]
+    assert body["messages"][0]["score"] == 1.5 and "_id" not in body["messages"][0]
+    assert body["next_offset"] == 2
+    assert searches[0]["filters"] == {"status": "new"}
+
+
+def test_search_query_is_validated(api, searches, staff):
+    assert api("GET", "/api/events/search", params={"q": "a"}).status_code == 422
+    assert api("GET", "/api/contact/search", params={"q": "a"}, headers=staff).status_code == 422
+    assert searches == []
+
+
+def test_search_beyond_the_result_cap_is_a_400(db, api):
+    response = api("GET", "/api/events/search", params={"q": "soirée", "offset": server.SEARCH_MAX_RESULTS})
+    assert response.status_code == 400
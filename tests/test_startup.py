@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import server
+
+
+@pytest.fixture
+def unreachable_mongo(monkeypatch):
+    monkeypatch.setattr(server, "MONGO_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setattr(server, "MONGO_SERVER_SELECTION_TIMEOUT_MS", 200)
+    monkeypatch.setattr(server, "MONGO_MIN_POOL_SIZE", 0)
+
+
+def start_and_check_health():
+    async def run():
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return (await client.get("/api/health")).status_code
+    return asyncio.run(run())
+
+
+def test_fail_fast_aborts_startup(unreachable_mongo, monkeypatch):
+    monkeypatch.setattr(server, "MONGO_FAIL_FAST", True)
+    with pytest.raises(ServerSelectionTimeoutError):
+        start_and_check_health()
+
+
+def test_without_fail_fast_the_api_starts_and_skips_setup(unreachable_mongo, monkeypatch):
+    monkeypatch.setattr(server, "MONGO_FAIL_FAST", False)
+
+    async def setup_database():
+        raise AssertionError("setup must be skipped while Mongo is unreachable")
+    monkeypatch.setattr(server, "setup_database", setup_database)
+    assert start_and_check_health() == 200
+
+
+def test_a_failing_shutdown_step_does_not_skip_the_others(monkeypatch, caplog):
+    stopped = []
+
+    def stop(name, error=None):
+        async def run():
+            stopped.append(name)
+            if error:
+                raise error
+        return run
+    monkeypatch.setattr(server.image_cache, "stop", stop("images"))
+    monkeypatch.setattr(server.archiver, "stop", stop("archiver"))
+    monkeypatch.setattr(server.write_behind, "stop", stop("write_behind", RuntimeError("flush failed")))
+    monkeypatch.setattr(server.mail_queue, "stop", stop("mail", RuntimeError("outbox gone")))
+    monkeypatch.setattr(server, "change_feeds", {"events": SimpleNamespace(stop=stop("events"))})
+
+    asyncio.run(server.shutdown_event())
+    assert stopped == ["images", "archiver", "write_behind", "mail", "events"]
+    assert "Stopping the write-behind buffer failed: flush failed" in caplog.text
+    assert "Stopping the mail queue failed: outbox gone" in caplog.text
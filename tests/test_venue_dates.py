@@ -0,0 +1,15 @@
+from datetime import datetime, timedelta
+
+
+def test_availability_starts_on_the_venue_day(api, far_venue):
+    response = api("GET", "/api/availability")
+    assert response.status_code == 200
+    assert response.json()["days"][0]["date"] == datetime.now(far_venue).date().isoformat()
+
+
+def test_reservation_report_ends_on_the_venue_day(api, far_venue):
+    response = api("GET", "/api/reports/reservations")
+    assert response.status_code == 200, response.text
+    today = datetime.now(far_venue).date()
+    assert response.json()["to"] == today.isoformat()
+    assert response.json()["from"] == (today - timedelta(days=29)).isoformat()
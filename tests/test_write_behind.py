@@ -0,0 +1,111 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+import subprocess
+import sys
+
+import orjson
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def write_behind_enabled(db, monkeypatch):
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(server, "WRITE_BEHIND_BATCH_SIZE", 2)
+    monkeypatch.setattr(server, "WRITE_BEHIND_INTERVAL", 3600)
+    # What makes replays idempotent in production
+    asyncio.run(db.contact_messages.create_index("id", unique=True))
+
+
+def message(n):
+    return {"id": f"msg-{n}", "name": "Test", "email": "test@example.com", "subject": "Question",
+            "message": f"Message {n}", "status": "new", "sent_at": datetime(2026, 1, 15, 18, 0, tzinfo=timezone.utc)}
+
+
+def spooled(entries):
+    return b"".join(orjson.dumps({"collection": "contact_messages", "kind": "insert", "document": entry}) + b"\n"
+                    for entry in entries)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def stored_ids(db):
+    return sorted(doc["id"] for doc in asyncio.run(db.contact_messages.find().to_list(None)))
+
+
+def test_flush_killed_mid_batch_is_replayed_exactly_once(db, tmp_path):
+    spool = tmp_path / "spool"
+
+    async def crash():
+        buffer = server.WriteBehindBuffer(str(spool))
+        await buffer.start()
+        for n in range(5):
+            assert buffer.add("contact_messages", "insert", message(n))
+        write, calls = buffer._write, []
+
+        async def dies_on_second_batch(entries):
+            calls.append(entries)
+            if len(calls) == 2:
+                raise ConnectionError("killed")
+            await write(entries)
+        buffer._write = dies_on_second_batch
+        with pytest.raises(ConnectionError):
+            await buffer.flush()
+        # The process dies here: no stop(), no further flush
+        buffer.task.cancel()
+        buffer.spool.close()
+        return buffer.flushing_path
+
+    flushing = asyncio.run(crash())
+    assert flushing.exists()
+    assert stored_ids(db) == ["msg-0", "msg-1"]
+
+    async def restart():
+        buffer = server.WriteBehindBuffer(str(spool))
+        await buffer.start()
+        await buffer.stop()
+        return buffer
+
+    restarted = asyncio.run(restart())
+    assert not flushing.exists()
+    assert stored_ids(db) == [f"msg-{n}" for n in range(5)]
+    # Replayed from the JSON spool, sent_at is a datetime again
+    assert {doc["sent_at"] for doc in asyncio.run(db.contact_messages.find().to_list(None))} == {
+        datetime(2026, 1, 15, 18, 0)
+    }
+    assert restarted.flushed == 5 and restarted.failed == 0
+    # Only the three messages the crash lost are new in the reports
+    rollup = asyncio.run(db.rollups.find_one({"_id": "contact_messages:status"}))
+    assert rollup["counts"]["new"] == 5
+
+    asyncio.run(restart())
+    assert stored_ids(db) == [f"msg-{n}" for n in range(5)]
+
+
+def test_spools_of_live_workers_are_left_alone(db, tmp_path):
+    spool = tmp_path / "spool"
+    live = tmp_path / f"spool.{os.getppid()}"
+    live.write_bytes(spooled([message("live")]))
+    dead = dead_pid()
+    (tmp_path / f"spool.{dead}").write_bytes(spooled([message("dead")]))
+    (tmp_path / f"spool.{dead}.flushing").write_bytes(spooled([message("dead-flushing")]))
+    unrelated = tmp_path / "spool.backup"
+    unrelated.write_bytes(spooled([message("unrelated")]))
+
+    async def run():
+        buffer = server.WriteBehindBuffer(str(spool))
+        await buffer.start()
+        await buffer.stop()
+    asyncio.run(run())
+
+    assert stored_ids(db) == ["msg-dead", "msg-dead-flushing"]
+    assert live.read_bytes() == spooled([message("live")])
+    assert unrelated.exists()
+    assert not (tmp_path / f"spool.{dead}").exists()
+    assert not (tmp_path / f"spool.{dead}.flushing").exists()